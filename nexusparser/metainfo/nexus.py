@@ -520,6 +520,12 @@ for application_section in APPLICATIONS.section_definitions:  # pylint: disable=
             name=application_section.name.replace('NX', 'nx_application_'))
         NEXUS_SECTION.sub_sections.append(sub_section)
 
+# Set by the parser if it stopped early because of its resource limits
+NEXUS_SECTION.quantities.append(Quantity(
+    name='nx_truncated', type=str,
+    description='The reasons why parsing was truncated, e.g. the limit of visited objects, '
+                'read bytes or time. Not set if the whole file was parsed.'))
+
 APPLICATIONS.section_definitions.append(NEXUS_SECTION)
 
 ENTRY_ARCHIVE_NEXUS_SUB_SECTION = \
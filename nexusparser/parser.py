@@ -19,7 +19,7 @@
 # limitations under the License.
 #
 
-from typing import Iterable, Union
+from typing import IO, Iterable, Union
 import os
 import pathlib
 import numpy as np
@@ -106,7 +106,7 @@ def helper_nexus_populate(nxdl_attribute, act_section, val, logger):
 
 def nexus_populate_helper(params):
     """helper for nexus_populate"""
-    (path_level, nxdl_path, act_section, logstr, val, loglev, nxdef, hdf_node) = params
+    (path_level, nxdl_path, act_section, logstr, val, loglev, nxdef, hdf_node, read_value) = params
     if path_level < len(nxdl_path):
         nxdl_attribute = nxdl_path[path_level]
         if isinstance(nxdl_attribute, str):
@@ -132,6 +132,8 @@ def nexus_populate_helper(params):
             except (AttributeError, TypeError, ValueError) as exc:
                 logstr += ("Problem with storage!!!\n" + str(exc)) + '\n'
                 loglev = 'error'
+    elif not read_value:
+        logstr += 'Value not read (parsing truncated)\n'
     else:
         try:
             data_field = get_value(hdf_node)
@@ -179,12 +181,20 @@ class NexusParser(Parser):
     """NesusParser doc
 
 """
-    def __init__(self):
+    def __init__(self, include=None, exclude=None, limits=None, index=False):
         super().__init__()
         self.name = "parsers/nexus"
         self.archive = None
         self.nxroot = None
         self.domain = 'ems'
+        # glob patterns of HDF5 or NX class paths restricting the parsed subtrees
+        self.include = include
+        self.exclude = exclude
+        # resource guards, see HandleNexus: max_nodes, max_bytes, max_seconds, by default
+        # from the environment (NEXUS_PARSER_MAX_NODES, ...) as NOMAD passes no arguments
+        self.limits = {**read_nexus.get_env_limits(), **(limits or {})}
+        # structure index of the parsed files: False, True (sidecar) or a cache directory
+        self.index = index
 
     def is_mainfile(  # pylint: disable=too-many-arguments
             self, filename: str, mime: str, buffer: bytes, decoded_buffer: str,
@@ -230,7 +240,7 @@ class NexusParser(Parser):
                                                     nxdl_node, act_section)[1]
                 path_level += 1
             helper_params = (path_level, params["nxdl_path"], act_section, logstr, params["val"],
-                             loglev, params["nxdef"], hdf_node)
+                             loglev, params["nxdef"], hdf_node, params.get("read_value", True))
             (logstr, loglev) = nexus_populate_helper(helper_params)
         else:
             logstr += ('NOT IN SCHEMA - skipped') + '\n'
@@ -244,16 +254,19 @@ class NexusParser(Parser):
         else:
             params["logger"].critical('Parsing', nexusparser=logstr + 'NOT HANDLED\n')
 
-    def parse(self, mainfile: str, archive: EntryArchive, logger=None, child_archives=None):
+    def parse(self, mainfile: Union[str, bytes, IO[bytes]], archive: EntryArchive, logger=None,
+              child_archives=None):
         self.archive = archive
         self.archive.m_create(nexus.Nexus)  # type: ignore[attr-defined] # pylint: disable=no-member
         self.nxroot = self.archive.nexus
 
-        extension = pathlib.Path(mainfile).suffix
+        # mainfile can also be the content of a NeXus file (bytes or a file-like object)
+        file_name = str(mainfile) if read_nexus.is_file_name(mainfile) else ''
+        extension = pathlib.Path(file_name).suffix
         if extension in (".yaml", ".yml"):
-            base_dir = os.path.dirname(mainfile)
+            base_dir = os.path.dirname(file_name)
             from nexusparser.tools.dataconverter.convert import convert, parse_params_file
-            with open(mainfile) as file:
+            with open(file_name) as file:
                 conv_params = parse_params_file(file)
 
                 def check_path(path: str):
@@ -272,8 +285,12 @@ class NexusParser(Parser):
                 convert(**conv_params)
                 mainfile = conv_params["output"]
 
-        nexus_helper = read_nexus.HandleNexus(logger, [mainfile])
+        nexus_helper = read_nexus.HandleNexus(logger, [mainfile],
+                                              include=self.include, exclude=self.exclude,
+                                              limits=self.limits, index=self.index)
         nexus_helper.process_nexus_master_file(self.nexus_populate)
+        if nexus_helper.truncated:
+            self.nxroot.nx_truncated = '; '.join(nexus_helper.truncated)
 
         appdef = ""
         for var in dir(archive.nexus):
@@ -0,0 +1,239 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Converts many input sets listed in a manifest on a pool of warm worker processes.
+
+A manifest lists one conversion per row (CSV), list item (YAML) or line (JSON lines), with
+the parameters of the convert routine, for example as JSON lines:
+
+    {"input-file": ["scan_1.h5", "config.json"], "output": "scan_1.nxs"}
+    {"input-file": ["scan_2.h5", "config.json"], "output": "scan_2.nxs", "reader": "mpes"}
+
+In CSV files, several input files are separated by semicolons. The reader, the NXDL, the
+storage policy, fair and the location of the up-to-date manifests (see up_to_date) given on
+the command line apply to all conversions which don't set them. Each worker loads the
+readers and the compiled NXDL plans of the batch once, when it starts, and then converts one
+item after the other. A failing conversion is reported and doesn't stop the batch.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import traceback
+from typing import List
+
+import click
+import yaml
+
+from nexusparser.tools.dataconverter import convert as dataconverter
+from nexusparser.tools.dataconverter import helpers
+from nexusparser.tools.dataconverter import nxdl_plan
+from nexusparser.tools.dataconverter import up_to_date
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stdout))
+
+
+def normalize_item(item: dict) -> dict:
+    """Converts the parameter names of a manifest item as the params file does ("-" to "_")
+    and drops empty values."""
+    item = {key.strip().replace("-", "_"): value for key, value in item.items()
+            if value not in (None, "")}
+    if isinstance(item.get("input_file"), str):
+        item["input_file"] = tuple(file.strip() for file in item["input_file"].split(";")
+                                   if file.strip())
+    elif "input_file" in item:
+        item["input_file"] = tuple(item["input_file"])
+    if isinstance(item.get("fair"), str):
+        item["fair"] = helpers.convert_str_to_bool_safe(item["fair"])
+    return item
+
+
+def read_manifest(file_name: str) -> List[dict]:
+    """Reads the conversions of a manifest file (.csv, .yaml, .yml, .jsonl or .json)."""
+    extension = os.path.splitext(file_name)[1].lower()
+    with open(file_name, "r", newline="") as manifest_file:
+        if extension == ".csv":
+            items = list(csv.DictReader(manifest_file))
+        elif extension in (".yaml", ".yml"):
+            items = yaml.safe_load(manifest_file) or []
+        elif extension in (".jsonl", ".json"):
+            items = [json.loads(line) for line in manifest_file if line.strip()]
+        else:
+            raise ValueError(f"The manifest {file_name} should be a .csv, .yaml or .jsonl file.")
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        raise ValueError(f"The manifest {file_name} should list one mapping per conversion.")
+    return [normalize_item(item) for item in items]
+
+
+def warm_up(conversions: List[tuple]):
+    """Loads the readers and the NXDL plans of the (reader, nxdl) pairs into the process.
+
+    Failures are left to the conversions needing the reader or the NXDL, which report them.
+    """
+    for reader, nxdl in conversions:
+        try:
+            dataconverter.get_reader(reader)
+            nxdl_plan.get_plan(dataconverter.get_nxdl_path(nxdl))
+        except Exception as exception:  # pylint: disable=broad-except
+            logger.debug("Warming up %s with %s failed: %s", reader, nxdl, exception)
+
+
+def convert_item(index: int, item: dict) -> dict:
+    """Runs one conversion and returns its result: the index of the item, its output, the
+    status (done or failed), the time taken and the error of a failed conversion."""
+    result = {"index": index, "output": item.get("output"), "worker": os.getpid()}
+    start = time.perf_counter()
+    try:
+        dataconverter.convert(**item)
+        result["status"] = "done"
+    except Exception as exception:  # pylint: disable=broad-except
+        result["status"] = "failed"
+        result["error"] = f"{type(exception).__name__}: {exception}"
+        result["traceback"] = traceback.format_exc()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def convert_batch(items: List[dict], workers: int = None, report: str = None,
+                  **defaults) -> List[dict]:
+    """Converts all items of a manifest and returns their results, ordered by item.
+
+    Args:
+        items (list): The parameters of the convert routine of each conversion.
+        workers (int): The number of worker processes, by default the number of CPUs.
+            1 converts in this process.
+        report (str): A JSON lines file to write the result of each conversion to, as soon
+            as it is done.
+        defaults: Parameters of the convert routine for the items which don't set them.
+    """
+    items = [{**{key: value for key, value in defaults.items() if value is not None}, **item}
+             for item in items]
+    conversions = sorted({(item.get("reader"), item.get("nxdl")) for item in items},
+                         key=str)
+    workers = min(workers or os.cpu_count() or 1, max(len(items), 1))
+
+    results = []
+    report_file = open(report, "w") if report else None  # pylint: disable=consider-using-with
+    try:
+        def add_result(result):
+            results.append(result)
+            if result["status"] == "failed":
+                logger.error("Conversion %d to %s failed after %.2f s: %s", result["index"],
+                             result["output"], result["seconds"], result["error"])
+            else:
+                logger.info("Conversion %d to %s done in %.2f s.", result["index"],
+                            result["output"], result["seconds"])
+            if report_file is not None:
+                report_file.write(json.dumps(result) + "\n")
+                report_file.flush()
+
+        if workers == 1:
+            warm_up(conversions)
+            for index, item in enumerate(items):
+                add_result(convert_item(index, item))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=warm_up,
+                                     initargs=(conversions,)) as executor:
+                futures = {executor.submit(convert_item, index, item): index
+                           for index, item in enumerate(items)}
+                for future in as_completed(futures):
+                    try:
+                        add_result(future.result())
+                    except Exception as exception:  # pylint: disable=broad-except
+                        # the worker died, e.g. it ran out of memory
+                        add_result({"index": futures[future],
+                                    "output": items[futures[future]].get("output"),
+                                    "status": "failed", "seconds": 0.0,
+                                    "error": f"{type(exception).__name__}: {exception}"})
+    finally:
+        if report_file is not None:
+            report_file.close()
+
+    failed = sum(result["status"] == "failed" for result in results)
+    logger.info("Converted %d of %d items, %d failed.", len(results) - failed, len(results),
+                failed)
+    return sorted(results, key=lambda result: result["index"])
+
+
+@click.command()
+@click.argument('manifest', type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    '--reader',
+    default=None,
+    help='The reader to use for the items which don\'t name one.'
+)
+@click.option(
+    '--nxdl',
+    default=None,
+    help='The name of the NXDL file to use for the items which don\'t name one.'
+)
+@click.option(
+    '--fair',
+    is_flag=True,
+    default=None,
+    help='Let the converter know to be stricter in checking the documentation.'
+)
+@click.option(
+    '--storage-policy',
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help='A .yaml file with rules for the chunking and compression of datasets.'
+)
+@click.option(
+    '--manifest',
+    'manifest_location',
+    type=click.Choice(up_to_date.MANIFEST_LOCATIONS),
+    default=None,
+    help='Skip the items whose outputs are up to date, as recorded in their root attributes '
+         '(attrs) or sidecar files (sidecar).'
+)
+@click.option(
+    '--workers',
+    type=int,
+    default=None,
+    help='The number of worker processes. default: the number of CPUs'
+)
+@click.option(
+    '--report',
+    type=click.Path(dir_okay=False),
+    default=None,
+    help='A JSON lines file to write the time taken and errors of each conversion to.'
+)
+def batch_cli(manifest: str,  # pylint: disable=too-many-arguments
+              reader: str,
+              nxdl: str,
+              fair: bool,
+              storage_policy: str,
+              manifest_location: str,
+              workers: int,
+              report: str):
+    """Converts all input sets listed in a manifest (.csv, .yaml or .jsonl)."""
+    results = convert_batch(read_manifest(manifest), workers, report, reader=reader,
+                            nxdl=nxdl, fair=fair, storage_policy=storage_policy,
+                            manifest=manifest_location)
+    if any(result["status"] == "failed" for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    batch_cli()  # pylint: disable=no-value-for-parameter
@@ -17,20 +17,21 @@
 #
 """This script runs the conversion routine using a selected reader and write out a Nexus file."""
 
-import glob
-import importlib.machinery
-import importlib.util
+import importlib
 import logging
 import os
 import sys
 from typing import List, Tuple, Any
-import xml.etree.ElementTree as ET
 
 import click
 import yaml
 
+from nexusparser.tools.dataconverter.readers import READERS
 from nexusparser.tools.dataconverter.readers.base.reader import BaseReader
 from nexusparser.tools.dataconverter import helpers
+from nexusparser.tools.dataconverter import nxdl_plan
+from nexusparser.tools.dataconverter import storage
+from nexusparser.tools.dataconverter import up_to_date
 from nexusparser.tools.dataconverter.writer import Writer
 from nexusparser.tools.dataconverter.template import Template
 from nexusparser.tools import nexus
@@ -41,27 +42,90 @@ logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
+READER_ENTRY_POINT_GROUP = "nexusparser.dataconverter.readers"
+
+_readers: dict = {}
+_reader_modules: dict = {}
+
+
+def get_reader_entry_points() -> dict:
+    """Returns the readers other packages register under the READER_ENTRY_POINT_GROUP."""
+    try:
+        from importlib import metadata  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Python 3.7
+        return {}
+    if sys.version_info >= (3, 10):
+        group = metadata.entry_points(group=READER_ENTRY_POINT_GROUP)
+    else:
+        group = metadata.entry_points().get(READER_ENTRY_POINT_GROUP, [])
+    return {entry_point.name: entry_point.value for entry_point in group}
+
+
+def get_reader_modules() -> dict:
+    """Returns the module of each registered reader by its name, looked up once per process.
+
+    The readers of this package are listed in readers.READERS, the readers of other packages
+    come from their entry points. A module can name the reader class with "module:Class",
+    otherwise its READER is used.
+    """
+    if not _reader_modules:
+        _reader_modules.update(READERS)
+        _reader_modules.update(get_reader_entry_points())
+    return _reader_modules
+
+
+def get_reader_module(reader_name) -> str:
+    """Returns the module of a registered reader (see get_reader_modules)."""
+    reader_modules = get_reader_modules()
+    if reader_name not in reader_modules:
+        raise ValueError(f"The reader {reader_name} is not registered. "
+                         f"Use one of: {', '.join(sorted(reader_modules))}.")
+    return reader_modules[reader_name]
+
+
 def get_reader(reader_name) -> BaseReader:
-    """Helper function to get the reader object from it's given name"""
-    path_prefix = f"{os.path.dirname(__file__)}{os.sep}" if os.path.dirname(__file__) else ""
-    path = os.path.join(path_prefix, "readers", reader_name, "reader.py")
-    spec = importlib.util.spec_from_file_location("reader.py", path)
-    module = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(module)  # type: ignore[attr-defined]
-    return module.READER  # type: ignore[attr-defined]
+    """Helper function to get the reader object from it's given name
+
+    Only the module of this reader is imported, once per process.
+    """
+    if reader_name in _readers:
+        return _readers[reader_name]
+    module_name, _, attribute = get_reader_module(reader_name).partition(":")
+    module = importlib.import_module(module_name)
+    _readers[reader_name] = getattr(module, attribute or "READER")
+    return _readers[reader_name]
 
 
 def get_names_of_all_readers() -> List[str]:
     """Helper function to populate a list of all available readers"""
-    path_prefix = f"{os.path.dirname(__file__)}{os.sep}" if os.path.dirname(__file__) else ""
-    files = glob.glob(os.path.join(path_prefix, "readers", "*", "reader.py"))
-    all_readers = []
-    for file in files:
-        if f"{os.sep}base{os.sep}" not in file:
-            index_of_readers_folder_name = file.rindex(f"readers{os.sep}") + len(f"readers{os.sep}")
-            index_of_last_path_sep = file.rindex(os.sep)
-            all_readers.append(file[index_of_readers_folder_name:index_of_last_path_sep])
-    return all_readers
+    return sorted(get_reader_modules())
+
+
+def get_nxdl_path(nxdl: str) -> str:
+    """Returns the path of the NXDL file of the given name, from the contributed definitions
+    or the applications."""
+    if nxdl == "NXtest":
+        return os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
+    definitions_path = nexus.get_nexus_definitions_path()
+    nxdl_path = os.path.join(definitions_path, "contributed_definitions", f"{nxdl}.nxdl.xml")
+    if not os.path.exists(nxdl_path):
+        nxdl_path = os.path.join(definitions_path, "applications", f"{nxdl}.nxdl.xml")
+    if not os.path.exists(nxdl_path):
+        raise FileNotFoundError(f"The nxdl file, {nxdl}, was not found.")
+    return nxdl_path
+
+
+def rename_data_entry(data: Template, entry_name: str):
+    """Renames the single entry of the data (and the default entry pointing to it)."""
+    entries = {helpers.get_name_from_data_dict_entry(path.split("/")[1])
+               for path in data.keys() if path.startswith("/ENTRY[")}
+    if len(entries) != 1:
+        raise ValueError(f"Only data of a single entry can be renamed, not of the entries "
+                         f"{', '.join(sorted(entries))}.")
+    old_name = entries.pop()
+    data.rename_entry(old_name, entry_name)
+    if data.get("/@default") == old_name:
+        data["/@default"] = entry_name
 
 
 def convert(input_file: Tuple[str],  # pylint: disable=too-many-arguments
@@ -70,30 +134,46 @@ def convert(input_file: Tuple[str],  # pylint: disable=too-many-arguments
             output: str,
             generate_template: bool = False,
             fair: bool = False,
-            objects: Tuple[Any] = None):
-    """The conversion routine that takes the input parameters and calls the necessary functions."""
+            objects: Tuple[Any] = None,
+            storage_policy: str = None,
+            append: bool = False,
+            entry_name: str = None,
+            manifest: str = None):
+    """The conversion routine that takes the input parameters and calls the necessary functions.
+
+    With append, the entry is added to an existing output file, whose other entries are kept.
+    entry_name renames the entry of the data, e.g. to append several measurements converted
+    with a reader which always fills the same entry.
+    With manifest ("attrs" or "sidecar"), the conversion is skipped if the output is up to date
+    and otherwise recorded in the output's root attributes or a sidecar file (see up_to_date).
+    """
     # Reading in the NXDL and generating a template
-    if nxdl == "NXtest":
-        nxdl_path = os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
-    else:
-        definitions_path = nexus.get_nexus_definitions_path()
-        nxdl_path = os.path.join(definitions_path, "contributed_definitions", f"{nxdl}.nxdl.xml")
-        if not os.path.exists(nxdl_path):
-            nxdl_path = os.path.join(definitions_path, "applications", f"{nxdl}.nxdl.xml")
-        if not os.path.exists(nxdl_path):
-            raise FileNotFoundError(f"The nxdl file, {nxdl}, was not found.")
+    nxdl_path = get_nxdl_path(nxdl)
+    if isinstance(input_file, str):
+        input_file = (input_file,)
 
-    nxdl_root = ET.parse(nxdl_path).getroot()
+    conversion_manifest = None
+    if manifest is not None and not generate_template and objects is None:
+        policy_hash = up_to_date.hash_file(storage_policy) if storage_policy else None
+        params = {"fair": fair, "append": append, "entry_name": entry_name,
+                  "storage_policy": policy_hash}
+        conversion_manifest = up_to_date.make_manifest(
+            input_file, reader, get_reader_module(reader), nxdl,
+            nxdl_plan.get_definition_hash(nxdl_path), params)
+        if up_to_date.is_up_to_date(conversion_manifest, output, manifest, entry_name or ""):
+            logger.info("The output file is up to date: %s", output)
+            return
+        if not append:
+            up_to_date.discard_manifests(output, manifest)
 
-    template = Template()
-    helpers.generate_template_from_nxdl(nxdl_root, template)
+    # the NXDL is only parsed if the plan is compiled or misses nodes
+    plan = nxdl_plan.get_plan(nxdl_path)
+    template = nxdl_plan.get_template(plan)
     if generate_template:
         logger.info(template)
         return
 
     # Setting up all the input data
-    if isinstance(input_file, str):
-        input_file = (input_file,)
     bulletpoint = "\n\u2022 "
     logger.info("Using %s reader to convert the given files: %s ",
                 reader,
@@ -111,7 +191,9 @@ def convert(input_file: Tuple[str],  # pylint: disable=too-many-arguments
         data = data_reader().read(template=Template(template),  # type: ignore[operator]
                                   file_paths=input_file)
 
-    helpers.validate_data_dict(template, data, nxdl_root)
+    helpers.validate_data_dict(template, data, None, plan)
+    if plan.get("modified"):  # nodes of base classes have been looked up
+        nxdl_plan.save_plan(plan)
 
     if fair and data.undocumented.keys():
         logger.warning("There are undocumented paths in the template. This is not acceptable!")
@@ -122,8 +204,18 @@ def convert(input_file: Tuple[str],  # pylint: disable=too-many-arguments
             continue
         logger.warning("The path, %s, is being written but has no documentation.", path)
 
+    if entry_name is not None:
+        rename_data_entry(data, entry_name)
+
     # Writing the data to output file
-    Writer(data=data, nxdl_path=nxdl_path, output_path=output).write()
+    policy = storage.load_storage_policy(storage_policy, reader) if storage_policy else None
+    Writer(data=data, nxdl_path=nxdl_path, output_path=output, storage_policy=policy,
+           append=append, plan=plan).write()
+    if plan.get("modified"):  # the writer has looked up groups of the data
+        nxdl_plan.save_plan(plan)
+    if conversion_manifest is not None:
+        up_to_date.record_manifest(conversion_manifest, output, manifest, entry_name or "",
+                                   append)
 
     logger.info("The output file generated: %s", output)
 
@@ -178,13 +270,41 @@ def parse_params_file(params_file):
     default=None,
     help='Allows to pass a .yaml file with all the parameters the converter supports.'
 )
-def convert_cli(input_file: Tuple[str],
+@click.option(
+    '--storage-policy',
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help='A .yaml file with rules for the chunking and compression of datasets.'
+)
+@click.option(
+    '--append',
+    is_flag=True,
+    default=False,
+    help='Add the entry to an existing output file instead of overwriting it.'
+)
+@click.option(
+    '--entry-name',
+    default=None,
+    help='The name to give the entry of the output, e.g. when appending to a file.'
+)
+@click.option(
+    '--manifest',
+    type=click.Choice(up_to_date.MANIFEST_LOCATIONS),
+    default=None,
+    help='Skip the conversion if the output is up to date with its inputs, reader and NXDL, '
+         'as recorded in the root attributes (attrs) or a sidecar file (sidecar).'
+)
+def convert_cli(input_file: Tuple[str],  # pylint: disable=too-many-arguments
                 reader: str,
                 nxdl: str,
                 output: str,
                 generate_template: bool,
                 fair: bool,
-                params_file: str):
+                params_file: str,
+                storage_policy: str,
+                append: bool,
+                entry_name: str,
+                manifest: str):
     """The CLI entrypoint for the convert function"""
     if params_file:
         try:
@@ -200,7 +320,9 @@ def convert_cli(input_file: Tuple[str],
             sys.tracebacklimit = 0
             raise Exception("\nError: Please supply an NXDL file with the option:"
                             " --nxdl <path to NXDL>")
-        convert(input_file, reader, nxdl, output, generate_template, fair)
+        convert(input_file, reader, nxdl, output, generate_template, fair,
+                storage_policy=storage_policy, append=append, entry_name=entry_name,
+                manifest=manifest)
 
 
 if __name__ == '__main__':
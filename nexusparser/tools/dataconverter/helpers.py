@@ -17,18 +17,45 @@
 #
 """Helper functions commonly used by the convert routine."""
 
-from typing import Tuple, Callable
+import os
+from typing import Callable, Optional, Tuple
 import re
 import xml.etree.ElementTree as ET
 
 import numpy as np
 
 from nexusparser.tools import nexus
+from nexusparser.tools.dataconverter.lazy import LazyValue, is_memory_mapped, iter_slabs
 from nexusparser.tools.nexus import NxdlAttributeError
 
 
-def generate_template_from_nxdl(root, template, path=None, nxdl_root=None):
-    """Helper function to generate a template dictionary for given NXDL"""
+_nxdl_roots: dict = {}
+
+
+def get_nxdl_root(nxdl_path: str) -> ET.Element:
+    """Returns the parsed NXDL file, parsed once per process as long as the file is unchanged."""
+    key = (os.path.abspath(nxdl_path), os.stat(nxdl_path).st_mtime_ns)
+    if key not in _nxdl_roots:
+        _nxdl_roots[key] = ET.parse(nxdl_path).getroot()
+    return _nxdl_roots[key]
+
+
+def get_plan_root(nxdl_root: Optional[ET.Element], plan: Optional[dict]) -> ET.Element:
+    """Returns the given NXDL root or, without one, the parsed NXDL file of the plan.
+
+    Callers holding a plan pass no root, so that the NXDL is only parsed for lookups the plan
+    misses.
+    """
+    if nxdl_root is not None:
+        return nxdl_root
+    assert plan is not None, "The NXDL file hasn't been loaded."
+    return get_nxdl_root(plan["nxdl_path"])
+
+
+def generate_template_from_nxdl(root, template, path=None, nxdl_root=None, plan=None):
+    """Helper function to generate a template dictionary for given NXDL
+
+    NXDL nodes resolved on the way are memoized in the plan, if given (see nxdl_plan)."""
     if nxdl_root is None:
         nxdl_root = root
         root = get_first_group(root)
@@ -57,7 +84,7 @@ def generate_template_from_nxdl(root, template, path=None, nxdl_root=None):
     if tag in ("field", "attribute"):
         optionality = get_required_string(root)
         if optionality == "required":
-            optional_parent = check_for_optional_parent(path, nxdl_root)
+            optional_parent = check_for_optional_parent(path, nxdl_root, plan)
             optionality = "required" if optional_parent == "<<NOT_FOUND>>" else "optional"
             if optional_parent != "<<NOT_FOUND>>":
                 template.optional_parents.append(optional_parent)
@@ -69,7 +96,7 @@ def generate_template_from_nxdl(root, template, path=None, nxdl_root=None):
             template[optionality][f"{path}/@units"] = None
 
     for child in root:
-        generate_template_from_nxdl(child, template, path, nxdl_root)
+        generate_template_from_nxdl(child, template, path, nxdl_root, plan)
 
 
 def get_required_string(elem):
@@ -133,11 +160,109 @@ def is_value_valid_element_of_enum(value, elem) -> Tuple[bool, list]:
     """Checks whether a value has to be specific from the NXDL enumeration and returns options."""
     if elem is not None:
         has_enums, enums = nexus.get_enums(elem)
-        if has_enums and (isinstance(value, list) or value not in enums[0:-1] or value == ""):
-            return False, enums
+        return is_value_valid_enum(value, enums if has_enums else None)
+    return True, []
+
+
+def is_value_valid_enum(value, enums) -> Tuple[bool, list]:
+    """Checks whether a value is one of the enumeration (as given by nexus.get_enums)."""
+    if enums is not None and (isinstance(value, list) or value not in enums[0:-1] or value == ""):
+        return False, enums
     return True, []
 
 
+def describe_nxdl_node(elem: ET.Element) -> Optional[dict]:
+    """Returns what validating data needs to know about an NXDL node, as a JSON-able dict."""
+    if elem is None:
+        return None
+    has_enums, enums = nexus.get_enums(elem)
+    return {"tag": remove_namespace_from_tag(elem.tag),
+            "name": elem.attrib.get("name"),
+            "type": elem.attrib.get("type"),
+            "units": elem.attrib.get("units"),
+            "enums": enums if has_enums else None,
+            "required": nexus.get_required_string(elem)}
+
+
+def get_nxdl_node_info(nxdl_path: str, nxdl_root: ET.Element, plan: dict = None,
+                       exc: bool = True) -> Optional[dict]:
+    """Returns the description of the NXDL node at the given path (see describe_nxdl_node).
+
+    Like nexus.get_node_at_nxdl_path, it raises an NxdlAttributeError if there is no such node
+    and exc is True. Descriptions (and misses) are memoized in plan["nodes"], if a plan is given.
+    """
+    if plan is not None and nxdl_path in plan["nodes"]:
+        info = plan["nodes"][nxdl_path]
+    else:
+        info = describe_nxdl_node(nexus.get_node_at_nxdl_path(nxdl_path=nxdl_path,
+                                                              elem=get_plan_root(nxdl_root,
+                                                                                 plan),
+                                                              exc=False))
+        if plan is not None:
+            plan["nodes"][nxdl_path] = info
+            plan["modified"] = True
+    if info is None and exc:
+        raise NxdlAttributeError(f"Attributes were not found for {nxdl_path}. "
+                                 "Please check this entry in the template dictionary.")
+    return info
+
+
+def resolve_nxdl_nodes(nxdl_paths, nxdl_root: ET.Element, plan: dict):
+    """Describes the NXDL nodes at all given paths not yet in plan["nodes"] in one pass.
+
+    The paths are resolved together (see nexus.get_nodes_at_nxdl_paths), so that shared
+    prefixes are only walked once.
+    """
+    nxdl_paths = {nxdl_path for nxdl_path in nxdl_paths
+                  if nxdl_path is not None and nxdl_path not in plan["nodes"]}
+    if not nxdl_paths:
+        return
+    for nxdl_path, elem in nexus.get_nodes_at_nxdl_paths(sorted(nxdl_paths),
+                                                         elem=get_plan_root(nxdl_root,
+                                                                            plan)).items():
+        plan["nodes"][nxdl_path] = describe_nxdl_node(elem)
+    plan["modified"] = True
+
+
+def describe_nxdl_group(elem: ET.Element) -> Optional[list]:
+    """Returns what the writer needs to know about an NXDL group: its attributes (without
+    name, which only names the HDF5 group) and the names of its NXDL attribute children."""
+    if elem is None:
+        return None
+    return [{key: value for key, value in elem.attrib.items() if key != "name"},
+            [attr.get('name') for attr in elem.findall(f"{nexus.get_namespace(elem)}attribute")]]
+
+
+def resolve_nxdl_groups(nxdl_paths, nxdl_root: Optional[ET.Element], plan: dict):
+    """Describes the NXDL groups at all given paths not yet in plan["groups"] in one pass
+    (see describe_nxdl_group)."""
+    groups = plan.setdefault("groups", {})
+    nxdl_paths = set(nxdl_paths) - groups.keys()
+    if not nxdl_paths:
+        return
+    for nxdl_path, elem in nexus.get_nodes_at_nxdl_paths(sorted(nxdl_paths),
+                                                         elem=get_plan_root(nxdl_root,
+                                                                            plan)).items():
+        groups[nxdl_path] = describe_nxdl_group(elem)
+    plan["modified"] = True
+
+
+def get_nxdl_lookup_path(path: str) -> Optional[str]:
+    """Returns the NXDL path used to look up a data converter path in the NXDL.
+
+    /ENTRY[entry]/data/@signal -> /ENTRY/data/signal
+    Units (/@units) are not looked up, None is returned for them.
+    """
+    entry_name = get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
+    nxdl_path = convert_data_converter_dict_to_nxdl_path(path)
+    if entry_name == "@units":
+        return None
+    if entry_name[0] == "@" and "@" in nxdl_path:
+        index_of_at = nxdl_path.rindex("@")
+        nxdl_path = nxdl_path[0:index_of_at] + nxdl_path[index_of_at + 1:]
+    return nxdl_path
+
+
 NUMPY_FLOAT_TYPES = (np.half, np.float16, np.single, np.double, np.longdouble)
 NUMPY_INT_TYPES = (np.short, np.intc, np.int_)
 NUMPY_UINT_TYPES = (np.ushort, np.uintc, np.uint)
@@ -157,6 +282,26 @@ NEXUS_TO_PYTHON_DATA_TYPES = {
 }
 
 
+# numpy dtype kinds accepted for arrays of a NeXus type, None accepts arrays of any kind.
+# Integer arrays pass for floats, as Python ints are converted to floats for them, and for
+# booleans, as 0 and 1 are. Lists for types accepting any kind are checked element-wise.
+NEXUS_TO_NUMPY_KINDS = {
+    "ISO8601": "OU",
+    "NX_BINARY": None,
+    "NX_BOOLEAN": "biu",
+    "NX_CHAR": None,
+    "NX_DATE_TIME": "OU",
+    "NX_FLOAT": "fiuc",
+    "NX_INT": "iu",
+    "NX_UINT": "ui",  # signed integers have to be >= 0
+    "NX_NUMBER": "fiuc",
+    "NX_POSINT": "iu",  # > 0 is checked in is_valid_data_field()
+}
+
+ISO8601 = re.compile(r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2}(?:"
+                     r"\.\d*)?)(((?!-00:00)(\+|-)(\d{2}):(\d{2})|Z){1})$")
+
+
 def check_all_children_for_callable(objects: list, check: Callable, *args) -> bool:
     """Checks whether all objects in list are validated by given callable."""
     for obj in objects:
@@ -166,6 +311,44 @@ def check_all_children_for_callable(objects: list, check: Callable, *args) -> bo
     return True
 
 
+def convert_list_to_array(value: list) -> Optional[np.ndarray]:
+    """Converts a list to a numpy array for validating it at once.
+
+    Returns None for lists which don't convert to an array of one type: ragged or mixed
+    lists, and lists of strings, which numpy would also build from mixed lists.
+    """
+    try:
+        array = np.asarray(value)
+    except ValueError:
+        return None
+    return None if array.dtype.kind in "OSU" else array
+
+
+def all_elements(array: np.ndarray, condition: Callable) -> bool:
+    """Checks a vectorized condition on all elements of an array.
+
+    Memory-mapped arrays are checked slab by slab, so that they are not read at once.
+    """
+    if array.ndim and is_memory_mapped(array):
+        return all(bool(np.all(condition(slab))) for slab in iter_slabs(array))
+    return bool(np.all(condition(array)))
+
+
+def is_valid_array_type(array, nxdl_type: str) -> bool:
+    """Checks whether the dtype of an array fits to the NeXus type, without visiting elements.
+
+    The values of lazy values are not read, only their dtype is checked.
+    """
+    kinds = NEXUS_TO_NUMPY_KINDS[nxdl_type]
+    if kinds is None:
+        return True
+    if array.dtype.kind not in kinds:
+        return False
+    if nxdl_type == "NX_UINT" and array.dtype.kind == "i" and isinstance(array, np.ndarray):
+        return all_elements(array, lambda elements: elements >= 0)
+    return True
+
+
 def is_valid_data_type(value, accepted_types):
     """Checks whether the given value or its children are of an accepted type."""
     if not isinstance(value, list):
@@ -175,13 +358,25 @@ def is_valid_data_type(value, accepted_types):
 
 
 def is_positive_int(value):
-    """Checks whether the given value or its children are positive."""
-    is_greater_than = lambda x: x.flat[0] > 0 if isinstance(x, np.ndarray) else x > 0
-
+    """Checks whether the given value or all of its elements are positive."""
     if isinstance(value, list):
-        return check_all_children_for_callable(value, is_greater_than)
+        array = convert_list_to_array(value)
+        if array is None:
+            return check_all_children_for_callable(value, is_positive_int)
+        value = array
+
+    if isinstance(value, np.ndarray):
+        return all_elements(value, lambda elements: elements > 0)
+    return value > 0
 
-    return value.flat[0] > 0 if isinstance(value, np.ndarray) else value > 0
+
+def is_valid_date(value):
+    """Checks whether the given value or all of its elements are timezone aware ISO8601 dates."""
+    dates = np.asarray(value).flat if isinstance(value, (list, np.ndarray)) else (value,)
+    for date in dates:
+        if not isinstance(date, str) or ISO8601.search(date) is None:
+            return False
+    return True
 
 
 def convert_str_to_bool_safe(value):
@@ -204,11 +399,25 @@ def is_valid_data_field(value, nxdl_type, path):
 
         If it fails to convert, it raises an Exception.
 
+        Arrays (and lists for numeric types, converted to arrays once) are checked by their dtype kind
+        and with vectorized comparisons, without visiting their elements in Python.
+        Lazy values are only checked by their dtype kind. Buffers (memoryview) are checked
+        as arrays, without copying them.
+
         As a default it just returns the value again.
     """
     accepted_types = NEXUS_TO_PYTHON_DATA_TYPES[nxdl_type]
-
-    if not is_valid_data_type(value, accepted_types):
+    if isinstance(value, memoryview):
+        value = np.asarray(value)
+    array = value if isinstance(value, (np.ndarray, LazyValue)) else \
+        convert_list_to_array(value) if isinstance(value, list) \
+        and NEXUS_TO_NUMPY_KINDS.get(nxdl_type) is not None else None
+
+    if array is not None and nxdl_type in NEXUS_TO_NUMPY_KINDS:
+        if not is_valid_array_type(array, nxdl_type):
+            raise Exception(f"The value at {path} should be of Python type: {accepted_types}"
+                            f", as defined in the NXDL as {nxdl_type}.")
+    elif not is_valid_data_type(value, accepted_types):
         try:
             if accepted_types[0] is bool and isinstance(value, str):
                 value = convert_str_to_bool_safe(value)
@@ -219,30 +428,53 @@ def is_valid_data_field(value, nxdl_type, path):
             raise Exception(f"The value at {path} should be of Python type: {accepted_types}"
                             f", as defined in the NXDL as {nxdl_type}.")
 
-    if nxdl_type == "NX_POSINT" and not is_positive_int(value):
+    if nxdl_type == "NX_POSINT" and not isinstance(value, LazyValue) \
+       and not is_positive_int(value if array is None else array):
         raise Exception(f"The value at {path} should be a positive int.")
 
-    if nxdl_type in ("ISO8601", "NX_DATE_TIME"):
-        iso8601 = re.compile(r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2}(?:"
-                             r"\.\d*)?)(((?!-00:00)(\+|-)(\d{2}):(\d{2})|Z){1})$")
-        results = iso8601.search(value)
-        if results is None:
-            raise Exception(f"The date at {path} should be a timezone aware ISO8601 "
-                            f"formatted str. For example, 2022-01-22T12:14:12.05018Z"
-                            f" or 2022-01-22T12:14:12.05018+00:00.")
+    if nxdl_type in ("ISO8601", "NX_DATE_TIME") and not isinstance(value, LazyValue) \
+       and not is_valid_date(value):
+        raise Exception(f"The date at {path} should be a timezone aware ISO8601 "
+                        f"formatted str. For example, 2022-01-22T12:14:12.05018Z"
+                        f" or 2022-01-22T12:14:12.05018+00:00.")
 
     return value
 
 
-def path_in_data_dict(nxdl_path: str, data: dict) -> Tuple[bool, str]:
+def index_data_dict(data, optional_parents: list = None) -> dict:
+    """Indexes the paths of a data dict by their NXDL paths, so that validation is linear in them.
+
+    The index maps
+    "paths": each NXDL path to its data converter paths, in the order of the data dict,
+    "children": the NXDL path of each group to its children, as (NXDL path, path) tuples,
+    "optional_parents": each NXDL path to its optional parents, as (position, path) tuples,
+    "complete": the NXDL path of each checked optional parent to whether all its required
+                children are set (see all_required_children_are_set).
+    """
+    index: dict = {"paths": {}, "children": {}, "optional_parents": {}, "complete": {}}
+    for key in data.keys():
+        nxdl_key = convert_data_converter_dict_to_nxdl_path(key)
+        index["paths"].setdefault(nxdl_key, []).append(key)
+        index["children"].setdefault(nxdl_key[0:nxdl_key.rfind("/")], []).append((nxdl_key, key))
+    for position, optional_parent in enumerate(optional_parents or []):
+        optional_parent_nxdl = convert_data_converter_dict_to_nxdl_path(optional_parent)
+        index["optional_parents"].setdefault(optional_parent_nxdl, []).append(
+            (position, optional_parent))
+    return index
+
+
+def path_in_data_dict(nxdl_path: str, data: dict, index: dict = None) -> Tuple[bool, str]:
     """Checks if there is an accepted variation of path in the dictionary & returns the path."""
+    if index is not None:
+        keys = index["paths"].get(nxdl_path)
+        return (True, keys[0]) if keys else (False, "")
     for key in data.keys():
         if nxdl_path == convert_data_converter_dict_to_nxdl_path(key):
             return True, key
     return False, ""
 
 
-def check_for_optional_parent(path: str, nxdl_root: ET.Element) -> str:
+def check_for_optional_parent(path: str, nxdl_root: ET.Element, plan: dict = None) -> str:
     """Finds a parent in the branch that is optional and returns it's path or s<<NOT_FOUND>>."""
     parent_path = path.rsplit("/", 1)[0]
 
@@ -250,134 +482,143 @@ def check_for_optional_parent(path: str, nxdl_root: ET.Element) -> str:
         return "<<NOT_FOUND>>"
 
     parent_nxdl_path = convert_data_converter_dict_to_nxdl_path(parent_path)
-    elem = nexus.get_node_at_nxdl_path(nxdl_path=parent_nxdl_path, elem=nxdl_root)
+    info = get_nxdl_node_info(parent_nxdl_path, nxdl_root, plan)
 
-    if nexus.get_required_string(elem) in ("<<OPTIONAL>>", "<<RECOMMENDED>>"):
+    if info["required"] in ("<<OPTIONAL>>", "<<RECOMMENDED>>"):
         return parent_path
 
-    return check_for_optional_parent(parent_path, nxdl_root)
+    return check_for_optional_parent(parent_path, nxdl_root, plan)
 
 
-def is_node_required(nxdl_key, nxdl_root):
+def is_node_required(nxdl_key, nxdl_root, plan=None):
     """Checks whether a node at given nxdl path is required"""
     if nxdl_key[nxdl_key.rindex("/") + 1:] == "@units":
         return False
     if nxdl_key[nxdl_key.rindex("/") + 1] == "@":
         nxdl_key = nxdl_key[0:nxdl_key.rindex("/") + 1] + nxdl_key[nxdl_key.rindex("/") + 2:]
-    node = nexus.get_node_at_nxdl_path(nxdl_key, elem=nxdl_root)
-    return nexus.get_required_string(node) == "<<REQUIRED>>"
+    return get_nxdl_node_info(nxdl_key, nxdl_root, plan)["required"] == "<<REQUIRED>>"
 
 
-def all_required_children_are_set(optional_parent_path, data, nxdl_root):
-    """Walks over optional parent's children and makes sure all required ones are set"""
+def all_required_children_are_set(optional_parent_path, data, nxdl_root, plan=None, index=None):
+    """Walks over optional parent's children and makes sure all required ones are set
+
+    With an index of the data dict (see index_data_dict), only the children of the parent are
+    visited and the result is memoized in the index.
+    """
     optional_parent_path = convert_data_converter_dict_to_nxdl_path(optional_parent_path)
+    if index is not None:
+        if optional_parent_path not in index["complete"]:
+            index["complete"][optional_parent_path] = all(
+                not (is_node_required(nxdl_key, nxdl_root, plan) and data[key] is None)
+                for nxdl_key, key in index["children"].get(optional_parent_path, ()))
+        return index["complete"][optional_parent_path]
     for key in data:
         nxdl_key = convert_data_converter_dict_to_nxdl_path(key)
         if nxdl_key[0:nxdl_key.rfind("/")] == optional_parent_path \
-           and is_node_required(nxdl_key, nxdl_root) \
+           and is_node_required(nxdl_key, nxdl_root, plan) \
            and data[key] is None:
             return False
 
     return True
 
 
-def is_nxdl_path_a_child(nxdl_path: str, parent: str):
-    """Takes an NXDL path for an element and an NXDL parent and confirms it is a child."""
-    while nxdl_path.rfind("/") != -1:
-        nxdl_path = nxdl_path[0:nxdl_path.rfind("/")]
-        if parent == nxdl_path:
-            return True
-    return False
-
-
 def check_optionality_based_on_parent_group(
         path,
         nxdl_path,
         nxdl_root,
         data,
-        template):
+        template,
+        plan=None,
+        index=None):
     """Checks whether field is part of an optional parent and then confirms its optionality"""
-    for optional_parent in template["optional_parents"]:
-        optional_parent_nxdl = convert_data_converter_dict_to_nxdl_path(optional_parent)
-        if is_nxdl_path_a_child(nxdl_path, optional_parent_nxdl) \
-           and not all_required_children_are_set(optional_parent, data, nxdl_root):
+    if index is None:
+        index = index_data_dict(data, template["optional_parents"])
+    optional_parents = []
+    while nxdl_path.rfind("/") != -1:
+        nxdl_path = nxdl_path[0:nxdl_path.rfind("/")]
+        optional_parents.extend(index["optional_parents"].get(nxdl_path, ()))
+    for _, optional_parent in sorted(optional_parents):
+        if not all_required_children_are_set(optional_parent, data, nxdl_root, plan, index):
             raise Exception(f"The data entry, {path}, has an optional parent, "
                             f"{optional_parent}, with required children set. Either"
                             f" provide no children for {optional_parent} or provide"
                             f" all required ones.")
 
 
-def ensure_all_required_fields_exist(template, data):
+def ensure_all_required_fields_exist(template, data, index=None):
     """Checks whether all the required fields are in the returned data object."""
+    if index is None:
+        index = index_data_dict(data)
     for path in template["required"]:
         entry_name = get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
         if entry_name == "@units":
             continue
         nxdl_path = convert_data_converter_dict_to_nxdl_path(path)
-        is_path_in_data_dict, renamed_path = path_in_data_dict(nxdl_path, data)
+        is_path_in_data_dict, renamed_path = path_in_data_dict(nxdl_path, data, index)
         if not is_path_in_data_dict or data[renamed_path] is None:
             raise Exception(f"The data entry corresponding to {path} is required and"
                             f" hasn't been supplied by the reader.")
 
 
-def try_undocumented(data, nxdl_root: ET.Element):
+def try_undocumented(data, nxdl_root: ET.Element, plan: dict = None):
     """Tries to move entries used that are from base classes but not in AppDef"""
+    if plan is None:
+        plan = {"nodes": {}}
+    resolve_nxdl_nodes(map(get_nxdl_lookup_path, data.undocumented), nxdl_root, plan)
     for path in list(data.undocumented):
-        entry_name = get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
-
-        nxdl_path = convert_data_converter_dict_to_nxdl_path(path)
-
-        if entry_name == "@units":
+        nxdl_path = get_nxdl_lookup_path(path)
+        if nxdl_path is None:
             continue
-        elif entry_name[0] == "@" and "@" in nxdl_path:
-            index_of_at = nxdl_path.rindex("@")
-            nxdl_path = nxdl_path[0:index_of_at] + nxdl_path[index_of_at + 1:]
 
         try:
-            elem = nexus.get_node_at_nxdl_path(nxdl_path=nxdl_path, elem=nxdl_root)
-            data[get_required_string(elem)][path] = data.undocumented[path]
-            del data.undocumented[path]
+            optionality = get_nxdl_node_info(nxdl_path, nxdl_root, plan)["required"][2:-2].lower()
+            data[optionality][path] = data.undocumented[path]
             units = f"{path}/@units"
             if units in data.undocumented:
-                data[get_required_string(elem)][units] = data.undocumented[units]
-                del data.undocumented[units]
+                data[optionality][units] = data.undocumented[units]
         except NxdlAttributeError:
             pass
 
 
-def validate_data_dict(template, data, nxdl_root: ET.Element):
-    """Checks whether all the required paths from the template are returned in data dict."""
-    assert nxdl_root is not None, "The NXDL file hasn't been loaded."
+def validate_data_dict(template, data, nxdl_root: ET.Element, plan: dict = None):
+    """Checks whether all the required paths from the template are returned in data dict.
+
+    NXDL nodes are looked up in the plan of the NXDL (see nxdl_plan) and memoized in it, if given.
+    With a plan, nxdl_root can be None, the NXDL is then only parsed for nodes the plan misses.
+    """
+    assert nxdl_root is not None or plan is not None, "The NXDL file hasn't been loaded."
+    if plan is None:
+        plan = {"nodes": {}}
+    # try_undocumented only moves paths between optionalities, so the index stays valid.
+    index = index_data_dict(data, template["optional_parents"])
+    resolve_nxdl_nodes(map(get_nxdl_lookup_path, data.keys()), nxdl_root, plan)
 
     # Make sure all required fields exist.
-    ensure_all_required_fields_exist(template, data)
+    ensure_all_required_fields_exist(template, data, index)
 
-    try_undocumented(data, nxdl_root)
+    try_undocumented(data, nxdl_root, plan)
 
     for path in data.get_documented().keys():
         if data[path] is not None:
             entry_name = get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
-            nxdl_path = convert_data_converter_dict_to_nxdl_path(path)
+            nxdl_path = get_nxdl_lookup_path(path)
 
-            if entry_name == "@units":
+            if nxdl_path is None:
                 continue
-            elif entry_name[0] == "@" and "@" in nxdl_path:
-                index_of_at = nxdl_path.rindex("@")
-                nxdl_path = nxdl_path[0:index_of_at] + nxdl_path[index_of_at + 1:]
 
-            elem = nexus.get_node_at_nxdl_path(nxdl_path=nxdl_path, elem=nxdl_root)
+            info = get_nxdl_node_info(nxdl_path, nxdl_root, plan)
 
             # Only check for validation in the NXDL if we did find the entry
             # otherwise we just pass it along
-            if elem is not None \
-               and elem.attrib["name"] == entry_name \
-               and remove_namespace_from_tag(elem.tag) in ("field", "attribute"):
-                check_optionality_based_on_parent_group(path, nxdl_path, nxdl_root, data, template)
+            if info is not None \
+               and info["name"] == entry_name \
+               and info["tag"] in ("field", "attribute"):
+                check_optionality_based_on_parent_group(path, nxdl_path, nxdl_root, data, template,
+                                                        plan, index)
 
-                attrib = elem.attrib
-                nxdl_type = attrib["type"] if "type" in attrib.keys() else "NXDL_TYPE_UNAVAILABLE"
+                nxdl_type = info["type"] if info["type"] is not None else "NXDL_TYPE_UNAVAILABLE"
                 data[path] = is_valid_data_field(data[path], nxdl_type, path)
-                is_valid_enum, enums = is_value_valid_element_of_enum(data[path], elem)
+                is_valid_enum, enums = is_value_valid_enum(data[path], info["enums"])
                 if not is_valid_enum:
                     raise Exception(f"The value at {path} should be"
                                     f" one of the following strings: {enums}")
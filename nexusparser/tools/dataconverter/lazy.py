@@ -0,0 +1,101 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Lazy dataset values, which readers can put into the template instead of arrays that
+would not fit into memory.
+
+Readers can also put arrays without copying them into the template: np.memmap arrays, views
+of an mmap (np.frombuffer, np.ndarray(buffer=...)) and other objects of the buffer protocol
+(memoryview). The data converter never copies such arrays as a whole. They are validated and
+written slab by slab, so files larger than the memory can be converted.
+"""
+
+import mmap
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+import numpy as np
+
+# the size in bytes of the slabs memory-mapped arrays are read in
+SLAB_SIZE = 2 ** 26
+
+
+class LazyValue:
+    """A dataset value given by its shape, its dtype and its slabs along the first axis.
+
+    The Writer creates the dataset and fills it slab by slab (see storage.write_lazy_value),
+    so the whole array never has to be in memory. Validation only checks the dtype.
+
+    Args:
+        shape (tuple): The shape of the dataset. The first dimension may be None if the number
+            of frames is not known in advance. The dataset is resizable then.
+        dtype: The numpy dtype of the dataset.
+        slabs: An iterable (e.g. a generator) of arrays, or a callable returning one. Each
+            array is a slab of consecutive frames, of the shape (frames, *shape[1:]).
+    """
+
+    def __init__(self, shape: Tuple[Optional[int], ...], dtype,
+                 slabs: Union[Iterable[np.ndarray], Callable[[], Iterable[np.ndarray]]]):
+        if not shape:
+            raise ValueError("A lazy value needs at least one dimension to be filled along.")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.slabs = slabs
+
+    @property
+    def ndim(self) -> int:
+        """The number of dimensions of the dataset."""
+        return len(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        """The size of the dataset in bytes, 0 if the number of frames is not known."""
+        if self.shape[0] is None:
+            return 0
+        return int(np.prod(self.shape)) * self.dtype.itemsize
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        return iter(self.slabs() if callable(self.slabs) else self.slabs)
+
+    def __repr__(self) -> str:
+        return f"LazyValue(shape={self.shape}, dtype={self.dtype})"
+
+    @classmethod
+    def from_array(cls, array: np.ndarray, slab_size: int = SLAB_SIZE) -> "LazyValue":
+        """Returns a lazy value reading the array in slabs of at most slab_size bytes."""
+        return cls(array.shape, array.dtype, lambda: iter_slabs(array, slab_size))
+
+
+def is_memory_mapped(value) -> bool:
+    """Checks whether an array (or buffer) is backed by a memory-mapped file."""
+    while True:
+        if isinstance(value, np.memmap):
+            return True
+        if isinstance(value, np.ndarray):
+            value = value.base
+        elif isinstance(value, memoryview):
+            value = value.obj
+        else:
+            return isinstance(value, mmap.mmap)
+
+
+def iter_slabs(array: np.ndarray, slab_size: int = SLAB_SIZE) -> Iterator[np.ndarray]:
+    """Yields views of consecutive frames of the array of at most slab_size bytes each
+    (and at least one frame)."""
+    frame_size = max(1, int(np.prod(array.shape[1:])) * array.dtype.itemsize)
+    frames = max(1, slab_size // frame_size)
+    for start in range(0, len(array), frames):
+        yield array[start:start + frames]
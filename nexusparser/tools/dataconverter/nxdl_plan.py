@@ -0,0 +1,146 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Compiled plans of NXDL files for the dataconverter.
+
+A plan bundles everything the convert routine needs from an NXDL: the template skeleton
+(path and optionality), the optional parents and a description of the NXDL node of each
+path (tag, name, type, units, enumeration and optionality, see helpers.describe_nxdl_node)
+and the attributes of the NXDL group of each parent path, which the writer gives the HDF5
+groups (see helpers.describe_nxdl_group).
+Plans are kept in memory and in a cache directory, keyed by the hash of the definitions,
+so that conversions with a warm cache neither parse the NXDL, generate the template nor
+resolve the inheritance of NXDL nodes again.
+
+The cache directory is ~/.cache/nexusparser/nxdl_plans, or the one given by the environment
+variable NEXUS_PLAN_CACHE_DIR. Set it to an empty string to keep plans in memory only.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict
+import xml.etree.ElementTree as ET
+
+from nexusparser.tools import nexus
+from nexusparser.tools.dataconverter import helpers
+from nexusparser.tools.dataconverter.template import CopyOnWriteStore, Template
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+PLAN_VERSION = 1
+
+_plans: dict = {}
+
+
+def get_plan_cache_dir() -> str:
+    """Returns the directory keeping compiled plans, or an empty string for none."""
+    cache_dir = os.environ.get("NEXUS_PLAN_CACHE_DIR")
+    if cache_dir is None:
+        return os.path.join(os.path.expanduser("~"), ".cache", "nexusparser", "nxdl_plans")
+    return cache_dir
+
+
+def get_definition_hash(nxdl_path: str) -> str:
+    """Hashes the content of an NXDL file and the definitions its nodes can inherit from (see
+    nexus.get_definitions_hash, computed once per process)."""
+    sha = hashlib.sha256(f"{PLAN_VERSION}".encode())
+    with open(nxdl_path, "rb") as nxdl_file:
+        sha.update(nxdl_file.read())
+    sha.update(nexus.get_definitions_hash().encode())
+    return sha.hexdigest()
+
+
+def compile_plan(nxdl_root: ET.Element, definition_hash: str) -> Dict[str, Any]:
+    """Generates the template of an NXDL and describes the NXDL node of each of its paths and
+    the NXDL group of each of their parents."""
+    plan: Dict[str, Any] = {"version": PLAN_VERSION, "hash": definition_hash, "nodes": {},
+                            "groups": {}}
+    template = Template()
+    helpers.generate_template_from_nxdl(nxdl_root, template, plan=plan)
+    plan["template"] = [[path, optionality] for path, (optionality, _) in template.store.items()]
+    plan["optional_parents"] = template.optional_parents
+    helpers.resolve_nxdl_nodes((helpers.get_nxdl_lookup_path(path)
+                                for path, _ in plan["template"]), nxdl_root, plan)
+    helpers.resolve_nxdl_groups({helpers.convert_data_converter_dict_to_nxdl_path(
+        path[:path.rindex("/")]) for path, _ in plan["template"]}, nxdl_root, plan)
+    return plan
+
+
+def get_plan_file_name(definition_hash: str) -> str:
+    """Returns the name of the file keeping the plan in the cache directory."""
+    return os.path.join(get_plan_cache_dir(), f"{definition_hash}.json")
+
+
+def load_plan(definition_hash: str):
+    """Returns the plan from the cache directory, or None if it is missing or outdated."""
+    if not get_plan_cache_dir():
+        return None
+    try:
+        with open(get_plan_file_name(definition_hash), "r") as plan_file:
+            plan = json.load(plan_file)
+    except (OSError, ValueError):
+        return None
+    if plan.get("version") != PLAN_VERSION or plan.get("hash") != definition_hash:
+        return None
+    return plan
+
+
+def save_plan(plan: dict):
+    """Writes the plan to the cache directory. Failing to do so only logs a warning."""
+    plan.pop("modified", None)
+    if not get_plan_cache_dir():
+        return
+    file_name = get_plan_file_name(plan["hash"])
+    try:
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(f"{file_name}.{os.getpid()}.tmp", "w") as plan_file:
+            # the same definitions can be found at other paths
+            json.dump({key: value for key, value in plan.items() if key != "nxdl_path"},
+                      plan_file)
+        os.replace(f"{file_name}.{os.getpid()}.tmp", file_name)
+    except OSError as exception:
+        logger.warning("The NXDL plan could not be cached in %s: %s", file_name, exception)
+
+
+def get_plan(nxdl_path: str, nxdl_root: ET.Element = None) -> Dict[str, Any]:
+    """Returns the plan of an NXDL file from memory, the cache directory or by compiling it.
+
+    The NXDL file is only parsed (once per process, see helpers.get_nxdl_root) to compile the
+    plan or to look up nodes the plan misses, which the plan finds by its nxdl_path.
+    """
+    definition_hash = get_definition_hash(nxdl_path)
+    plan = _plans.get(definition_hash)
+    if plan is None:
+        plan = load_plan(definition_hash)
+    if plan is None:
+        plan = compile_plan(nxdl_root if nxdl_root is not None
+                            else helpers.get_nxdl_root(nxdl_path), definition_hash)
+        save_plan(plan)
+    plan["nxdl_path"] = nxdl_path
+    _plans[definition_hash] = plan
+    return plan
+
+
+def get_template(plan: dict) -> Template:
+    """Returns a new, empty template for the NXDL of the plan."""
+    template = Template()
+    template.store = CopyOnWriteStore({path: (optionality, None)
+                                       for path, optionality in plan["template"]})
+    template.optional_parents = list(plan["optional_parents"])
+    return template
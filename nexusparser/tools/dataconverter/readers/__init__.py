@@ -0,0 +1,32 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""The readers of the data converter.
+
+READERS names the module of each reader in this package. A reader module is only imported
+when the reader is used (see convert.get_reader). Readers of other packages are registered
+under the entry point group nexusparser.dataconverter.readers instead.
+"""
+
+READERS = {
+    "apm": "nexusparser.tools.dataconverter.readers.apm.reader",
+    "ellips": "nexusparser.tools.dataconverter.readers.ellips.reader",
+    "em_nion": "nexusparser.tools.dataconverter.readers.em_nion.reader",
+    "example": "nexusparser.tools.dataconverter.readers.example.reader",
+    "json_map": "nexusparser.tools.dataconverter.readers.json_map.reader",
+    "mpes": "nexusparser.tools.dataconverter.readers.mpes.reader",
+}
@@ -135,13 +135,13 @@ def extract_data_from_apt_file(file_name: str, template: dict) -> dict:
 
     trg = '/ENTRY[entry]/atom_probe/reconstruction/'
     xyz = aptfile.get_named_quantity('Position')
-    template[trg + 'reconstructed_positions'] = np.array(xyz.value, np.float32)
+    template[trg + 'reconstructed_positions'] = np.asarray(xyz.value, np.float32)
     template[trg + 'reconstructed_positions/@units'] = xyz.unit
     del xyz
 
     trg = '/ENTRY[entry]/atom_probe/mass_to_charge_conversion/'
     m_z = aptfile.get_named_quantity('Mass')
-    template[trg + 'mass_to_charge'] = np.array(m_z.value, np.float32)
+    template[trg + 'mass_to_charge'] = np.asarray(m_z.value, np.float32)
     template[trg + 'mass_to_charge/@units'] = m_z.unit
     del m_z
 
@@ -159,13 +159,13 @@ def extract_data_from_pos_file(file_name: str, template: dict) -> dict:
 
     trg = '/ENTRY[entry]/atom_probe/reconstruction/'
     xyz = posfile.get_reconstructed_positions()
-    template[trg + 'reconstructed_positions'] = np.array(xyz.value, np.float32)
+    template[trg + 'reconstructed_positions'] = np.asarray(xyz.value, np.float32)
     template[trg + 'reconstructed_positions/@units'] = xyz.unit
     del xyz
 
     trg = '/ENTRY[entry]/atom_probe/mass_to_charge_conversion/'
     m_z = posfile.get_mass_to_charge()
-    template[trg + 'mass_to_charge'] = np.array(m_z.value, np.float32)
+    template[trg + 'mass_to_charge'] = np.asarray(m_z.value, np.float32)
     template[trg + 'mass_to_charge/@units'] = m_z.unit
     del m_z
     return template
@@ -178,13 +178,13 @@ def extract_data_from_epos_file(file_name: str, template: dict) -> dict:
 
     trg = '/ENTRY[entry]/atom_probe/reconstruction/'
     xyz = eposfile.get_reconstructed_positions()
-    template[trg + 'reconstructed_positions'] = np.array(xyz.value, np.float32)
+    template[trg + 'reconstructed_positions'] = np.asarray(xyz.value, np.float32)
     template[trg + 'reconstructed_positions/@units'] = xyz.unit
     del xyz
 
     trg = '/ENTRY[entry]/atom_probe/mass_to_charge_conversion/'
     m_z = eposfile.get_mass_to_charge()
-    template[trg + 'mass_to_charge'] = np.array(m_z.value, np.float32)
+    template[trg + 'mass_to_charge'] = np.asarray(m_z.value, np.float32)
     template[trg + 'mass_to_charge/@units'] = m_z.unit
     del m_z
 
@@ -30,6 +30,8 @@ class BaseReader(ABC):
     For future reference:
     - Support links by setting the path in the template with the following object
        object = {"link": "/path/to/source/data"}
+    - Large data can be given without copying it: np.memmap arrays, views of an mmap and
+      memoryview objects are written in slabs (see lazy.py). Don't copy or cast them.
     """
 
     # pylint: disable=too-few-public-methods
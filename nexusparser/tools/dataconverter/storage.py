@@ -0,0 +1,361 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Storage policies choosing the chunking, compression and filters of the datasets written
+by the dataconverter.
+
+A policy is a list of rules, for example loaded from a YAML (or JSON) file:
+
+    threads: 8                      # threads compressing gzip chunks, optional
+    buffer_size: 67108864           # bytes buffered when writing lazy values, optional
+    storage:
+      - path: /ENTRY/DATA/*         # NXDL path pattern (fnmatch), optional
+        reader: mpes                # only for this reader, optional
+        min_size: 1048576           # only for arrays of at least so many bytes, optional
+        chunks: auto                # auto (whole frames), true (h5py's guess), false or a shape
+        frame_axis: 0               # axis of the frames a chunk is aligned with (auto chunks)
+        compression: gzip           # gzip, lzf or none
+        compression_opts: 4         # gzip level
+        shuffle: true
+        fletcher32: false
+        fillvalue: 0
+
+The first rule matching an array applies. Arrays no rule matches are written contiguous,
+or in automatic chunks if they are large, and compressed if the reader asked for it
+with {"compress": array}. Scalars and strings are never chunked.
+
+Large gzip compressed arrays are compressed chunk by chunk in a thread pool (zlib releases
+the GIL) and the compressed chunks are written with write_direct_chunk. The chunks pass the
+same shuffle and deflate filters HDF5 would apply, so any HDF5 reader can read them.
+
+Lazy values (see lazy.LazyValue) are written slab by slab through a buffer of a fixed size.
+Memory-mapped arrays and buffers larger than the buffer are copied to HDF5 in slabs of the
+buffer size, without reading them into memory at once.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
+import itertools
+import logging
+import math
+import os
+from typing import List, Optional, Union
+import zlib
+
+import h5py
+import numpy as np
+import yaml
+
+from nexusparser.tools.dataconverter.lazy import LazyValue, is_memory_mapped
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+# target size of a chunk in bytes, chunks of whole frames may be smaller or larger
+CHUNK_SIZE = 2 ** 20
+# arrays of at least this size in bytes are chunked automatically
+AUTO_CHUNK_SIZE = 2 ** 22
+# the compression of {"compress": array} entries if no rule chooses one
+DEFAULT_COMPRESSION: dict = {"compression": "gzip", "compression_opts": 4, "shuffle": True}
+
+# gzip compressed arrays of at least this size in bytes are compressed in threads
+PARALLEL_COMPRESSION_SIZE = 2 ** 23
+# the size in bytes of the buffer lazy values are written through
+BUFFER_SIZE = 2 ** 26
+# the length assumed for chunking lazy values of unknown length
+UNKNOWN_LENGTH = 2 ** 40
+
+RULE_KEYS = ("path", "reader", "min_size", "chunks", "frame_axis", "compression",
+             "compression_opts", "shuffle", "fletcher32", "fillvalue")
+
+FILTERS = {
+    "gzip": h5py.h5z.FILTER_DEFLATE,
+    "lzf": h5py.h5z.FILTER_LZF,
+    "shuffle": h5py.h5z.FILTER_SHUFFLE,
+    "fletcher32": h5py.h5z.FILTER_FLETCHER32,
+}
+
+
+def is_filter_available(name: str, nxdl_path: str = None) -> bool:
+    """Checks whether the HDF5 library h5py is built with can apply the filter."""
+    if h5py.h5z.filter_avail(FILTERS[name]):
+        return True
+    logger.warning("The HDF5 filter %s is not available. %s is written without it.",
+                   name, nxdl_path)
+    return False
+
+
+def get_chunk_shape(shape: tuple, itemsize: int, frame_axis: Optional[int] = 0,
+                    chunk_size: int = CHUNK_SIZE) -> tuple:
+    """Returns a chunk shape of about chunk_size bytes made of whole frames along frame_axis.
+
+    Frames larger than chunk_size are split along their largest dimensions instead. Without
+    a frame axis, the largest dimensions are split until the chunk fits into chunk_size.
+    """
+    if not shape:
+        return ()
+    chunk = [max(dim, 1) for dim in shape]
+    if frame_axis is not None:
+        frame_axis %= len(shape)
+        chunk[frame_axis] = 1
+    while int(np.prod(chunk)) * itemsize > chunk_size and max(chunk) > 1:
+        largest = max(range(len(chunk)), key=lambda axis: chunk[axis])
+        chunk[largest] = math.ceil(chunk[largest] / 2)
+    if frame_axis is not None:
+        frames = chunk_size // (int(np.prod(chunk)) * itemsize)
+        chunk[frame_axis] = max(1, min(max(shape[frame_axis], 1), frames))
+    return tuple(chunk)
+
+
+def shuffle_bytes(buffer: bytes, itemsize: int) -> bytes:
+    """Applies the HDF5 shuffle filter: the first bytes of all elements, then the second..."""
+    if itemsize == 1:
+        return buffer
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(-1, itemsize).T.tobytes()
+
+
+def compress_chunk(chunk: np.ndarray, chunk_shape: tuple, options: dict) -> bytes:
+    """Compresses a chunk as the shuffle and deflate filters of HDF5 do.
+
+    Chunks at the edges of the dataset are padded to the full chunk shape with the fill value.
+    """
+    if chunk.shape != chunk_shape:
+        padded = np.full(chunk_shape, options.get("fillvalue") or 0, dtype=chunk.dtype)
+        padded[tuple(slice(0, dim) for dim in chunk.shape)] = chunk
+        chunk = padded
+    buffer = np.ascontiguousarray(chunk).tobytes()
+    if options.get("shuffle"):
+        buffer = shuffle_bytes(buffer, chunk.dtype.itemsize)
+    return zlib.compress(buffer, options.get("compression_opts", 4))
+
+
+def write_chunks_in_parallel(grp: h5py.Group, name: str, value: np.ndarray, options: dict,
+                             threads: int) -> h5py.Dataset:
+    """Creates a gzip compressed dataset, compressing its chunks in a pool of threads.
+
+    The chunks are written in order from the calling thread. At most a few chunks per thread
+    are held compressed in memory at a time.
+    """
+    options = dict(options)
+    if not isinstance(options.get("chunks"), tuple):
+        options["chunks"] = get_chunk_shape(value.shape, value.dtype.itemsize)
+    dataset = grp.create_dataset(name, shape=value.shape, dtype=value.dtype, **options)
+    chunk_shape = dataset.chunks
+    offsets = itertools.product(*(range(0, dim, chunk)
+                                  for dim, chunk in zip(value.shape, chunk_shape)))
+
+    def compress(offset):
+        chunk = value[tuple(slice(start, start + size)
+                            for start, size in zip(offset, chunk_shape))]
+        return offset, compress_chunk(chunk, chunk_shape, options)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        while True:
+            window = list(itertools.islice(offsets, threads * 4))
+            if not window:
+                break
+            for offset, compressed in executor.map(compress, window):
+                dataset.id.write_direct_chunk(offset, compressed)
+    return dataset
+
+
+def write_lazy_value(grp: h5py.Group, name: str, value: LazyValue, options: dict,
+                     buffer_size: int = BUFFER_SIZE) -> h5py.Dataset:
+    """Creates a dataset for a lazy value and fills it slab by slab.
+
+    Small slabs are gathered in a buffer of at most buffer_size bytes (and at least one frame)
+    before they are written, larger ones are written as they come. Datasets of unknown length
+    are resized as they are filled.
+    """
+    options = dict(options)
+    frame_shape = value.shape[1:]
+    resizable = value.shape[0] is None
+    if resizable:
+        options["maxshape"] = (None, *frame_shape)
+        if not options.get("chunks"):  # resizable datasets need chunks
+            options["chunks"] = get_chunk_shape((UNKNOWN_LENGTH, *frame_shape),
+                                                value.dtype.itemsize)
+    dataset = grp.create_dataset(name, shape=(0 if resizable else value.shape[0], *frame_shape),
+                                 dtype=value.dtype, **options)
+
+    frame_size = max(1, int(np.prod(frame_shape)) * value.dtype.itemsize)
+    frames = max(1, buffer_size // frame_size)
+    if not resizable:
+        frames = min(frames, max(1, value.shape[0]))
+    buffer: Optional[np.ndarray] = None  # allocated once a slab is smaller than the buffer
+    filled = 0
+    offset = 0
+
+    def write_frames(data):
+        nonlocal offset
+        if resizable:
+            dataset.resize(offset + len(data), axis=0)
+        elif offset + len(data) > value.shape[0]:
+            raise ValueError(f"The lazy value has more than the {value.shape[0]} frames "
+                             f"of its shape.")
+        dataset[offset:offset + len(data)] = data
+        offset += len(data)
+
+    for slab in value:
+        slab = np.asarray(slab)
+        if slab.shape[1:] != frame_shape:
+            raise ValueError(f"A slab of the shape {slab.shape} doesn't fit to the frames "
+                             f"of the shape {frame_shape} of the lazy value.")
+        if filled and filled + len(slab) > frames:
+            write_frames(buffer[:filled])
+            filled = 0
+        if len(slab) >= frames:
+            write_frames(slab)
+            continue
+        if buffer is None:
+            buffer = np.empty((frames, *frame_shape), dtype=value.dtype)
+        buffer[filled:filled + len(slab)] = slab
+        filled += len(slab)
+    if filled:
+        write_frames(buffer[:filled])
+    if not resizable and offset != value.shape[0]:
+        raise ValueError(f"The lazy value has {offset} frames instead of the {value.shape[0]} "
+                         f"frames of its shape.")
+    return dataset
+
+
+def is_valid_chunks(chunks) -> bool:
+    """Checks the chunks of a rule: auto, true, false (or none) or a chunk shape."""
+    if chunks in (None, True, False, "auto"):
+        return True
+    return isinstance(chunks, (list, tuple)) and len(chunks) > 0 \
+        and all(isinstance(chunk, int) and chunk > 0 for chunk in chunks)
+
+
+class StoragePolicy:
+    """Chooses the storage options of the datasets the Writer creates.
+
+    Args:
+        rules (list): The rules of the policy, see the module documentation.
+        reader (str): The reader the data comes from. Rules for other readers are dropped.
+        threads (int): The number of threads compressing the chunks of large gzip compressed
+            arrays, by default the number of CPUs. 1 compresses in HDF5.
+        buffer_size (int): The size in bytes of the buffer lazy values are written through.
+    """
+
+    def __init__(self, rules: List[dict] = None, reader: str = None, threads: int = None,
+                 buffer_size: int = None):
+        self.threads = threads if threads is not None else os.cpu_count() or 1
+        self.buffer_size = buffer_size if buffer_size is not None else BUFFER_SIZE
+        self.rules: List[dict] = []
+        for rule in rules or []:
+            unknown_keys = set(rule) - set(RULE_KEYS)
+            if unknown_keys:
+                raise ValueError(f"Unknown keys in the storage policy rule {rule}: "
+                                 f"{', '.join(sorted(unknown_keys))}. "
+                                 f"Use {', '.join(RULE_KEYS)}.")
+            if not is_valid_chunks(rule.get("chunks")):
+                raise ValueError(f"The chunks of the storage policy rule {rule} should be "
+                                 f"auto, true, false or a list of positive ints.")
+            if reader is None or rule.get("reader") in (None, reader):
+                self.rules.append(rule)
+
+    def get_rule(self, nxdl_path: str, value: Union[np.ndarray, LazyValue]) -> Optional[dict]:
+        """Returns the first rule matching the NXDL path and the size of the array."""
+        for rule in self.rules:
+            if "path" in rule and not fnmatch(nxdl_path, rule["path"]):
+                continue
+            if value.nbytes < rule.get("min_size", 0):
+                continue
+            return rule
+        return None
+
+    def get_dataset_options(self, nxdl_path: str, value, compress: bool = False) -> dict:
+        """Returns the keyword arguments for h5py's create_dataset to store the value with.
+
+        compress is True for {"compress": value} entries of the reader.
+        """
+        if isinstance(value, list) and compress:
+            value = np.asarray(value)
+        if not isinstance(value, (np.ndarray, LazyValue)) or value.ndim == 0 \
+           or value.dtype.kind in "OSU":
+            return {}
+        shape = tuple(UNKNOWN_LENGTH if dim is None else dim for dim in value.shape)
+
+        rule = self.get_rule(nxdl_path, value)
+        if rule is None:
+            if compress:
+                rule = DEFAULT_COMPRESSION
+            elif value.nbytes >= AUTO_CHUNK_SIZE:
+                rule = {"chunks": "auto"}
+            else:
+                return {}
+
+        options = {}
+        compression = rule.get("compression")
+        if compression not in (None, False, "none") and is_filter_available(compression,
+                                                                            nxdl_path):
+            options["compression"] = compression
+            if compression == "gzip" and "compression_opts" in rule:
+                options["compression_opts"] = rule["compression_opts"]
+        for name in ("shuffle", "fletcher32"):
+            if rule.get(name) and is_filter_available(name, nxdl_path):
+                options[name] = True
+        if "fillvalue" in rule:
+            options["fillvalue"] = rule["fillvalue"]
+
+        # filters need chunks
+        chunks = rule.get("chunks", "auto")
+        if chunks == "auto" or (chunks in (None, False) and options.keys() - {"fillvalue"}):
+            options["chunks"] = get_chunk_shape(shape, value.dtype.itemsize,
+                                                rule.get("frame_axis", 0))
+        elif chunks is True:
+            options["chunks"] = True
+        elif chunks not in (None, False):
+            if len(chunks) != len(shape):
+                raise ValueError(f"The chunks {chunks} of the storage policy rule {rule} don't "
+                                 f"fit to the {len(shape)} dimensions of {nxdl_path}.")
+            options["chunks"] = tuple(min(max(dim, 1), chunk)
+                                      for dim, chunk in zip(shape, chunks))
+        return options
+
+    def create_dataset(self, grp: h5py.Group, name: str, value, nxdl_path: str,
+                       compress: bool = False) -> h5py.Dataset:
+        """Creates a dataset for the value with the options of the policy.
+
+        Memory-mapped arrays are copied in slabs, compressed ones in chunks (both in bounded
+        memory), other arrays are written at once.
+        """
+        if isinstance(value, memoryview):
+            value = np.asarray(value)
+        options = self.get_dataset_options(nxdl_path, value, compress)
+        if isinstance(value, LazyValue):
+            return write_lazy_value(grp, name, value, options, self.buffer_size)
+        if self.threads > 1 \
+           and options.get("compression") == "gzip" and not options.get("fletcher32") \
+           and isinstance(value, np.ndarray) and value.nbytes >= PARALLEL_COMPRESSION_SIZE:
+            return write_chunks_in_parallel(grp, name, value, options, self.threads)
+        if isinstance(value, np.ndarray) and value.ndim and value.nbytes > self.buffer_size \
+           and is_memory_mapped(value):
+            return write_lazy_value(grp, name, LazyValue.from_array(value, self.buffer_size),
+                                    options, self.buffer_size)
+        return grp.create_dataset(name, data=value, **options)
+
+
+def load_storage_policy(file_name: str, reader: str = None) -> StoragePolicy:
+    """Loads a storage policy from a YAML or JSON file with a list of rules under storage
+    (and optionally the number of compression threads and the buffer size)."""
+    with open(file_name, "r") as policy_file:
+        policy = yaml.safe_load(policy_file)
+    if isinstance(policy, dict):
+        return StoragePolicy(policy.get("storage", []), reader, policy.get("threads"),
+                             policy.get("buffer_size"))
+    return StoragePolicy(policy, reader)
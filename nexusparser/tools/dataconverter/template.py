@@ -19,31 +19,195 @@
 
 import copy
 import json
+from collections.abc import MutableMapping, ValuesView
 
 from nexusparser.tools.dataconverter import helpers
 
+OPTIONALITIES = ("optional", "recommended", "required", "undocumented")
+
+
+def rename_links(value, old_name: str, new_name: str):
+    """Returns the value with the internal links into the entry old_name renamed."""
+    if not isinstance(value, dict) or "link" not in value:
+        return value
+
+    def rename(link):
+        if ":" not in link and link.startswith(f"/{old_name}/"):
+            return f"/{new_name}/{link[len(old_name) + 2:]}"
+        return link
+
+    links = value["link"]
+    return {**value, "link": [rename(link) for link in links] if isinstance(links, list)
+            else rename(links)}
+
+
+class CopyOnWriteStore(MutableMapping):
+    """A dictionary which can be cloned in O(1).
+
+    The content is a chain of frozen layers, which clones share, and the changes of this
+    store on top of them. Deletions are recorded as DELETED in the changes. Cloning freezes
+    the changes as a new layer. Layers at least half as large as the layer below them are
+    merged into a new layer, so that the chain has O(log n) layers and each path is copied
+    O(log n) times: cloning costs O(1) amortized over the paths set since the last clone.
+
+    Only the mapping is copied on write, the values are shared: a list, dict or array
+    changed in place in one clone changes in all of them. Set a new value instead.
+    """
+
+    DELETED = object()
+
+    def __init__(self, base: dict = None, layers: tuple = None, length: int = None):
+        self.layers: tuple = layers if layers is not None else (base,) if base else ()
+        self.changes: dict = {}
+        self.length: int = length if length is not None else len(base or {})
+
+    def clone(self) -> 'CopyOnWriteStore':
+        """Returns a copy sharing the current content with this store."""
+        if self.changes:
+            layers = self.layers + (self.changes,)
+            while len(layers) > 1 and 2 * len(layers[-1]) >= len(layers[-2]):
+                merged = {**layers[-2], **layers[-1]}
+                if len(layers) == 2:  # nothing left to delete below
+                    merged = {k: v for k, v in merged.items() if v is not self.DELETED}
+                layers = layers[:-2] + (merged,)
+            self.layers, self.changes = layers, {}
+        return CopyOnWriteStore(layers=self.layers, length=self.length)
+
+    def _lookup(self, k):
+        if k in self.changes:
+            return self.changes[k]
+        for layer in reversed(self.layers):
+            if k in layer:
+                return layer[k]
+        return self.DELETED
+
+    def __getitem__(self, k):
+        value = self._lookup(k)
+        if value is self.DELETED:
+            raise KeyError(k)
+        return value
+
+    def __setitem__(self, k, v):
+        if k not in self:
+            self.length += 1
+        self.changes[k] = v
+
+    def __delitem__(self, k):
+        if k not in self:
+            raise KeyError(k)
+        if any(k in layer for layer in self.layers):
+            self.changes[k] = self.DELETED
+        else:
+            del self.changes[k]
+        self.length -= 1
+
+    def __contains__(self, k):
+        return self._lookup(k) is not self.DELETED
+
+    def __iter__(self):
+        if not self.changes and len(self.layers) == 1:
+            yield from self.layers[0]
+            return
+        seen: set = set()
+        for layer in self.layers + (self.changes,):
+            for k in layer:
+                if k not in seen:
+                    seen.add(k)
+                    if k in self:
+                        yield k
+
+    def __len__(self):
+        return self.length
+
+    def clear(self):
+        self.layers, self.changes, self.length = (), {}, 0
+
+
+class OptionalityView(MutableMapping):
+    """A live view on the paths of one optionality in a Template.
+
+    Setting a path through a view stores it with the optionality of the view,
+    moving it out of any other optionality it had before.
+    """
+
+    def __init__(self, store: CopyOnWriteStore, optionality: str):
+        self.store = store
+        self.optionality = optionality
+
+    def __getitem__(self, k):
+        optionality, value = self.store[k]
+        if optionality != self.optionality:
+            raise KeyError(k)
+        return value
+
+    def __setitem__(self, k, v):
+        self.store[k] = (self.optionality, v)
+
+    def __delitem__(self, k):
+        self.__getitem__(k)
+        del self.store[k]
+
+    def __contains__(self, k):
+        entry = self.store.get(k)
+        return entry is not None and entry[0] == self.optionality
+
+    def __iter__(self):
+        return (k for k, (optionality, _) in self.store.items()
+                if optionality == self.optionality)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return dict(self.items()).__repr__()
+
 
 class Template(dict):
-    """A Template object to control and separate template paths according to optionality"""
+    """A Template object to control and separate template paths according to optionality
+
+    All paths are kept in one store mapping each path to its (optionality, value).
+    template["optional"] etc. return live views on the paths of one optionality.
+    Template(template) clones another template in O(1) with copy on write per path. The
+    values are shared with the clone, not copied (see CopyOnWriteStore).
+    """
 
     def __init__(self, template=None, **kwargs):
         super(Template, self).__init__(**kwargs)
+        self.store = CopyOnWriteStore()
         if template is None:
-            self.optional: dict = {}
-            self.recommended: dict = {}
-            self.required: dict = {}
-            self.undocumented: dict = {}
             self.optional_parents: list = []
+        elif isinstance(template, Template):
+            self.store = template.store.clone()
+            self.optional_parents = list(template.optional_parents)
         else:
-            self.optional: dict = copy.deepcopy(template["optional"])
-            self.recommended: dict = copy.deepcopy(template["recommended"])
-            self.required: dict = copy.deepcopy(template["required"])
-            self.undocumented: dict = copy.deepcopy(template["undocumented"])
-            self.optional_parents: list = copy.deepcopy(template["optional_parents"])
+            for optionality in OPTIONALITIES:
+                for path, value in template[optionality].items():
+                    self.store[path] = (optionality, copy.deepcopy(value))
+            self.optional_parents = copy.deepcopy(template["optional_parents"])
+
+    @property
+    def optional(self) -> OptionalityView:
+        """The optional paths of the template"""
+        return OptionalityView(self.store, "optional")
+
+    @property
+    def recommended(self) -> OptionalityView:
+        """The recommended paths of the template"""
+        return OptionalityView(self.store, "recommended")
+
+    @property
+    def required(self) -> OptionalityView:
+        """The required paths of the template"""
+        return OptionalityView(self.store, "required")
+
+    @property
+    def undocumented(self) -> OptionalityView:
+        """The paths of the template which are not documented in the NXDL"""
+        return OptionalityView(self.store, "undocumented")
 
     def get_accumulated_dict(self):
         """Returns a dictionary of all the optionalities merged into one."""
-        return {**self.optional, **self.recommended, **self.required, **self.undocumented}
+        return {path: value for path, (_, value) in self.store.items()}
 
     def __repr__(self):
         """Returns a unique string representation for the Template object."""
@@ -62,48 +226,56 @@ class Template(dict):
     def __setitem__(self, k, v):
         """Handles how values are set within the Template object."""
         if k.startswith("/"):
-            if k in self.recommended:
-                self.recommended[k] = v
-            elif k in self.required:
-                self.required[k] = v
-            elif k in self.optional:
-                self.optional[k] = v
-            else:
-                self.undocumented[k] = v
+            optionality = self.store[k][0] if k in self.store else "undocumented"
+            self.store[k] = (optionality, v)
         else:
             raise KeyError("You cannot add non paths to the root template object. "
                            "Place them appropriately e.g. template[\"optional\"]"
                            "[\"/ENTRY[entry]/data/path\"]")
 
+    def __delitem__(self, k):
+        del self.store[k]
+
+    def __contains__(self, k):
+        return k in self.store
+
+    def __len__(self):
+        return len(self.store)
+
     def keys(self):
-        """Returns the list of keys stored in the Template object."""
-        return list(self.optional.keys()) + \
-            list(self.recommended.keys()) + \
-            list(self.required.keys()) + \
-            list(self.undocumented.keys())
+        """Returns a live view of the paths stored in the Template object."""
+        return self.store.keys()
 
     def items(self):
-        """Returns a list of tuples of key, value stored in the Template object."""
-        return sorted(self.get_accumulated_dict().items())
+        """Returns a list of tuples of path, value stored in the Template object, sorted by
+        path."""
+        return sorted(((path, value) for path, (_, value) in self.store.items()),
+                      key=lambda item: item[0])
+
+    def values(self):
+        """Returns a live view of the values stored in the Template object."""
+        return ValuesView(self)
+
+    def get(self, k, default=None):
+        """Returns the value of a path or the default if the path is not in the template."""
+        try:
+            return self[k]
+        except KeyError:
+            return default
 
     def __iter__(self):
-        return dict.__iter__(self.get_accumulated_dict())
+        return iter(self.store)
 
     def get_optionality(self, optionality):
         """Returns the dictionary for given optionality"""
-        if optionality == "optional":
-            return self.optional
-        if optionality == "recommended":
-            return self.recommended
-        if optionality == "required":
-            return self.required
-        if optionality == "undocumented":
-            return self.undocumented
+        if optionality in OPTIONALITIES:
+            return OptionalityView(self.store, optionality)
         return self.required
 
     def get_documented(self):
         """Returns a dictionary of all the optionalities merged into one."""
-        return {**self.optional, **self.recommended, **self.required}
+        return {path: value for path, (optionality, value) in self.store.items()
+                if optionality != "undocumented"}
 
     def __getitem__(self, k):
         """Handles how values are accessed from the Template object."""
@@ -111,40 +283,32 @@ class Template(dict):
         if k == "optional_parents":
             return self.optional_parents
         if k.startswith("/"):
-            try:
-                return self.optional[k]
-            except KeyError:
-                try:
-                    return self.recommended[k]
-                except KeyError:
-                    try:
-                        return self.required[k]
-                    except KeyError:
-                        return self.undocumented[k]
+            return self.store[k][1]
         return self.get_optionality(k)
 
     def clear(self):
         """Clears all data stored in the Template object."""
-        for del_dict in (self.optional, self.recommended, self.required, self.undocumented):
-            del_dict.clear()
+        self.store.clear()
 
     def rename_entry(self, old_name: str, new_name: str, deepcopy=True):
-        """Rename all entries under old name to new name."""
-        for internal_dict in (self.optional, self.recommended, self.required, self.undocumented):
-            keys = list(internal_dict.keys())
-            for key in keys:
-                entry_name = helpers.get_name_from_data_dict_entry(key.split("/")[1])
+        """Rename all entries under old name to new name.
+
+        Internal links into the renamed entry are renamed along. Paths outside of an
+        entry, like /@default, are kept.
+        """
+        for key, (optionality, value) in list(self.store.items()):
+            entry_name = helpers.get_name_from_data_dict_entry(key.split("/")[1])
 
-                entry_search_term = f"{entry_name}]"
+            entry_search_term = f"{entry_name}]"
+            if entry_name == old_name and entry_search_term in key:
                 rest_of_path = key[key.index(entry_search_term) + len(entry_search_term):]
-                if entry_name == old_name:
-                    value = internal_dict[key] if deepcopy else None
-                    internal_dict[f"/ENTRY[{new_name}]{rest_of_path}"] = value
-                    del internal_dict[key]
+                del self.store[key]
+                self.store[f"/ENTRY[{new_name}]{rest_of_path}"] = \
+                    (optionality, rename_links(value, old_name, new_name) if deepcopy else None)
 
     def update(self, template):
         """Merges second template to original"""
-        for optionality in ("optional", "recommended", "required", "undocumented"):
+        for optionality in OPTIONALITIES:
             self.get_optionality(optionality).update(template.get_optionality(optionality))
 
     def add_entry(self, entry_name):
@@ -0,0 +1,205 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Manifests of conversions, which tell whether an output file is up to date.
+
+A manifest records what an output was converted from: the content hash, size and
+modification time of each input file, the reader and a hash of its code, a hash of the
+data converter's code, the NXDL and the hash of the definitions (see
+nxdl_plan.get_definition_hash) and the parameters of the conversion. It is kept as JSON in
+the root attribute dataconverter_manifest of the output file ("attrs") or in the sidecar
+file <output>.manifest.json ("sidecar").
+
+An output is up to date if the manifest recorded for its entry matches the one of the
+conversion at hand. Input files whose size and modification time are unchanged are not
+read again. Files that were only touched are hashed and compared by their content.
+"""
+
+from glob import glob
+import hashlib
+import importlib.util
+import json
+import logging
+import os
+from typing import Optional, Sequence
+
+from nexusparser.tools import hdf5_access
+
+logger = logging.getLogger(__name__)  # pylint: disable=C0103
+
+MANIFEST_VERSION = 1
+MANIFEST_ATTRIBUTE = "dataconverter_manifest"
+MANIFEST_LOCATIONS = ("attrs", "sidecar")
+
+# the size of the blocks input files are hashed in
+BLOCK_SIZE = 2 ** 20
+
+_code_hashes: dict = {}
+
+
+def hash_file(file_name: str) -> str:
+    """Returns the SHA-256 of the content of a file, read in blocks."""
+    sha = hashlib.sha256()
+    with open(file_name, "rb") as file:
+        for block in iter(lambda: file.read(BLOCK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def hash_code(directory: str, pattern: str = "**/*.py") -> str:
+    """Returns a hash of the Python files in a directory, by their paths and contents.
+
+    The code is hashed once per process, as the process keeps running the code it has loaded.
+    """
+    if (directory, pattern) in _code_hashes:
+        return _code_hashes[directory, pattern]
+    sha = hashlib.sha256()
+    for file_name in sorted(glob(os.path.join(directory, pattern), recursive=True)):
+        if f"{os.sep}__pycache__{os.sep}" in file_name:
+            continue
+        sha.update(os.path.relpath(file_name, directory).encode())
+        with open(file_name, "rb") as file:
+            sha.update(file.read())
+    _code_hashes[directory, pattern] = sha.hexdigest()
+    return _code_hashes[directory, pattern]
+
+
+def hash_module_code(module_name: str) -> Optional[str]:
+    """Hashes the code of the package folder of a module, without importing the module."""
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or spec.origin is None:
+        return None
+    return hash_code(os.path.dirname(spec.origin))
+
+
+def describe_input(file_name: str) -> dict:
+    """Returns the path, size, modification time and content hash of an input file."""
+    stat = os.stat(file_name)
+    return {"path": os.path.abspath(file_name), "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns, "sha256": None}
+
+
+def make_manifest(input_files: Sequence[str], reader: str, reader_module: str, nxdl: str,
+                  nxdl_hash: str, params: dict) -> dict:
+    """Returns the manifest of a conversion. The contents of the inputs are hashed later,
+    only if needed (see inputs_match and hash_inputs)."""
+    return {
+        "version": MANIFEST_VERSION,
+        "inputs": [describe_input(file_name) for file_name in input_files],
+        "reader": reader,
+        "reader_hash": hash_module_code(reader_module.partition(":")[0]),
+        "converter_hash": hash_code(os.path.dirname(__file__), "*.py"),
+        "nxdl": nxdl,
+        "nxdl_hash": nxdl_hash,
+        "params": params,
+    }
+
+
+def hash_inputs(manifest: dict):
+    """Hashes the content of the inputs of the manifest not hashed yet."""
+    for file in manifest["inputs"]:
+        if file["sha256"] is None:
+            file["sha256"] = hash_file(file["path"])
+
+
+def inputs_match(manifest: dict, recorded: dict) -> bool:
+    """Checks whether the inputs of a manifest are those of the recorded manifest.
+
+    Inputs with the recorded size and modification time are taken for unchanged. The others
+    are hashed and compared by content.
+    """
+    if [(file["path"], file["size"]) for file in manifest["inputs"]] != \
+       [(file["path"], file["size"]) for file in recorded["inputs"]]:
+        return False
+    for file, recorded_file in zip(manifest["inputs"], recorded["inputs"]):
+        if file["mtime_ns"] == recorded_file["mtime_ns"]:
+            file["sha256"] = recorded_file["sha256"]
+        elif hash_file(file["path"]) != recorded_file["sha256"]:
+            return False
+        else:
+            file["sha256"] = recorded_file["sha256"]
+    return True
+
+
+def get_sidecar_path(output: str) -> str:
+    """Returns the path of the sidecar file keeping the manifests of an output file."""
+    return f"{output}.manifest.json"
+
+
+def load_manifests(output: str, location: str) -> dict:
+    """Returns the manifests recorded for an output file by its entries, or an empty dict."""
+    if not os.path.exists(output):
+        return {}
+    try:
+        if location == "sidecar":
+            with open(get_sidecar_path(output), "r") as sidecar:
+                return json.load(sidecar)
+        with hdf5_access.open_file(output, "r") as output_file:
+            manifests = output_file.attrs.get(MANIFEST_ATTRIBUTE)
+        return json.loads(manifests) if manifests is not None else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifests(output: str, location: str, manifests: dict):
+    """Records the manifests of an output file by its entries."""
+    if location == "sidecar":
+        with open(get_sidecar_path(output), "w") as sidecar:
+            json.dump(manifests, sidecar, indent=2)
+        return
+    with hdf5_access.open_file(output, "a") as output_file:
+        output_file.attrs[MANIFEST_ATTRIBUTE] = json.dumps(manifests)
+
+
+def discard_manifests(output: str, location: str):
+    """Removes the sidecar of an output file, before the output is overwritten.
+
+    A manifest in the root attributes is overwritten with the output itself.
+    """
+    if location == "sidecar" and os.path.exists(get_sidecar_path(output)):
+        os.remove(get_sidecar_path(output))
+
+
+def is_up_to_date(manifest: dict, output: str, location: str, entry: str = "") -> bool:
+    """Checks whether the output has been converted as the manifest describes.
+
+    The content hashes of the inputs are taken over from the recorded manifest when it
+    matches, so that the manifest can be recorded again without reading the inputs.
+    """
+    recorded = load_manifests(output, location).get(entry)
+    if recorded is None or recorded.get("version") != MANIFEST_VERSION:
+        return False
+    for key in ("reader", "reader_hash", "converter_hash", "nxdl", "nxdl_hash", "params"):
+        if manifest[key] != recorded.get(key):
+            logger.debug("The %s of %s has changed.", key, output)
+            return False
+    return inputs_match(manifest, recorded)
+
+
+def record_manifest(manifest: dict, output: str, location: str, entry: str = "",
+                    append: bool = False):
+    """Records the manifest of a conversion of the entry (all entries if empty) of the output.
+
+    When appending, the manifests of the other entries are kept.
+    """
+    hash_inputs(manifest)
+    manifests = load_manifests(output, location) if append else {}
+    manifests[entry] = manifest
+    try:
+        save_manifests(output, location, manifests)
+    except OSError as exception:
+        logger.warning("The manifest of %s could not be recorded: %s", output, exception)
@@ -17,29 +17,27 @@
 #
 """The writer class for writing a Nexus file in accordance with a given NXDL."""
 
-import copy
 import logging
+import os
 import sys
-import xml.etree.ElementTree as ET
+from typing import Tuple
 
 import h5py
 import numpy as np
 
 from nexusparser.tools.dataconverter import helpers
-from nexusparser.tools import nexus
+from nexusparser.tools.dataconverter.storage import StoragePolicy
+from nexusparser.tools.dataconverter.template import Template
+from nexusparser.tools import hdf5_access
 
 logger = logging.getLogger(__name__)  # pylint: disable=C0103
 logger.setLevel(logging.INFO)
 logger.addHandler(logging.StreamHandler(sys.stdout))
 
 
-def does_path_exist(path, h5py_obj) -> bool:
-    """Returns true if the requested path exists in the given h5py object."""
-    try:
-        h5py_obj[helpers.convert_data_dict_path_to_hdf5_path(path)]  # pylint: disable=W0106
-        return True
-    except KeyError:
-        return False
+def get_parent_path(path: str) -> str:
+    """Returns the path of the parent of a data converter or HDF5 path."""
+    return path[0:path.rindex('/')] or '/'
 
 
 def is_not_data_empty(value) -> bool:
@@ -81,56 +79,151 @@ If multiple datasets are provided, the function returns two lists"""
     return file, path
 
 
-def handle_shape_entries(data, file, path):
-    """slice generation via the key shape"""
+def open_external_link(grp, name):
+    """Opens the target of an external link read-only.
+
+    HDF5 would open the linked file with the access flags of the output file, for writing,
+    and lock it against other conversions linking the same file.
+    """
+    lapl = h5py.h5p.create(h5py.h5p.LINK_ACCESS)
+    lapl.set_elink_acc_flags(h5py.h5f.ACC_RDONLY)
+    obj_id = h5py.h5o.open(grp.id, name.encode(), lapl=lapl)
+    if isinstance(obj_id, h5py.h5g.GroupID):
+        return h5py.Group(obj_id)
+    return h5py.Dataset(obj_id)
+
+
+class SourceFiles:
+    """Pool of the source files of virtual datasets and links during one write.
+
+    Each source file is opened once and the shape and dtype of each source dataset are read
+    once. The output file itself is used through its open handle. All opened files are
+    closed by close() or at the end of a with block.
+    """
+
+    def __init__(self, output_path: str = None, output_nexus: h5py.File = None):
+        self.output_path = os.path.realpath(output_path) if output_path else None
+        self.output_nexus = output_nexus
+        self.files: dict = {}
+        self.datasets: dict = {}
+
+    def get_file(self, file) -> h5py.File:
+        """Returns the open source file."""
+        file_path = os.path.realpath(file)
+        if file_path == self.output_path and self.output_nexus is not None:
+            return self.output_nexus
+        if file_path not in self.files:
+            self.files[file_path] = hdf5_access.open_file(file, 'r')
+        return self.files[file_path]
+
+    def get_dataset_info(self, file, path) -> Tuple[tuple, np.dtype]:
+        """Returns the shape and the dtype of a source dataset."""
+        key = (os.path.realpath(file), path)
+        if key not in self.datasets:
+            dataset = self.get_file(file)[path]
+            self.datasets[key] = (dataset.shape, dataset.dtype)
+        return self.datasets[key]
+
+    def get_shape(self, file, path) -> tuple:
+        """Returns the shape of a source dataset."""
+        return self.get_dataset_info(file, path)[0]
+
+    def close(self):
+        """Closes all source files opened by the pool."""
+        for source in self.files.values():
+            source.close()
+        self.files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def get_layout_dtype(data, dtypes: list) -> np.dtype:
+    """Returns the dtype of a virtual layout over sources of the given dtypes.
+
+    A dtype given by the reader (data['dtype']) is used as it is. Sources of different numeric
+    dtypes are promoted to a common dtype, other mixed dtypes are rejected.
+    """
+    if 'dtype' in data:
+        return np.dtype(data['dtype'])
+    if all(dtype == dtypes[0] for dtype in dtypes):
+        return dtypes[0]
+    if all(dtype.kind in "biuf" for dtype in dtypes):
+        dtype = np.result_type(*dtypes)
+        logger.info("Virtual dataset sources of the dtypes %s are promoted to %s.",
+                    ", ".join(str(dtype) for dtype in dtypes), dtype)
+        return dtype
+    raise ValueError(f"Virtual dataset sources of the dtypes "
+                     f"{', '.join(str(dtype) for dtype in dtypes)} can't be combined. "
+                     f"Please give the dtype of the virtual dataset with the key dtype.")
+
+
+def handle_shape_entries(data, file, path, sources: SourceFiles = None):
+    """slice generation via the key shape
+
+The layout takes the dtype of the source dataset (or data['dtype'])."""
+    if sources is None:
+        with SourceFiles() as new_sources:
+            return handle_shape_entries(data, file, path, new_sources)
+    source_shape, source_dtype = sources.get_dataset_info(file, path)
     new_shape = []
     for dim, val in enumerate(data['shape']):
         if isinstance(val, slice):
-            start = val.start if val.start is not None else 0
-            stop = val.stop if val.stop is not None else h5py.File(file, 'r')[path].shape[dim]
-            step = val.step if val.step is not None else 1
-            new_shape.append(int((stop - start) / step))
+            new_shape.append(len(range(*val.indices(source_shape[dim]))))
     if not new_shape:
         new_shape = [1]
     layout = h5py.VirtualLayout(shape=tuple(new_shape),
-                                dtype=np.float64)
+                                dtype=get_layout_dtype(data, [source_dtype]))
     vsource = h5py.VirtualSource(file,
                                  path,
-                                 shape=h5py.File(file, 'r')[path].shape
+                                 shape=source_shape
                                  )[data['shape']]
     layout[:] = vsource
     return layout
 
 
-def handle_dicts_entries(data, grp, entry_name, output_path):
+def handle_dicts_entries(data, grp, entry_name, output_path, storage_policy=None,  # pylint: disable=too-many-arguments
+                         nxdl_path='', sources: SourceFiles = None):
     """Handle function for dictionaries found as value of the nexus file.
 
 Several cases can be encoutered:
 - Data to slice and place in virtual datasets
 - Concatenate dataset in one virtual dataset
+  (virtual datasets take the dtype of their sources, see get_layout_dtype)
 - Internal links
 - External links
-- compression label
+- compression label (compressed as the storage policy chooses)
 """
     if 'link' in data:
         file, path = split_link(data, output_path)
     # generate virtual datasets from slices
     if 'shape' in data.keys():
-        layout = handle_shape_entries(data, file, path)
+        layout = handle_shape_entries(data, file, path, sources)
         grp.create_virtual_dataset(entry_name, layout)
     # multiple datasets to concatenate
     elif 'link' in data.keys() and isinstance(data['link'], list):
+        if sources is None:
+            with SourceFiles(output_path, grp.file) as new_sources:
+                return handle_dicts_entries(data, grp, entry_name, output_path, storage_policy,
+                                            nxdl_path, new_sources)
         total_length = 0
-        sources = []
+        vsources = []
+        dtypes = []
         for index, source_file in enumerate(file):
+            source_shape, source_dtype = sources.get_dataset_info(source_file, path[index])
             vsource = h5py.VirtualSource(source_file,
                                          path[index],
-                                         shape=h5py.File(source_file, 'r')[path[index]].shape)
+                                         shape=source_shape)
             total_length += vsource.shape[0]
-            sources.append(vsource)
-        layout = h5py.VirtualLayout(shape=total_length, dtype=np.float64)
+            vsources.append(vsource)
+            dtypes.append(source_dtype)
+        layout = h5py.VirtualLayout(shape=(total_length, *vsources[0].shape[1:]),
+                                    dtype=get_layout_dtype(data, dtypes))
         offset = 0
-        for vsource in sources:
+        for vsource in vsources:
             layout[offset:offset + vsource.shape[0]] = vsource
             offset += vsource.shape[0]
         grp.create_virtual_dataset(entry_name, layout, fillvalue=0)
@@ -140,15 +233,11 @@ Several cases can be encoutered:
             grp[entry_name] = h5py.SoftLink(path)  # internal link
         else:
             grp[entry_name] = h5py.ExternalLink(file, path)  # external link
+            return open_external_link(grp, entry_name)
     elif 'compress' in data.keys():
-        if not (isinstance(data["compress"], str) or np.isscalar(data["compress"])):
-            grp.create_dataset(entry_name,
-                               data=data["compress"],
-                               compression="gzip",
-                               chunks=True,
-                               compression_opts=9)
-        else:
-            grp.create_dataset(entry_name, data=data["compress"])
+        if storage_policy is None:
+            storage_policy = StoragePolicy()
+        storage_policy.create_dataset(grp, entry_name, data["compress"], nxdl_path, compress=True)
     return grp[entry_name]
 
 
@@ -156,27 +245,43 @@ class Writer:
     """The writer class for writing a Nexus file in accordance with a given NXDL.
 
     Args:
-        data (dict): Dictionary containing the data to convert.
+        data (Template): Template containing the data to convert.
         nxdl_path (str): Path to the nxdl file to use during conversion.
         output_path (str): Path to the output Nexus file.
+        storage_policy (StoragePolicy): Chooses chunking, compression and filters of datasets.
+        append (bool): Adds the entries of the data to an existing output file instead of
+            overwriting it. The entries must not exist in the file yet.
+        plan (dict): The plan of the NXDL (see nxdl_plan), whose NXDL groups are used and
+            completed. Without a plan, the NXDL file is parsed.
 
     Attributes:
-        data (dict): Dictionary containing the data to convert.
+        data (Template): Template containing the data to convert.
         nxdl_path (str): Path to the nxdl file to use during conversion.
         output_path (str): Path to the output Nexus file.
         output_nexus (h5py.File): The h5py file object to manipulate output file.
-        nxdl_data (dict): Stores xml data from given nxdl file to use during conversion.
-        nxs_namespace (str): The namespace used in the NXDL tags. Helps search for XML children.
+        storage_policy (StoragePolicy): Chooses chunking, compression and filters of datasets.
+        plan (dict): The plan of the NXDL, or one holding only what the writer looked up.
+        nxdl_groups (dict): Caches the NXDL attributes (without name) and the names of the
+            NXDL attribute children of the group at each NXDL path, in the plan.
+        append (bool): Whether the data is added to an existing output file.
     """
 
-    def __init__(self, data: dict = None, nxdl_path: str = None, output_path: str = None):
+    def __init__(self, data: Template = None, nxdl_path: str = None, output_path: str = None,
+                 storage_policy: StoragePolicy = None, append: bool = False,
+                 plan: dict = None):
         """Constructs the necessary objects required by the Writer class."""
         self.data = data
         self.nxdl_path = nxdl_path
         self.output_path = output_path
-        self.output_nexus = h5py.File(self.output_path, "w")
-        self.nxdl_data = ET.parse(self.nxdl_path).getroot()
-        self.nxs_namespace = get_namespace(self.nxdl_data)
+        self.storage_policy = storage_policy if storage_policy is not None else StoragePolicy()
+        self.append = append
+        self.plan: dict = plan if plan is not None else {"nxdl_path": nxdl_path}
+        self.nxdl_groups: dict = self.plan.setdefault("groups", {})
+        self.output_nexus = hdf5_access.open_file(self.output_path, "a" if append else "w")
+
+    def resolve_nxdl_groups(self, nxdl_paths):
+        """Caches the NXDL attributes of all given groups not cached yet, resolved together."""
+        helpers.resolve_nxdl_groups(nxdl_paths, None, self.plan)
 
     def __nxdl_to_attrs(self, path: str = '/') -> dict:
         """
@@ -184,68 +289,170 @@ class Writer:
         the required attribute values that were requested in the NXDL from the data.
         """
         nxdl_path = helpers.convert_data_converter_dict_to_nxdl_path(path)
-        elem = copy.deepcopy(nexus.get_node_at_nxdl_path(nxdl_path, elem=self.nxdl_data))
-        if elem is None:
+        self.resolve_nxdl_groups([nxdl_path])
+        if self.nxdl_groups[nxdl_path] is None:
             raise Exception(f"Attributes were not found for {path}. "
                             "Please check this entry in the template dictionary.")
-
-        # Remove the name attribute as we only use it to name the HDF5 entry
-        if "name" in elem.attrib.keys():
-            del elem.attrib["name"]
+        attrs, attr_names = self.nxdl_groups[nxdl_path]
+        attrs = dict(attrs)
 
         # Fetch values for required attributes requested by the NXDL
-        for attr_name in elem.findall(f"{self.nxs_namespace}attribute"):
-            elem.attrib[attr_name.get('name')] = self.data[f"{path}/@{attr_name.get('name')}"] or ''
-
-        return elem.attrib
-
-    def ensure_and_get_parent_node(self, path: str, undocumented_paths) -> h5py.Group:
-        """Returns the parent if it exists for a given path else creates the parent group."""
-        parent_path = path[0:path.rindex('/')] or '/'
-        parent_path_hdf5 = helpers.convert_data_dict_path_to_hdf5_path(parent_path)
-        parent_undocumented_paths = [path[0:path.rindex("/")] or "/" for path in undocumented_paths]
-        if not does_path_exist(parent_path, self.output_nexus):
-            parent = self.ensure_and_get_parent_node(parent_path, parent_undocumented_paths)
-            grp = parent.create_group(parent_path_hdf5)
-            if path not in undocumented_paths:
-                attrs = self.__nxdl_to_attrs(parent_path)
-                if attrs is not None:
-                    grp.attrs['NX_class'] = attrs["type"]
-            return grp
-        return self.output_nexus[parent_path_hdf5]
+        for attr_name in attr_names:
+            attrs[attr_name] = self.data[f"{path}/@{attr_name}"] or ''
 
-    def write(self):
-        """Writes the Nexus file with previously validated data from the reader with NXDL attrs."""
-        for path, value in self.data.items():
+        return attrs
+
+    def get_group_tree(self) -> dict:
+        """Returns the groups to create for the data, computed in one pass over the sorted paths.
+
+        The HDF5 path of each group maps to its data converter path (None if the group is
+        undocumented, so it gets no NX_class) and the first data path leading to it.
+        """
+        undocumented_parents = [set(self.data.undocumented.keys())]
+        nodes = {"/"}
+        groups: dict = {}
+        for path, value in sorted(self.data.items()):
+            if path[path.rindex('/') + 1:] == '@units' or not is_not_data_empty(value):
+                continue
+            new_groups: list = []
+            child_path = path
+            while True:
+                parent_path = get_parent_path(child_path)
+                parent_path_hdf5 = helpers.convert_data_dict_path_to_hdf5_path(parent_path)
+                if parent_path_hdf5 in nodes:
+                    break
+                level = len(new_groups)
+                if level == len(undocumented_parents):
+                    undocumented_parents.append(set(map(get_parent_path,
+                                                        undocumented_parents[-1])))
+                documented = child_path not in undocumented_parents[level]
+                new_groups.append((parent_path_hdf5, parent_path if documented else None))
+                child_path = parent_path
+            for parent_path_hdf5, parent_path in reversed(new_groups):
+                groups[parent_path_hdf5] = (parent_path, path)
+                nodes.add(parent_path_hdf5)
+            if helpers.get_name_from_data_dict_entry(path[path.rindex('/') + 1:])[0] != "@":
+                nodes.add(helpers.convert_data_dict_path_to_hdf5_path(path))
+        return groups
+
+    def create_groups(self) -> dict:
+        """Creates all groups of the data once and returns their handles by HDF5 path."""
+        handles = {"/": self.output_nexus}
+        groups = self.get_group_tree()
+        if self.append:
+            existing = [path_hdf5 for path_hdf5 in groups
+                        if get_parent_path(path_hdf5) == "/" and path_hdf5 in self.output_nexus]
+            if existing:
+                raise Exception(f"The groups {', '.join(sorted(existing))} already exist in "
+                                f"{self.output_path}. Only new entries can be appended.")
+        self.resolve_nxdl_groups(helpers.convert_data_converter_dict_to_nxdl_path(nxdl_attrs_path)
+                                 for nxdl_attrs_path, _ in groups.values()
+                                 if nxdl_attrs_path is not None)
+        for path_hdf5, (nxdl_attrs_path, path) in sorted(groups.items()):
             try:
-                if path[path.rindex('/') + 1:] == '@units':
-                    continue
+                grp = handles[get_parent_path(path_hdf5)].create_group(path_hdf5)
+                if nxdl_attrs_path is not None:
+                    attrs = self.__nxdl_to_attrs(nxdl_attrs_path)
+                    if attrs is not None:
+                        grp.attrs['NX_class'] = attrs["type"]
+                handles[path_hdf5] = grp
+            except Exception as exception:
+                raise Exception(f"Unkown error occured writing the path: {path} "
+                                f"with the following message: {str(exception)}")
+        return handles
 
-                entry_name = helpers.get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
-                if is_not_data_empty(value):
-                    data = value
-                else:
-                    continue
+    def index_data(self) -> Tuple[list, dict, dict]:
+        """Splits the data into fields, units and other attributes in one sorted pass.
+
+        Empty values are left out. Units and attributes are indexed by the path they belong to,
+        attributes as (path, attribute name, value) tuples.
+        """
+        fields = []
+        units: dict = {}
+        attributes: dict = {}
+        for path, value in sorted(self.data.items()):
+            if not is_not_data_empty(value):
+                continue
+            if path[path.rindex('/') + 1:] == '@units':
+                units[get_parent_path(path)] = value
+                continue
+            entry_name = helpers.get_name_from_data_dict_entry(path[path.rindex('/') + 1:])
+            if entry_name[0] == "@":
+                attributes.setdefault(get_parent_path(path), []).append((path, entry_name[1:],
+                                                                         value))
+            else:
+                fields.append((path, entry_name, value))
+        return fields, units, attributes
+
+    def is_external(self, node) -> bool:
+        """Checks whether a node is the target of an external link, opened read-only."""
+        return node.file != self.output_nexus
+
+    def write_fields(self, fields: list, units: dict, handles: dict, sources: SourceFiles):
+        """Writes the fields (see index_data) with their units into the created groups.
+
+        The units of external link targets are skipped, as these are opened read-only.
+        """
+        for path, entry_name, data in fields:
+            try:
+                grp = handles[helpers.convert_data_dict_path_to_hdf5_path(get_parent_path(path))]
+                nxdl_path = helpers.convert_data_converter_dict_to_nxdl_path(path)
 
-                if entry_name[0] != "@":
-                    grp = self.ensure_and_get_parent_node(path, self.data.undocumented.keys())
-
-                    if isinstance(data, dict):
-                        dataset = handle_dicts_entries(data, grp, entry_name, self.output_path)
-                    else:
-                        dataset = grp.create_dataset(entry_name,
-                                                     data=data
-                                                     )
-                    units_key = f"{path}/@units"
-                    if units_key in self.data.keys() and self.data[units_key] is not None:
-                        dataset.attrs["units"] = self.data[units_key]
-                    else:
-                        continue
+                if isinstance(data, dict):
+                    dataset = handle_dicts_entries(data, grp, entry_name, self.output_path,
+                                                   self.storage_policy, nxdl_path, sources)
                 else:
-                    dataset = self.ensure_and_get_parent_node(path, self.data.undocumented.keys())
-                    dataset.attrs[entry_name[1:]] = data
+                    dataset = self.storage_policy.create_dataset(grp, entry_name, data,
+                                                                 nxdl_path)
+                handles[helpers.convert_data_dict_path_to_hdf5_path(path)] = dataset
+                if path in units and self.is_external(dataset):
+                    logger.warning("The units of %s are not written to the file it links to.",
+                                   path)
+                elif path in units:
+                    dataset.attrs["units"] = units[path]
             except Exception as exception:
                 raise Exception(f"Unkown error occured writing the path: {path} "
                                 f"with the following message: {str(exception)}")
 
-        self.output_nexus.close()
+    def write_attributes(self, attributes: dict, handles: dict):
+        """Writes the attributes (see index_data) together for each group or field.
+
+        When appending, attributes of the root group the file already has are kept. The
+        attributes of external link targets are skipped, as these are opened read-only.
+        """
+        for parent_path, parent_attributes in attributes.items():
+            node = handles[helpers.convert_data_dict_path_to_hdf5_path(parent_path)]
+            for path, attr_name, data in parent_attributes:
+                if self.append and node is self.output_nexus and attr_name in node.attrs:
+                    logger.info("The attribute %s of the existing file is kept.", path)
+                    continue
+                if self.is_external(node):
+                    logger.warning("The attribute %s is not written to the file it links to.",
+                                   path)
+                    continue
+                try:
+                    node.attrs[attr_name] = data
+                except Exception as exception:
+                    raise Exception(f"Unkown error occured writing the path: {path} "
+                                    f"with the following message: {str(exception)}")
+
+    def write(self):
+        """Writes the Nexus file with previously validated data from the reader with NXDL attrs.
+
+        When appending fails, the groups added to the file are removed again.
+        """
+        existing = set(self.output_nexus.keys())
+        try:
+            handles = self.create_groups()
+            fields, units, attributes = self.index_data()
+            with SourceFiles(self.output_path, self.output_nexus) as sources:
+                self.write_fields(fields, units, handles, sources)
+            # attributes are written after all fields exist
+            self.write_attributes(attributes, handles)
+        except Exception:
+            if self.append:
+                for name in set(self.output_nexus.keys()) - existing:
+                    del self.output_nexus[name]
+            raise
+        finally:
+            self.output_nexus.close()
@@ -0,0 +1,95 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""HDF5 file access properties shared by the NeXus parser, the checker (tools.nexus) and
+the dataconverter writer.
+
+The properties can be given by environment variables (NEXUS_HDF5_RDCC_NBYTES, ...) or set
+from Python with set_access_config. Values set from Python take precedence."""
+
+import os
+
+import h5py
+
+# name of the property (as in h5py.File) and the type of its value
+ACCESS_PROPERTIES = {
+    'rdcc_nbytes': int,  # size of the raw data chunk cache per dataset in bytes
+    'rdcc_nslots': int,  # number of chunk slots in the raw data chunk cache hash table
+    'rdcc_w0': float,  # chunk preemption policy, 0 (least recently used) to 1 (fully read)
+    'page_buf_size': int,  # page buffer size in bytes (files are written with paging then)
+    'libver': str,  # bounds of the HDF5 library version, e.g. 'latest' or 'v110,latest'
+    'driver': str,  # file driver, e.g. 'core' to hold small files in memory
+}
+ENV_PREFIX = 'NEXUS_HDF5_'
+
+_access_config: dict = {}
+
+
+def parse_access_property(name: str, value):
+    """Converts a property value (possibly a string from the environment) to its type."""
+    if name not in ACCESS_PROPERTIES:
+        raise ValueError(f"Unknown HDF5 access property {name}. "
+                         f"Use one of {', '.join(ACCESS_PROPERTIES)}.")
+    if name == 'libver' and isinstance(value, str) and ',' in value:
+        return tuple(bound.strip() for bound in value.split(','))
+    if isinstance(value, str) and ACCESS_PROPERTIES[name] is not str:
+        return ACCESS_PROPERTIES[name](float(value))
+    return value
+
+
+def set_access_config(**properties):
+    """Sets HDF5 access properties for all files opened afterwards. None unsets a property."""
+    for name, value in properties.items():
+        if value is None:
+            _access_config.pop(name, None)
+        else:
+            _access_config[name] = parse_access_property(name, value)
+
+
+def get_access_config() -> dict:
+    """Returns the HDF5 access properties from the environment and set_access_config."""
+    config = {}
+    for name in ACCESS_PROPERTIES:
+        value = os.environ.get(ENV_PREFIX + name.upper())
+        if value:
+            config[name] = parse_access_property(name, value)
+    config.update(_access_config)
+    return config
+
+
+def open_file(name, mode: str = 'r', **kwargs) -> h5py.File:
+    """Opens an HDF5 file (a name or a file-like object) with the configured access properties.
+
+Keyword arguments are passed on to h5py.File and take precedence over the configuration."""
+    config = {**get_access_config(), **kwargs}
+    if not isinstance(name, (str, os.PathLike)):
+        config.pop('driver', None)  # h5py uses its file-object driver
+    if config.get('page_buf_size') and mode in ('w', 'w-', 'x'):
+        config.setdefault('fs_strategy', 'page')  # page buffering needs paged files
+    return h5py.File(name, mode, **config)
+
+
+def get_file_access_plist() -> h5py.h5p.PropFAID:
+    """Returns a file access property list with the configured chunk cache, for files opened
+read-only with the low-level API (e.g. in-memory file images)."""
+    config = get_access_config()
+    fapl = h5py.h5p.create(h5py.h5p.FILE_ACCESS)
+    if {'rdcc_nbytes', 'rdcc_nslots', 'rdcc_w0'} & config.keys():
+        _, nslots, nbytes, w_0 = fapl.get_cache()
+        fapl.set_cache(0, config.get('rdcc_nslots', nslots), config.get('rdcc_nbytes', nbytes),
+                       config.get('rdcc_w0', w_0))
+    return fapl
@@ -4,17 +4,29 @@
 
 import os
 import xml.etree.ElementTree as ET
+from fnmatch import fnmatchcase
 from glob import glob
+import hashlib
+import json
 import sys
 import logging
 import textwrap
+import time
+import click
 import h5py
+import numpy as np
+
+from nexusparser.tools import hdf5_access
 
 
 class NxdlAttributeError(Exception):
     """An exception for throwing an error when an Nxdl attribute is not found."""
 
 
+# logged (and passed to the parser) instead of the value of fields which are not read
+VALUE_NOT_READ = '<<VALUE NOT READ>>'
+
+
 def get_app_defs_names():
     """Returns all the AppDef names without their extension: .nxdl.xml"""
     app_def_path_glob = f"{get_nexus_definitions_path()}{os.sep}applications{os.sep}*.nxdl*"
@@ -388,7 +400,7 @@ def chk_nxdataaxis_v2(hdf_node, name, logger):
 
 def chk_nxdataaxis(hdf_node, name, logger):
     """NEXUS Data Plotting Standard v3: new version from 2014"""
-    if not isinstance(hdf_node, h5py.Dataset):  # check if it is a field in an NXdata node
+    if not is_field(hdf_node):  # check if it is a field in an NXdata node
         return None
     parent = hdf_node.parent
     if not parent or (parent and not parent.attrs.get('NX_class') == "NXdata"):
@@ -497,8 +509,9 @@ def other_attrs(logger, elem, nxdl_path, doc, attr):
     return logger, elem, nxdl_path, doc, attr
 
 
-def check_deprecation_enum_axis(variables, doc, elist, attr, hdf_node):
-    """Check for several attributes. - deprecation - enums - nxdataaxis """
+def check_deprecation_enum_axis(variables, doc, elist, attr, hdf_node, lines=None):
+    """Check for several attributes. - deprecation - enums - nxdataaxis
+The NXdata references are also appended to lines, if a list is given"""
     logger, elem, path = variables
     dep_str = elem.attrib.get('deprecated')  # check for deprecation
     if dep_str:
@@ -513,7 +526,8 @@ def check_deprecation_enum_axis(variables, doc, elist, attr, hdf_node):
                 if get_local_name_from_xml(item) == 'item':
                     if doc:
                         logger.debug("-> " + item.attrib['value'])
-    chk_nxdataaxis(hdf_node, path.split('/')[-1], logger)  # look for NXdata reference (axes/signal)
+    chk_nxdataaxis(hdf_node, path.split('/')[-1],  # look for NXdata reference (axes/signal)
+                   logger if lines is None else LineRecorder(logger, lines))
     for base_elem in elist if not attr else [elem]:  # check for doc
         sdoc = get_nxdl_child(base_elem, 'doc', go_base=False)
         if doc:
@@ -527,11 +541,32 @@ def get_node_docname(elem):
     return str(elem.get('nxdlbase').split('/')[-1] + ":" + elem.get('nxdlpath'))
 
 
-def get_nxdl_doc(hdf_node, logger, doc, attr=False):
-    """Get nxdl documentation for an HDF5 node (or its attribute)"""
+def get_nxdl_doc(hdf_node, logger, doc, attr=False, index_entry=None,  # pylint: disable=too-many-arguments
+                 lines=None):
+    """Get nxdl documentation for an HDF5 node (or its attribute)
+If an index_entry (dict) with a resolved nxdl_path is given, the NXDL nodes are looked up
+by that path instead of fitting the HDF5 names again. Otherwise, the result of the
+name fitting is stored in the given index_entry.
+Messages which do not belong to the documentation are also appended to lines, if given."""
     # new way: retrieve multiple inherited base classes
-    (class_path, nxdl_path, elist) = \
-        get_inherited_nodes(None, nx_name=get_nxdl_entry(hdf_node), hdf_node=hdf_node)
+    if index_entry is not None and 'nxdl_path' in index_entry:
+        nxdef = index_entry['nxdef']
+        (class_path, nxdl_path, elist) = \
+            get_inherited_nodes(index_entry['nxdl_path'], nx_name=nxdef)
+        if not index_entry['in_schema']:
+            elist = None
+        path = index_entry['class_path']
+    else:
+        nxdef = get_nxdl_entry(hdf_node)
+        (class_path, nxdl_path, elist) = \
+            get_inherited_nodes(None, nx_name=nxdef, hdf_node=hdf_node)
+        path = get_nx_class_path(hdf_node)
+        if index_entry is not None:
+            index_entry.update({'class_path': path,
+                                'nxdef': nxdef,
+                                'nxdl_path': ''.join('/' + get_node_name(e)
+                                                     for e in nxdl_path[1:]),
+                                'in_schema': bool(elist)})
     elem = elist[0] if class_path and elist else None
     if doc:
         logger.debug("classpath: " + str(class_path))
@@ -539,15 +574,14 @@ def get_nxdl_doc(hdf_node, logger, doc, attr=False):
                      "classes:\n" + "\n".join
                      (get_node_docname(e) for e in elist))
     # old solution with a single elem instead of using elist
-    path = get_nx_class_path(hdf_node)
     req_str = None
     if elem is not None and attr:  # NX_class is a compulsory attribute for groups in a nexus file
         # which should match the type of the corresponding NXDL element
-        if attr == 'NX_class' and not isinstance(hdf_node, h5py.Dataset):
+        if attr == 'NX_class' and not is_field(hdf_node):
             elem = None
             logger, doc, attr = write_doc_string(logger, doc, attr)
         # units category is a compulsory attribute for any fields
-        elif attr == 'units' and isinstance(hdf_node, h5py.Dataset):
+        elif attr == 'units' and is_field(hdf_node):
             req_str = "<<REQUIRED>>"
             logger, elem, nxdl_path, doc, attr = try_find_units(logger,
                                                                 elem,
@@ -562,7 +596,7 @@ def get_nxdl_doc(hdf_node, logger, doc, attr=False):
                                                                                doc,
                                                                                attr)
         # default is allowed for groups
-        elif attr == 'default' and not isinstance(hdf_node, h5py.Dataset):
+        elif attr == 'default' and not is_field(hdf_node):
             req_str = "<<RECOMMENDED>>"
             # try to find if default is defined as a child of the NXDL element
             elem = get_nxdl_child(elem, attr, nexus_type='attribute')
@@ -588,8 +622,9 @@ def get_nxdl_doc(hdf_node, logger, doc, attr=False):
                                                                                      doc,
                                                                                      elist,
                                                                                      attr,
-                                                                                     hdf_node)
-    return (req_str, get_nxdl_entry(hdf_node), nxdl_path)
+                                                                                     hdf_node,
+                                                                                     lines)
+    return (req_str, nxdef, nxdl_path)
 
 
 def get_doc(node, ntype, nxhtml, nxpath):
@@ -800,42 +835,152 @@ def get_node_at_nxdl_path(nxdl_path: str = None,
     return elem
 
 
-def process_node(hdf_node, hdf_path, parser, logger, doc=True):
+def get_nodes_at_nxdl_paths(nxdl_paths, nx_name: str = None, elem: ET.Element = None) -> dict:
+    """Returns the ET.Element for each of the given paths, or None if it is not in the NXDL.
+Like get_node_at_nxdl_path, but the paths are arranged in a trie of their names, so that
+the inherited nodes of each distinct prefix are resolved only once."""
+    trie = {}  # type: ignore[var-annotated]
+    for nxdl_path in nxdl_paths:
+        node = trie
+        for name in nxdl_path.split('/')[1:]:
+            node = node.setdefault(name, {})
+    elist = []  # type: ignore[var-annotated]
+    add_base_classes(elist, nx_name, elem)
+    elems = {}
+    stack = [('', trie, elist)]
+    while stack:
+        prefix, node, elist = stack.pop()
+        elems[prefix] = elist[0] if prefix and elist else None
+        for name, child in node.items():
+            child_elist = walk_elist(list(elist), name)[0] if elist else []
+            stack.append((f"{prefix}/{name}", child, child_elist))
+    return {nxdl_path: elems[nxdl_path] for nxdl_path in nxdl_paths}
+
+
+def is_field(hdf_node):
+    """Checks if an HDF5 object (or an IndexedNode standing for one) is a field"""
+    if isinstance(hdf_node, IndexedNode):
+        return hdf_node.is_field
+    return isinstance(hdf_node, h5py.Dataset)
+
+
+def is_group(hdf_node):
+    """Checks if an HDF5 object (or an IndexedNode standing for one) is a group"""
+    if isinstance(hdf_node, IndexedNode):
+        return not hdf_node.is_field
+    return isinstance(hdf_node, h5py.Group)
+
+
+def process_node(hdf_node, hdf_path, parser, logger, doc=True, read_value=True,  # pylint: disable=too-many-arguments
+                 index_entry=None, lines=None):
     """Processes an hdf5 node.
 - it logs the node found and also checks for its attributes
 - retrieves the corresponding nxdl documentation
+  (resolved once per node and reused for its attributes via the index_entry)
+- the value of a field is not read if read_value is False (e.g. byte budget exceeded)
+- if a list is given as lines, the messages logged independently of doc are appended to it,
+  so that they can be logged again without processing the node (see get_default_plotable)
 TODO:
 - follow variants
 - NOMAD parser: store in NOMAD """
     hdf_info = {'hdf_path': hdf_path, 'hdf_node': hdf_node}
-    if isinstance(hdf_node, h5py.Dataset):
+    if index_entry is None:
+        index_entry = {}
+    if lines is not None:
+        logger = LineRecorder(logger, lines)
+    if is_field(hdf_node):
         logger.debug('===== FIELD (/%s): %s' % (hdf_path, hdf_node))
-        val = str(hdf_node[()]).split('\n') if len(hdf_node.shape) <= 1 else str(
-            hdf_node[0]).split('\n')
+        if read_value:
+            val = str(hdf_node[()]).split('\n') if len(hdf_node.shape) <= 1 else str(
+                hdf_node[0]).split('\n')
+        else:
+            val = [VALUE_NOT_READ]
         logger.debug('value: %s %s' % (val[0], "..." if len(val) > 1 else ''))
     else:
         logger.debug('===== GROUP (/%s [%s::%s]): %s' %
-                     (hdf_path, get_nxdl_entry(hdf_node),
-                      get_nx_class_path(hdf_node), hdf_node))
-    (req_str, nxdef, nxdl_path) = get_nxdl_doc(hdf_node, logger, doc)
-    if parser is not None and isinstance(hdf_node, h5py.Dataset):
+                     (hdf_path, index_entry.get('nxdef') or get_nxdl_entry(hdf_node),
+                      index_entry.get('class_path') or get_nx_class_path(hdf_node), hdf_node))
+    doc_logger = logger if lines is None else logger.logger
+    (req_str, nxdef, nxdl_path) = get_nxdl_doc(hdf_node, doc_logger, doc,
+                                               index_entry=index_entry, lines=lines)
+    if parser is not None and is_field(hdf_node):
         parser({"hdf_info": hdf_info,
                 "nxdef": nxdef,
                 "nxdl_path": nxdl_path,
                 "val": val,
-                "logger": logger})
+                "read_value": read_value,
+                "logger": doc_logger})
     for key, value in hdf_node.attrs.items():
         logger.debug('===== ATTRS (/%s@%s)' % (hdf_path, key))
         val = str(value).split('\n')
         logger.debug('value: %s %s' % (val[0], "..." if len(val) > 1 else ''))
         (req_str, nxdef, nxdl_path) = \
-            get_nxdl_doc(hdf_node, logger, doc, attr=key)
+            get_nxdl_doc(hdf_node, doc_logger, doc, attr=key, index_entry=index_entry,
+                         lines=lines)
         if parser is not None and 'NOT IN SCHEMA' not in req_str and 'None' not in req_str:
             parser({"hdf_info": hdf_info,
                     "nxdef": nxdef,
                     "nxdl_path": nxdl_path,
                     "val": val,
-                    "logger": logger}, attr=key)
+                    "logger": doc_logger}, attr=key)
+
+
+class LineRecorder:
+    """Forwards debug messages to a logger and appends them to a list of lines"""
+
+    def __init__(self, logger, lines):
+        self.logger = logger
+        self.lines = lines
+
+    def debug(self, msg, *args):
+        """Logs and records a debug message"""
+        self.lines.append(msg % args if args else msg)
+        self.logger.debug(msg, *args)
+
+
+class PlotableRecord:
+    """What the default plotable search needs to know about an HDF5 object. Records are
+collected during the traversal of the file (see HandleNexus.record_plotable), so that
+get_default_plotable neither visits the file again nor resolves the NXDL schema again.
+Like h5py objects, records have a name, attrs, keys() and children indexed by relative path.
+Objects below recorded groups which are only reached through a link are kept as linked_node
+and processed when the search logs them."""
+
+    def __init__(self, records, hdf_node, lines=None, name=None, linked=False):  # pylint: disable=too-many-arguments
+        self.records = records
+        self.name = name or hdf_node.name
+        self.is_group = is_group(hdf_node)
+        self.attrs = dict(hdf_node.attrs)
+        self.shape = None if self.is_group else hdf_node.shape
+        self.text = repr(hdf_node)
+        self.lines = lines
+        self.linked_node = hdf_node if linked else None
+        self.children = []
+
+    def keys(self):
+        """Names of the recorded children, in the order of the traversal"""
+        return self.children
+
+    def items(self):
+        """Names and records of the recorded children"""
+        for key in self.children:
+            yield key, self[key]
+
+    def __getitem__(self, key):
+        if isinstance(key, bytes):
+            key = key.decode()
+        return self.records[self.name.rstrip('/') + '/' + key]
+
+    def __repr__(self):
+        return self.text
+
+    def log_lines(self, logger):
+        """Logs again the messages recorded while processing the object"""
+        if self.linked_node is not None:  # not processed during the traversal
+            process_node(self.linked_node, self.name, None, logger, False)
+            return
+        for line in self.lines or []:
+            logger.debug(line)
 
 
 def logger_auxiliary_signal(logger, nxdata):
@@ -857,7 +1002,9 @@ def print_default_plotable_header(logger):
 
 
 def get_default_plotable(root, logger):
-    """Get default plotable"""
+    """Get default plotable
+root is the PlotableRecord of the file root, the groups and fields below it are looked up
+among the records collected during the traversal of the file"""
     print_default_plotable_header(logger)
     # v3 from 2014
     # nxentry
@@ -884,7 +1031,7 @@ def get_default_plotable(root, logger):
             nxgroup = nxgroup[default_group_name]
             default_group_name = nxgroup.attrs.get("default")
         except KeyError:
-            pass
+            break
     if nxgroup == nxentry:
         nxdata = nxdata_helper(nxentry)
     else:
@@ -894,7 +1041,7 @@ def get_default_plotable(root, logger):
         return
     logger.debug('')
     logger.debug('NXdata group has been identified: ' + nxdata.name)
-    process_node(nxdata, nxdata.name, None, logger, False)
+    nxdata.log_lines(logger)
     # signal
     signal = None
     signal_dataset_name = nxdata.attrs.get("signal")
@@ -909,7 +1056,7 @@ def get_default_plotable(root, logger):
         return
     logger.debug('')
     logger.debug('Signal has been identified: ' + signal.name)
-    process_node(signal, signal.name, None, logger, False)
+    signal.log_lines(logger)
     logger = logger_auxiliary_signal(logger, nxdata)  # check auxiliary_signals
     dim = len(signal.shape)
     axes = []  # axes
@@ -919,10 +1066,9 @@ def get_default_plotable(root, logger):
 def entry_helper(root):
     """Check entry related data"""
     nxentries = []
-    for key in root.keys():
-        if isinstance(root[key], h5py.Group) and root[key].attrs.get('NX_class') and \
-                root[key].attrs['NX_class'] == "NXentry":
-            nxentries.append(root[key])
+    for child in (root[key] for key in root.keys()):
+        if child.is_group and child.attrs.get('NX_class') == "NXentry":
+            nxentries.append(child)
     if len(nxentries) >= 1:
         return nxentries[0]
     return None
@@ -932,10 +1078,9 @@ def nxdata_helper(nxentry):
     """Check if nxentry hdf5 object has a NX_class and, if it contains NXdata,
 return its value"""
     lnxdata = []
-    for key in nxentry.keys():
-        if isinstance(nxentry[key], h5py.Group) and nxentry[key].attrs.get('NX_class') and \
-                nxentry[key].attrs['NX_class'] == "NXdata":
-            lnxdata.append(nxentry[key])
+    for child in (nxentry[key] for key in nxentry.keys()):
+        if child.is_group and child.attrs.get('NX_class') == "NXdata":
+            lnxdata.append(child)
     if len(lnxdata) >= 1:
         return lnxdata[0]
     return None
@@ -944,9 +1089,9 @@ return its value"""
 def signal_helper(nxdata):
     """Check signal related data"""
     signals = []
-    for key in nxdata.keys():
-        if isinstance(nxdata[key], h5py.Dataset):
-            signals.append(nxdata[key])
+    for child in (nxdata[key] for key in nxdata.keys()):
+        if not child.is_group:
+            signals.append(child)
     if len(signals) == 1:  # v3: as there was no selection given, only 1 data field shall exists
         return signals[0]
     if len(signals) > 1:  # v2: select the one with an attribute signal="1" attribute
@@ -961,13 +1106,9 @@ def find_attrib_axis_actual_dim_num(nxdata, a_item, ax_list):
     """Finds axis that have defined dimensions"""
     # find those with attribute axis= actual dimension number
     lax = []
-    for key in nxdata.keys():
-        if isinstance(nxdata[key], h5py.Dataset):
-            try:
-                if nxdata[key].attrs['axis'] == a_item + 1:
-                    lax.append(nxdata[key])
-            except KeyError:
-                pass
+    for child in (nxdata[key] for key in nxdata.keys()):
+        if not child.is_group and child.attrs.get('axis') == a_item + 1:
+            lax.append(child)
     if len(lax) == 1:
         ax_list.append(lax[0])
     # if there are more alternatives, prioritise the one with an attribute primary="1"
@@ -981,6 +1122,8 @@ def find_attrib_axis_actual_dim_num(nxdata, a_item, ax_list):
 
 def get_single_or_multiple_axes(nxdata, ax_datasets, a_item, ax_list):
     """Gets either single or multiple axes from the NXDL"""
+    if ax_datasets is None:  # no axes attribute
+        return ax_list
     try:
         if isinstance(ax_datasets, str):  # single axis is defined
             # explicite definition of dimension number
@@ -1029,40 +1172,574 @@ def axis_helper(dim, nxdata, signal, axes, logger):
                      (a_item, len(ax_list), str(ax_list)))
 
 
+def check_path_patterns(patterns):
+    """Checks that the given glob patterns on HDF5 or NX class paths are absolute"""
+    for pattern in patterns:
+        if not pattern.startswith('/'):
+            raise ValueError(f'The path pattern {pattern} should start with /')
+
+
+def match_path_segments(path_segments, pattern_segments, prefix=False):
+    """Matches path segments with pattern segments. '*', '?' and '[...]' do not match across
+segments, a '**' segment matches any number of segments. With prefix, it is checked whether
+the path can be extended to a matching path instead."""
+    if not path_segments:
+        return bool(pattern_segments) if prefix else \
+            all(segment == '**' for segment in pattern_segments)
+    if not pattern_segments:
+        return False
+    if pattern_segments[0] == '**':
+        return prefix or any(match_path_segments(path_segments[start:], pattern_segments[1:])
+                             for start in range(len(path_segments) + 1))
+    return fnmatchcase(path_segments[0], pattern_segments[0]) and \
+        match_path_segments(path_segments[1:], pattern_segments[1:], prefix)
+
+
+def matches_path_pattern(paths, patterns):
+    """Checks if any of the given paths (e.g. HDF5 path and NX class path of a node)
+matches any of the glob patterns (see match_path_segments)"""
+    for path in paths:
+        for pattern in patterns:
+            if match_path_segments(path.split('/')[1:], pattern.split('/')[1:]):
+                return True
+    return False
+
+
+def may_contain_path_pattern(paths, patterns):
+    """Checks if a descendant of a group with the given paths can match any of the glob patterns"""
+    for path in paths:
+        for pattern in patterns:
+            if match_path_segments(path.split('/')[1:], pattern.split('/')[1:], prefix=True):
+                return True
+    return False
+
+
+def is_file_name(source):
+    """Checks if a NeXus file is given by its name (rather than by its content)"""
+    return isinstance(source, (str, os.PathLike))
+
+
+def open_nexus_file(source):
+    """Opens a NeXus file for reading. The source can be
+- a file name,
+- bytes (or another buffer), opened as an in-memory file image with the core driver,
+- a file-like object, e.g. an upload stream or a zip member (ZipFile.open). Seekable ones are
+  read by h5py directly, the others are read into memory first.
+The HDF5 access properties configured in tools.hdf5_access are applied."""
+    if is_file_name(source):
+        return hdf5_access.open_file(source, 'r')
+    if not isinstance(source, (bytes, bytearray, memoryview)):
+        if getattr(source, 'seekable', lambda: False)():
+            return hdf5_access.open_file(source, 'r')
+        source = source.read()
+    fapl = hdf5_access.get_file_access_plist()
+    fapl.set_fapl_core(backing_store=False)
+    fapl.set_file_image(source)
+    return h5py.File(h5py.h5f.open(b'nexus_file_image', h5py.h5f.ACC_RDONLY, fapl=fapl))
+
+
+# increase whenever the content of the structure index changes
+INDEX_VERSION = 3
+
+_definitions_hashes: dict = {}
+
+
+def encode_attribute(value):
+    """Converts an attribute value, as h5py returns it, to JSON for the structure index.
+Strings are kept, numbers, booleans and strings in arrays or numpy scalars are stored with
+their dtype and shape. Other values (e.g. references) raise a TypeError."""
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, (np.ndarray, np.generic)) or value.dtype.kind not in 'biufSO':
+        raise TypeError(f'cannot index the attribute value {value!r}')
+    array = np.asarray(value)
+    if array.dtype.kind == 'S':
+        items = np.char.decode(array.ravel(), 'latin-1').tolist()
+    else:
+        items = array.ravel().tolist()
+    if array.dtype.kind == 'O' and not all(isinstance(item, str) for item in items):
+        raise TypeError(f'cannot index the attribute value {value!r}')
+    return {'dtype': array.dtype.str, 'shape': list(array.shape), 'value': items}
+
+
+def decode_attribute(value):
+    """Restores an attribute value stored by encode_attribute as h5py would return it"""
+    if isinstance(value, str):
+        return value
+    dtype = np.dtype(value['dtype'])
+    if dtype.kind == 'S':
+        array = np.char.encode(np.array(value['value'], dtype=str), 'latin-1').astype(dtype)
+    else:
+        array = np.array(value['value'], dtype=dtype)
+    array = array.reshape(value['shape'])
+    return array if array.shape else array[()]
+
+
+def make_index_entry(hdf_node, is_group_node):
+    """Returns the structure index entry of an HDF5 object: its path, kind, text and attributes
+and, for fields, shape and dtype. The attributes are left out if they cannot be stored (see
+encode_attribute). The NXDL fit is added when the object is processed (see get_nxdl_doc)."""
+    index_entry = {'path': hdf_node.name,
+                   'kind': 'group' if is_group_node else 'field',
+                   'repr': repr(hdf_node)}
+    if not is_group_node:
+        index_entry['shape'] = None if hdf_node.shape is None else list(hdf_node.shape)
+        index_entry['dtype'] = hdf_node.dtype.str
+    try:
+        index_entry['attrs'] = {key: encode_attribute(value)
+                                for key, value in hdf_node.attrs.items()}
+    except TypeError:
+        pass
+    return index_entry
+
+
+class IndexedNode:
+    """An HDF5 object served from its structure index entry (see HandleNexus.walk_index).
+Like h5py objects, it has a name, attrs, a parent and, for fields, a shape, dtype and size,
+all taken from the index. The object is only opened when its value is read, or for its
+attributes if the index could not store them."""
+
+    def __init__(self, in_file, index_entry, groups):
+        self.in_file = in_file
+        self.index_entry = index_entry
+        self.name = index_entry['path']
+        self.is_field = index_entry['kind'] == 'field'
+        self.groups = groups  # the IndexedNodes of the groups by path
+        self.hdf_node = None
+        if 'attrs' in index_entry:
+            self.attrs = {key: decode_attribute(value)
+                          for key, value in index_entry['attrs'].items()}
+        else:
+            self.attrs = self.open().attrs
+        if self.is_field:
+            shape = index_entry['shape']
+            self.shape = None if shape is None else tuple(shape)
+            self.size = None if shape is None else int(np.prod(self.shape))
+            self.dtype = np.dtype(index_entry['dtype'])
+
+    def open(self):
+        """Opens the HDF5 object (once)"""
+        if self.hdf_node is None:
+            self.hdf_node = self.in_file[self.name]
+        return self.hdf_node
+
+    @property
+    def parent(self):
+        """The parent group, served from the index if it was visited"""
+        path = self.name[:self.name.rindex('/')] or '/'
+        return self.groups[path] if path in self.groups else self.in_file[path]
+
+    def __getitem__(self, key):
+        return self.open()[key]
+
+    def __repr__(self):
+        return self.index_entry['repr']
+
+
+def get_index_file_name(file_name, index):
+    """Returns the file name of the structure index of a NeXus file: a sidecar file next to it
+if index is True, otherwise a file named after the absolute path in the cache directory index"""
+    if index is True:
+        return f"{file_name}.nxindex.json"
+    hashed_name = hashlib.sha1(os.path.abspath(file_name).encode()).hexdigest()
+    return os.path.join(index, f"{hashed_name}.nxindex.json")
+
+
+def get_definitions_hash():
+    """Returns a hash of the names, sizes and modification times of the NXDL files of the
+definitions, computed once per process and definitions path"""
+    definitions_path = get_nexus_definitions_path()
+    if definitions_path not in _definitions_hashes:
+        sha = hashlib.sha256()
+        for nxdl_folder in ('contributed_definitions', 'base_classes', 'applications'):
+            for file in sorted(glob(os.path.join(definitions_path, nxdl_folder, '*.nxdl.xml'))):
+                stat = os.stat(file)
+                sha.update(f'{nxdl_folder}/{os.path.basename(file)}:'
+                           f'{stat.st_size}:{stat.st_mtime_ns}'.encode())
+        _definitions_hashes[definitions_path] = sha.hexdigest()
+    return _definitions_hashes[definitions_path]
+
+
+def get_index_stamp(file_name):
+    """Returns what a structure index has to match to be valid for a NeXus file"""
+    stat = os.stat(file_name)
+    return {'version': INDEX_VERSION,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'definitions': get_definitions_hash()}
+
+
+def load_structure_index(file_name, index):
+    """Returns the objects stored in the structure index of a NeXus file.
+None is returned if there is no index or it is outdated."""
+    try:
+        with open(get_index_file_name(file_name, index), 'r') as index_file:
+            content = json.load(index_file)
+        if content['stamp'] == get_index_stamp(file_name):
+            return content['objects']
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def write_structure_index(file_name, index, objects, logger):
+    """Writes the structure index of a NeXus file. A failure (e.g. a read-only upload
+directory) is only logged as the index is just an accelerator."""
+    index_file_name = get_index_file_name(file_name, index)
+    try:
+        if index is not True:
+            os.makedirs(index, exist_ok=True)
+        with open(index_file_name, 'w') as index_file:
+            json.dump({'stamp': get_index_stamp(file_name), 'objects': objects}, index_file)
+    except OSError as exc:
+        logger.warning('Could not write the structure index %s: %s' % (index_file_name, exc))
+
+
+# the resource guards of HandleNexus and the types of their values
+LIMIT_TYPES = {'max_nodes': int, 'max_bytes': int, 'max_seconds': float}
+LIMIT_ENV_PREFIX = 'NEXUS_PARSER_'
+
+
+def get_env_limits():
+    """Returns the resource guards given by environment variables (NEXUS_PARSER_MAX_NODES,
+NEXUS_PARSER_MAX_BYTES and NEXUS_PARSER_MAX_SECONDS), e.g. as defaults of the NOMAD parser"""
+    limits = {}
+    for name, limit_type in LIMIT_TYPES.items():
+        value = os.environ.get(LIMIT_ENV_PREFIX + name.upper())
+        if value:
+            limits[name] = limit_type(float(value))
+    return limits
+
+
 class HandleNexus:
     """documentation"""
-    def __init__(self, logger, args):
+    def __init__(self, logger, args, include=None, exclude=None, limits=None,  # pylint: disable=too-many-arguments
+                 index=False):
         self.logger = logger
+        # a file name, bytes or a file-like object (see open_nexus_file)
         self.input_file_name = args[0] if len(
             args) >= 1 else 'tests/data/nexus_test_data/201805_WSe2_arpes.nxs'
         self.parser = None
         self.in_file = None
+        # absolute glob patterns on HDF5 paths (/entry/sample) or NX class paths
+        # (/NXentry/NXsample), '**' matching any number of path segments
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        check_path_patterns(self.include + self.exclude)
+        self.visited_addrs = set()  # type: ignore[var-annotated]
+        # resource guards: max_nodes (objects visited or descended into, with or without
+        # a structure index), max_bytes (dataset bytes read)
+        # and max_seconds (wall-clock time of the walk, only checked between objects, so that
+        # reading a single huge dataset is not interrupted), None means unlimited
+        self.limits = {'max_nodes': None, 'max_bytes': None, 'max_seconds': None,
+                       **(limits or {})}
+        self.node_count = 0
+        self.bytes_read = 0
+        self.start_time = 0.
+        self.stopped = False
+        self.truncated = []  # type: ignore[var-annotated]
+        # structure index: False (not used), True (sidecar file) or a cache directory
+        self.index = index
+        self.index_objects = None
+        # collected for the default plotable search: records by HDF5 path, the groups whose
+        # fields are recorded (NXdata and targets of 'default' attributes) and these targets
+        self.plotable_records = {}  # type: ignore[var-annotated]
+        self.plotable_containers = set()  # type: ignore[var-annotated]
+        self.plotable_targets = set()  # type: ignore[var-annotated]
+
+    def truncate(self, reason):
+        """Records (once) and logs why the walk was truncated"""
+        if reason not in self.truncated:
+            self.truncated.append(reason)
+            self.logger.warning('Parsing truncated: %s' % reason)
+
+    def is_limit_reached(self):
+        """Checks the node-count and wall-clock limits before visiting the next object.
+Once one is reached, the walk does not descend any further."""
+        if not self.stopped:
+            max_nodes = self.limits['max_nodes']
+            max_seconds = self.limits['max_seconds']
+            if max_nodes is not None and self.node_count >= max_nodes:
+                self.truncate(f'more than {max_nodes} objects')
+                self.stopped = True
+            elif max_seconds is not None and time.monotonic() - self.start_time > max_seconds:
+                self.truncate(f'more than {max_seconds} seconds')
+                self.stopped = True
+        return self.stopped
+
+    def is_value_readable(self, hdf_node):
+        """Checks (and books) the bytes of a dataset against the byte budget.
+Datasets exceeding the budget are still visited, but without reading their values."""
+        max_bytes = self.limits['max_bytes']
+        if max_bytes is None or not is_field(hdf_node):
+            return True
+        nbytes = (hdf_node.size or 0) * hdf_node.dtype.itemsize
+        if self.bytes_read + nbytes > max_bytes:
+            self.truncate(f'more than {max_bytes} bytes of values')
+            return False
+        self.bytes_read += nbytes
+        return True
 
-    def visit_node(self, hdf_name, hdf_node):
+    def visit_node(self, hdf_name, hdf_node, index_entry=None):
         """Function called by h5py that iterates on each node of hdf5file.
         It allows h5py visititems function to visit nodes."""
         hdf_path = '/' + hdf_name
-        process_node(hdf_node, hdf_path, self.parser, self.logger)
+        record = self.record_plotable(hdf_node)
+        process_node(hdf_node, hdf_path, self.parser, self.logger,
+                     read_value=self.is_value_readable(hdf_node), index_entry=index_entry,
+                     lines=record.lines if record is not None else None)
+
+    def add_plotable_target(self, record):
+        """Remembers the group referred to by the 'default' attribute of a record"""
+        default = record.attrs.get('default')
+        if isinstance(default, bytes):
+            default = default.decode()
+        if default and isinstance(default, str):
+            self.plotable_targets.add(record.name.rstrip('/') + '/' + default)
+
+    def record_plotable(self, hdf_node, path=None, linked=False):
+        """Records a visited object if the default plotable search may need it: NXentry groups
+in the root, NXdata groups and targets of 'default' attributes below recorded groups, and the
+fields of NXdata groups and of targets. Returns the record, whose lines collect the log lines
+of the object, or None. Objects reached through a link at path are recorded as linked."""
+        path = path or hdf_node.name
+        parent = self.plotable_records.get(path[:path.rindex('/')] or '/')
+        if parent is None:
+            return None
+        if is_group(hdf_node):
+            nx_class = hdf_node.attrs.get('NX_class')
+            is_container = nx_class == 'NXdata' or path in self.plotable_targets
+            if not is_container and not (parent.name == '/' and nx_class == 'NXentry'):
+                return None
+            if is_container:
+                self.plotable_containers.add(path)
+        elif parent.name not in self.plotable_containers:
+            return None
+        record = PlotableRecord(self.plotable_records, hdf_node, None if linked else [], path,
+                                linked)
+        self.plotable_records[path] = record
+        parent.children.append(path[path.rindex('/') + 1:])
+        self.add_plotable_target(record)
+        return record
+
+    def record_link(self, path, targets=()):
+        """Records the object a soft, external or already visited hard link at path refers to,
+if the default plotable search may need it (see record_plotable). The object is resolved but
+neither processed nor walked, the objects below a recorded group are recorded likewise.
+targets are the objects the path already passes through, to stop at cyclic links."""
+        if (path[:path.rindex('/')] or '/') not in self.plotable_records:
+            return
+        try:
+            hdf_node = self.in_file[path]
+        except (KeyError, OSError):  # dangling link
+            return
+        target = (hdf_node.id.fileno, h5py.h5o.get_info(hdf_node.id).addr)
+        record = self.record_plotable(hdf_node, path, linked=True)
+        if record is not None and record.is_group and target not in targets:
+            for name in sorted(hdf_node.keys()):
+                self.record_link(path + '/' + name, targets + (target,))
+
+    def walk_group(self, group, class_path='', selected=True):
+        """Visits the objects below a group in the same order as h5py's visititems
+(lexicographic, soft and external links ignored, hard linked objects visited once),
+but prunes the subtrees which are excluded or cannot contain any included object. Links which
+are not visited are still recorded for the default plotable search (see record_link)."""
+        for name in sorted(group.keys()):
+            if self.is_limit_reached():
+                return
+            if not isinstance(group.get(name, getlink=True), h5py.HardLink):
+                link_path = group.name.rstrip('/') + '/' + name
+                if self.index_objects is not None:
+                    self.index_objects.append({'path': link_path, 'kind': 'link'})
+                self.record_link(link_path)
+                continue
+            hdf_node = group[name]
+            is_group_node = isinstance(hdf_node, h5py.Group)
+            paths = (hdf_node.name, class_path + '/' + (
+                hdf_node.attrs['NX_class'] if is_group_node and 'NX_class' in hdf_node.attrs
+                else name))
+            if self.exclude and matches_path_pattern(paths, self.exclude):
+                continue
+            node_selected = selected or matches_path_pattern(paths, self.include)
+            if not node_selected and \
+                    not (is_group_node and may_contain_path_pattern(paths, self.include)):
+                continue
+            obj_info = h5py.h5o.get_info(hdf_node.id)
+            addr = None
+            if obj_info.rc > 1:
+                addr = obj_info.addr
+                if addr in self.visited_addrs:
+                    if self.index_objects is not None:
+                        # indexed for walks in which this path is met first
+                        self.index_objects.append({
+                            'path': hdf_node.name, 'kind': 'group' if is_group_node else 'field',
+                            'class_path': paths[1], 'addr': addr, 'shared': True})
+                    self.record_link(hdf_node.name)
+                    continue
+                self.visited_addrs.add(addr)
+            self.walk_object(hdf_node, is_group_node, paths[1], node_selected, addr)
+
+    def walk_object(self, hdf_node, is_group_node, class_path, selected, addr=None):  # pylint: disable=too-many-arguments
+        """Visits an object of walk_group if it is selected and walks the objects below it"""
+        self.node_count += 1
+        if selected:
+            index_entry = None
+            if self.index_objects is not None:
+                index_entry = make_index_entry(hdf_node, is_group_node)
+                if addr is not None:
+                    index_entry['addr'] = addr
+                self.index_objects.append(index_entry)
+            self.visit_node(hdf_node.name[1:], hdf_node, index_entry)
+        elif is_group_node:
+            self.record_plotable(hdf_node)
+        if is_group_node:
+            self.walk_group(hdf_node, class_path, selected)
+
+    def walk_index(self, objects):
+        """Visits the objects recorded in a structure index in their original order.
+Neither groups are listed nor the schema is fitted to the HDF5 names again. The objects are
+served from the index (see IndexedNode) and only opened to read the values of fields.
+Pruning and node counting work as in walk_group on the recorded paths. A hard linked object
+is visited at its first selected path: the other paths of such objects are indexed as
+'shared' and walked like in walk_group if the object is first met there."""
+        # walk states of the groups: 'selected' or only descended into for includes
+        group_states = {'': 'descend' if self.include else 'selected'}
+        groups = {}  # type: ignore[var-annotated]
+        for index_entry in objects:
+            if self.is_limit_reached():
+                return
+            path = index_entry['path']
+            parent_state = group_states.get(path[:path.rindex('/')])
+            if parent_state is None:  # parent was pruned
+                continue
+            if index_entry['kind'] == 'link':
+                self.record_link(path)
+                continue
+            is_group_node = index_entry['kind'] == 'group'
+            paths = (path, index_entry['class_path'])
+            if self.exclude and matches_path_pattern(paths, self.exclude):
+                continue
+            node_selected = parent_state == 'selected' or \
+                matches_path_pattern(paths, self.include)
+            if not node_selected and \
+                    not (is_group_node and may_contain_path_pattern(paths, self.include)):
+                continue
+            if 'addr' in index_entry:
+                if index_entry['addr'] in self.visited_addrs:
+                    self.record_link(path)
+                    continue
+                self.visited_addrs.add(index_entry['addr'])
+            if index_entry.get('shared'):
+                self.walk_object(self.in_file[path], is_group_node, paths[1], node_selected)
+                continue
+            self.node_count += 1
+            hdf_node = IndexedNode(self.in_file, index_entry, groups)
+            if is_group_node:
+                group_states[path] = 'selected' if node_selected else 'descend'
+                groups[path] = hdf_node
+                if not node_selected:
+                    self.record_plotable(hdf_node)
+            if node_selected:
+                self.visit_node(path[1:], hdf_node, index_entry)
 
     def process_nexus_master_file(self, parser):
         """Process a nexus master file by processing all its nodes and their attributes"""
         self.parser = parser
-        self.in_file = h5py.File(self.input_file_name, 'r')
-        self.in_file.visititems(self.visit_node)
-        get_default_plotable(self.in_file, self.logger)
+        self.in_file = open_nexus_file(self.input_file_name)
+        self.visited_addrs = set()
+        self.node_count = 0
+        self.bytes_read = 0
+        self.start_time = time.monotonic()
+        self.stopped = False
+        self.truncated = []
+        self.plotable_records = {}
+        self.plotable_containers = set()
+        self.plotable_targets = set()
+        self.plotable_records['/'] = PlotableRecord(self.plotable_records, self.in_file)
+        self.add_plotable_target(self.plotable_records['/'])
+        objects = None
+        # a structure index is kept for files given by name only
+        use_index = self.index and is_file_name(self.input_file_name)
+        if use_index:
+            objects = load_structure_index(self.input_file_name, self.index)
+        if objects is not None:
+            self.walk_index(objects)
+        else:
+            # only a complete walk is worth an index
+            build_index = use_index and not self.include and not self.exclude
+            self.index_objects = [] if build_index else None
+            self.walk_group(self.in_file, selected=not self.include)
+            if build_index and not self.stopped:
+                write_structure_index(self.input_file_name, self.index,
+                                      self.index_objects, self.logger)
+            self.index_objects = None
+        # values skipped for the byte budget leave the records complete, a stopped walk does not
+        if not self.stopped:
+            get_default_plotable(self.plotable_records['/'], self.logger)
+        self.plotable_records = {}
         self.in_file.close()
 
 
-def main():
+@click.command()
+@click.argument('nexus_file', required=False)
+@click.option(
+    '--include',
+    multiple=True,
+    help='Glob pattern of HDF5 paths (/entry/sample) or NX class paths (/NXentry/NXdata) to '
+         'process, \'*\' matching within a path segment and \'**\' across segments. Subtrees '
+         'not leading to a match are skipped. (Repeat for more patterns.)'
+)
+@click.option(
+    '--exclude',
+    multiple=True,
+    help='Glob pattern of HDF5 paths or NX class paths whose subtrees are skipped. '
+         '(Repeat for more patterns.)'
+)
+@click.option(
+    '--max-nodes',
+    type=int,
+    default=None,
+    help='Stop descending after visiting this many HDF5 objects.'
+)
+@click.option(
+    '--max-bytes',
+    type=int,
+    default=None,
+    help='Stop reading dataset values once this many bytes have been read.'
+)
+@click.option(
+    '--max-seconds',
+    type=float,
+    default=None,
+    help='Stop descending once the walk has taken this many seconds (checked between '
+         'objects, the value of a single dataset is read to its end).'
+)
+@click.option(
+    '--index',
+    is_flag=True,
+    default=False,
+    help='Use (and write if missing or outdated) a structure index next to the NeXus file.'
+)
+@click.option(
+    '--index-dir',
+    default=None,
+    help='Like --index, but keep the structure index in the given cache directory.'
+)
+def main(nexus_file, include, exclude, max_nodes, max_bytes, max_seconds,  # pylint: disable=too-many-arguments
+         index, index_dir):
     """The main function to call when used as a script."""
     logging_format = "%(levelname)s: %(message)s"
     stdout_handler = logging.StreamHandler(sys.stdout)
     stdout_handler.setLevel(logging.DEBUG)
     logging.basicConfig(level=logging.DEBUG, format=logging_format, handlers=[stdout_handler])
     logger = logging.getLogger()
-    nexus_helper = HandleNexus(logger, sys.argv[1:])
+    nexus_helper = HandleNexus(logger, [nexus_file] if nexus_file else [],
+                               include=include, exclude=exclude,
+                               limits={'max_nodes': max_nodes, 'max_bytes': max_bytes,
+                                       'max_seconds': max_seconds},
+                               index=index_dir or index)
     nexus_helper.process_nexus_master_file(None)
 
 
 if __name__ == '__main__':
-    main()
+    main()  # pylint: disable=no-value-for-parameter
@@ -96,6 +96,7 @@ def main():
             'console_scripts': [
                 'read_nexus = nexusparser.tools.nexus:main',
                 'dataconverter = nexusparser.tools.dataconverter.convert:convert_cli',
+                'dataconverter-batch = nexusparser.tools.dataconverter.batch:batch_cli',
                 'yaml2nxdl = nexusparser.tools.yaml2nxdl.yaml2nxdl:launch_tool'
             ]
         })
@@ -20,9 +20,15 @@
 #
 
 import xml.etree.ElementTree as ET
+import io
+import re
 import sys
 import os
+from distutils import file_util
 import logging
+import zipfile
+import h5py
+import numpy as np
 import pytest
 from nomad.datamodel import EntryArchive
 from nexusparser.tools import nexus  # noqa: E402
@@ -105,6 +111,22 @@ def test_get_node_at_nxdl_path():
     assert node.attrib["name"] == "role"
 
 
+def test_get_nodes_at_nxdl_paths():
+    """Test to verify that resolving NXDL paths together gives the elements of single paths"""
+    nxdl_file_path = "nexusparser/definitions/contributed_definitions/NXmpes.nxdl.xml"
+    nxdl_paths = ["/ENTRY/DATA/VARIABLE", "/ENTRY/USER/role", "/ENTRY/USER/name",
+                  "/ENTRY/USER", "/ENTRY/USER/not_in_schema", "/ENTRY/DATA/VARIABLE/calibration"]
+    nodes = nexus.get_nodes_at_nxdl_paths(nxdl_paths, elem=ET.parse(nxdl_file_path).getroot())
+    assert list(nodes) == nxdl_paths
+    for nxdl_path in nxdl_paths:
+        node = nexus.get_node_at_nxdl_path(nxdl_path, elem=ET.parse(nxdl_file_path).getroot(),
+                                           exc=False)
+        if node is None:
+            assert nodes[nxdl_path] is None
+        else:
+            assert nodes[nxdl_path].attrib == node.attrib
+
+
 def test_example():
     """Tests if parser can parse our example data
 
@@ -178,3 +200,241 @@ def test_example():
         archive.nexus.nx_application_arpes.
         nx_group_ENTRY[0].nx_group_DATA[0].nx_field_DATA[0].nx_value[3] - 0.00078192557) \
         == 0.0
+
+
+@pytest.mark.parametrize("include,exclude,expected,unexpected", [
+    pytest.param(['/entry/instrument/*/energy'], [],
+                 ['/entry/instrument/monochromator/energy', '/entry/instrument/source/energy'],
+                 ['/entry/title', '/entry/instrument/analyser'], id="include-hdf-path"),
+    pytest.param(['/NXentry/NXdata'], [],
+                 ['/entry/data', '/entry/data/angles'],
+                 ['/entry/sample', '/entry/instrument'], id="include-class-path"),
+    pytest.param(['/entry/*/energy'], [],
+                 [],
+                 ['/entry/instrument/monochromator/energy', '/entry/instrument/source/energy'],
+                 id="include-single-segment"),
+    pytest.param(['/entry/**/energy'], [],
+                 ['/entry/instrument/monochromator/energy', '/entry/instrument/source/energy'],
+                 ['/entry/title', '/entry/instrument/analyser'], id="include-any-depth"),
+    pytest.param([], ['/entry/instrument', '/NXentry/NXsample'],
+                 ['/entry/title', '/entry/data/angles'],
+                 ['/entry/instrument', '/entry/sample'], id="exclude"),
+])
+def test_nexus_include_exclude(caplog, include, exclude, expected, unexpected):
+    """Check that the walker only processes the selected subtrees"""
+    local_dir = os.path.abspath(os.path.dirname(__file__))
+    example_data = os.path.join(local_dir, 'data/nexus_test_data/201805_WSe2_arpes.nxs')
+    logger = logging.getLogger('nexus_include_exclude')
+    logger.setLevel(logging.DEBUG)
+    with caplog.at_level(logging.DEBUG, logger='nexus_include_exclude'):
+        nexus.HandleNexus(logger, [example_data], include=include, exclude=exclude)\
+            .process_nexus_master_file(None)
+    visited = [re.match(r'===== (FIELD|GROUP) \(/([^ )]*)', record.getMessage()).group(2)
+               for record in caplog.records
+               if record.getMessage().startswith(('===== FIELD', '===== GROUP'))]
+    for path in expected:
+        assert path in visited
+    for path in unexpected:
+        assert not any(vis == path or vis.startswith(path + '/') for vis in visited)
+
+
+def test_nexus_relative_pattern():
+    """Check that relative path patterns are rejected instead of matching nothing"""
+    logger = logging.getLogger('nexus_relative_pattern')
+    with pytest.raises(ValueError):
+        nexus.HandleNexus(logger, [], include=['data/*'])
+    with pytest.raises(ValueError):
+        nexus.HandleNexus(logger, [], exclude=['NXentry/NXdata'])
+
+
+@pytest.mark.parametrize("limits,reason", [
+    pytest.param({'max_nodes': 5}, 'more than 5 objects', id="max-nodes"),
+    pytest.param({'max_bytes': 1000}, 'more than 1000 bytes of values', id="max-bytes"),
+    pytest.param({'max_seconds': 0}, 'more than 0 seconds', id="max-seconds"),
+    pytest.param({}, None, id="no-limits"),
+])
+def test_nexus_limits(caplog, limits, reason):
+    """Check that the walker stops or skips values and records why"""
+    local_dir = os.path.abspath(os.path.dirname(__file__))
+    example_data = os.path.join(local_dir, 'data/nexus_test_data/201805_WSe2_arpes.nxs')
+    logger = logging.getLogger('nexus_limits')
+    logger.setLevel(logging.DEBUG)
+    nexus_helper = nexus.HandleNexus(logger, [example_data], limits=limits)
+    with caplog.at_level(logging.DEBUG, logger='nexus_limits'):
+        nexus_helper.process_nexus_master_file(None)
+    if reason is None:
+        assert not nexus_helper.truncated
+        assert nexus.VALUE_NOT_READ not in caplog.text
+        return
+    assert nexus_helper.truncated == [reason]
+    if 'max_nodes' in limits:
+        assert nexus_helper.node_count == limits['max_nodes']
+    if 'max_bytes' in limits:
+        assert nexus_helper.bytes_read <= limits['max_bytes']
+        assert nexus.VALUE_NOT_READ in caplog.text
+    # only a walk which stopped early skips the default plotable search
+    assert ('=== Default Plotable ===' in caplog.text) == ('max_bytes' in limits)
+
+
+def test_parser_env_limits(monkeypatch):
+    """Check that the parser, created without arguments by NOMAD, takes its limits from the
+environment unless they are given"""
+    monkeypatch.setenv('NEXUS_PARSER_MAX_NODES', '100')
+    monkeypatch.setenv('NEXUS_PARSER_MAX_SECONDS', '2.5')
+    assert NexusParser().limits == {'max_nodes': 100, 'max_seconds': 2.5}
+    assert NexusParser(limits={'max_nodes': 5}).limits == {'max_nodes': 5, 'max_seconds': 2.5}
+
+
+def test_nexus_structure_index(tmp_path, monkeypatch):
+    """Check that a structure index is written, reused with the same result and node count
+and invalidated when the file changes"""
+    local_dir = os.path.abspath(os.path.dirname(__file__))
+    example_data = os.path.join(tmp_path, '201805_WSe2_arpes.nxs')
+    file_util.copy_file(os.path.join(local_dir, 'data/nexus_test_data/201805_WSe2_arpes.nxs'),
+                        example_data)
+    index_dir = os.path.join(tmp_path, 'index')
+
+    def process(log_name, index=index_dir, exclude=None):
+        logger = logging.getLogger(log_name)
+        logger.setLevel(logging.DEBUG)
+        handler = logging.FileHandler(os.path.join(tmp_path, log_name), 'w')
+        logger.addHandler(handler)
+        nexus_helper = nexus.HandleNexus(logger, [example_data], index=index, exclude=exclude)
+        nexus_helper.process_nexus_master_file(None)
+        logger.removeHandler(handler)
+        handler.close()
+        with open(os.path.join(tmp_path, log_name), 'r') as logfile:
+            return logfile.readlines(), nexus_helper.node_count
+
+    log = process('without_index.log')
+    objects = nexus.load_structure_index(example_data, index_dir)
+    entry = [obj for obj in objects if obj['path'] == '/entry/sample/pressure'][0]
+    assert entry['kind'] == 'field'
+    assert entry['nxdef'] == 'NXarpes'
+    assert entry['nxdl_path'] == '/ENTRY/SAMPLE/pressure'
+    assert entry['class_path'] == '/NXentry/NXsample/pressure'
+    assert entry['shape'] == [] and entry['dtype'] == '<f8'
+    assert entry['attrs']['units'] == 'mbar'
+    opened = []
+    open_node = nexus.IndexedNode.open
+    monkeypatch.setattr(nexus.IndexedNode, 'open',
+                        lambda node: opened.append(node.index_entry) or open_node(node))
+    assert process('with_index.log') == log
+    # attributes are served from the index, only the values of fields are read
+    assert opened and all(obj['kind'] == 'field' for obj in opened)
+    # objects hard linked to an excluded path are visited at their other path, as without index
+    sample = [obj for obj in objects if obj['path'] == '/entry/sample/temperature'][0]
+    assert sample['shared']
+    assert process('exclude_with_index.log', exclude=['/entry/instrument']) == \
+        process('exclude_without_index.log', index=False, exclude=['/entry/instrument'])
+
+    os.utime(example_data, ns=(0, 0))
+    assert nexus.load_structure_index(example_data, index_dir) is None
+
+
+def test_nexus_default_plotable(tmp_path, caplog):
+    """Check that the default plotable is found from the records of the traversal,
+following the default attributes and stopping at missing targets"""
+    example_data = os.path.join(tmp_path, 'plotable.nxs')
+    with h5py.File(example_data, 'w') as h5_file:
+        h5_file.attrs['default'] = 'entry2'
+        h5_file.create_group('entry1').attrs['NX_class'] = 'NXentry'
+        entry = h5_file.create_group('entry2')
+        entry.attrs['NX_class'] = 'NXentry'
+        entry.attrs['default'] = 'process'
+        process = entry.create_group('process')
+        process.attrs['NX_class'] = 'NXprocess'
+        process.attrs['default'] = 'missing'
+        process.attrs['signal'] = 'counts'
+        process.create_dataset('counts', data=np.zeros((3, 4)))
+        process.create_dataset('x', data=np.arange(3)).attrs['axis'] = 1
+    logger = logging.getLogger('nexus_default_plotable')
+    logger.setLevel(logging.DEBUG)
+    with caplog.at_level(logging.DEBUG, logger='nexus_default_plotable'):
+        nexus.HandleNexus(logger, [example_data]).process_nexus_master_file(None)
+    messages = [record.getMessage() for record in caplog.records]
+    plotable = messages[messages.index('=== Default Plotable ==='):]
+    assert 'NXentry has been identified: /entry2' in plotable
+    assert 'NXdata group has been identified: /entry2/process' in plotable
+    assert 'Signal has been identified: /entry2/process/counts' in plotable
+    assert any(message.startswith('===== FIELD (//entry2/process/counts)')
+               for message in plotable)
+    assert 'For Axis #0, 1 axes have been identified: ' \
+        '[<HDF5 dataset "x": shape (3,), type "<i8">]' in plotable
+
+
+@pytest.mark.parametrize("link", ["soft", "hard"])
+@pytest.mark.parametrize("index", [False, True])
+def test_nexus_linked_plotable(tmp_path, caplog, link, index):
+    """Check that the default plotable is found through links which are not walked: an NXdata
+group with soft linked fields and an NXdata group hard linked to another path"""
+    example_data = os.path.join(tmp_path, 'linked.nxs')
+    with h5py.File(example_data, 'w') as h5_file:
+        entry = h5_file.create_group('entry')
+        entry.attrs['NX_class'] = 'NXentry'
+        detector = entry.create_group('instrument').create_group('detector')
+        detector.create_dataset('counts', data=np.arange(3.))
+        detector.create_dataset('x', data=np.arange(3))
+        data = entry.create_group('data' if link == 'soft' else 'instrument/data')
+        data.attrs['NX_class'] = 'NXdata'
+        data.attrs['signal'] = 'counts'
+        data.attrs['axes'] = 'x'
+        if link == 'soft':
+            data['counts'] = h5py.SoftLink('/entry/instrument/detector/counts')
+            data['x'] = h5py.SoftLink('/entry/instrument/detector/x')
+        else:
+            data['counts'] = detector['counts']
+            data['x'] = detector['x']
+            entry['plot'] = data  # visited as /entry/instrument/data
+            entry.attrs['default'] = 'plot'
+    nxdata = '/entry/data' if link == 'soft' else '/entry/plot'
+    logger = logging.getLogger('nexus_linked_plotable')
+    logger.setLevel(logging.DEBUG)
+    for _ in range(2 if index else 1):  # the second walk uses the index
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger='nexus_linked_plotable'):
+            nexus.HandleNexus(logger, [example_data], index=index)\
+                .process_nexus_master_file(None)
+        messages = [record.getMessage() for record in caplog.records]
+        plotable = messages[messages.index('=== Default Plotable ==='):]
+        assert f'NXdata group has been identified: {nxdata}' in plotable
+        assert f'Signal has been identified: {nxdata}/counts' in plotable
+        assert f'===== FIELD (/{nxdata}/counts): ' \
+            '<HDF5 dataset "counts": shape (3,), type "<f8">' in plotable
+        assert 'For Axis #0, 1 axes have been identified: ' \
+            '[<HDF5 dataset "x": shape (3,), type "<i8">]' in plotable
+
+
+@pytest.mark.parametrize("source", ["bytes", "bytesio", "zip-stored", "zip-deflated", "stream"])
+def test_nexus_file_content(tmp_path, source):
+    """Check that a NeXus file given by its content is processed like the file itself"""
+    local_dir = os.path.abspath(os.path.dirname(__file__))
+    example_data = os.path.join(local_dir, 'data/nexus_test_data/201805_WSe2_arpes.nxs')
+
+    def process(log_name, nexus_file):
+        logger = logging.getLogger(log_name)
+        logger.setLevel(logging.DEBUG)
+        handler = logging.FileHandler(os.path.join(tmp_path, log_name), 'w')
+        logger.addHandler(handler)
+        nexus.HandleNexus(logger, [nexus_file]).process_nexus_master_file(None)
+        logger.removeHandler(handler)
+        handler.close()
+        with open(os.path.join(tmp_path, log_name), 'r') as logfile:
+            return logfile.readlines()
+
+    with open(example_data, 'rb') as nexus_file:
+        content = nexus_file.read()
+    if source == "bytes":
+        nexus_file = content
+    elif source == "bytesio":
+        nexus_file = io.BytesIO(content)
+    elif source == "stream":
+        nexus_file = io.BufferedReader(io.BytesIO(content))
+        nexus_file.seekable = lambda: False
+    else:
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_STORED if source == "zip-stored"
+                             else zipfile.ZIP_DEFLATED) as zip_file:
+            zip_file.writestr('201805_WSe2_arpes.nxs', content)
+        nexus_file = zipfile.ZipFile(zip_buffer).open('201805_WSe2_arpes.nxs')
+    assert process('content.log', nexus_file) == process('file.log', example_data)
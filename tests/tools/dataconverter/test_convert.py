@@ -17,6 +17,8 @@
 #
 """Test cases for the convert script used to access the DataConverter."""
 
+import glob
+import json
 import os
 from distutils import file_util
 import logging
@@ -26,10 +28,18 @@ import h5py
 from nomad.datamodel import EntryArchive
 from nexusparser.tools import nexus  # noqa: E402
 import nexusparser.tools.dataconverter.convert as dataconverter
+from nexusparser.tools.dataconverter import batch
+from nexusparser.tools.dataconverter.readers import READERS
 from nexusparser.tools.dataconverter.readers.base.reader import BaseReader
 from nexusparser.parser import NexusParser  # noqa: E402
 
 
+@pytest.fixture(autouse=True)
+def fixture_plan_cache_dir(monkeypatch, tmp_path):
+    """Keeps the NXDL plans compiled by the conversions out of the user's cache directory."""
+    monkeypatch.setenv("NEXUS_PLAN_CACHE_DIR", str(tmp_path / "nxdl_plans"))
+
+
 def move_xarray_file_to_tmp(tmp_path):
     """Moves the xarray file, which is used to test linking into the tmp_path directory."""
     test_file_path = os.path.join(os.path.dirname(__file__),
@@ -80,6 +90,23 @@ def test_get_reader():
 def test_get_names_of_all_readers():
     """Unit test for the helper function to get all readers."""
     assert "example" in dataconverter.get_names_of_all_readers()
+    reader_folders = glob.glob(os.path.join("nexusparser", "tools", "dataconverter",
+                                            "readers", "*", "reader.py"))
+    assert sorted(READERS) == sorted(os.path.basename(os.path.dirname(folder))
+                                     for folder in reader_folders
+                                     if os.path.basename(os.path.dirname(folder)) != "base")
+
+
+def test_reader_entry_points(monkeypatch):
+    """Readers of other packages are registered with entry points and imported when used."""
+    monkeypatch.setattr(dataconverter, "get_reader_entry_points", lambda: {
+        "plugin": "nexusparser.tools.dataconverter.readers.example.reader:ExampleReader"})
+    monkeypatch.setattr(dataconverter, "_reader_modules", {})
+    monkeypatch.setattr(dataconverter, "_readers", {})
+    assert "plugin" in dataconverter.get_names_of_all_readers()
+    assert dataconverter.get_reader("plugin") is dataconverter.get_reader("example")
+    with pytest.raises(ValueError):
+        dataconverter.get_reader("doesnotexist")
 
 
 @pytest.mark.parametrize("cli_inputs", [
@@ -174,6 +201,112 @@ def test_compression(tmp_path):
     restore_xarray_file_from_tmp(tmp_path)
 
 
+def test_storage_policy(tmp_path):
+    """A test for the convert CLI to check whether a storage policy file is applied."""
+
+    dirpath = os.path.join(os.path.dirname(__file__),
+                           "../../data/tools/dataconverter/readers/example")
+    policy_file = os.path.join(tmp_path, "policy.yaml")
+    with open(policy_file, "w") as policy:
+        policy.write("storage:\n"
+                     "  - path: /ENTRY/test_compression/*\n"
+                     "    reader: example\n"
+                     "    compression: lzf\n")
+
+    move_xarray_file_to_tmp(tmp_path)
+
+    runner = CliRunner()
+    result = runner.invoke(dataconverter.convert_cli, [
+        "--input-file", os.path.join(dirpath, "testdata.json"),
+        "--reader", "example",
+        "--nxdl", "NXtest",
+        "--output", os.path.join(tmp_path, "test_output.h5"),
+        "--storage-policy", policy_file
+    ])
+    assert result.exit_code == 0
+
+    test_nxs = h5py.File(os.path.join(tmp_path, "test_output.h5"), "r")
+    assert test_nxs['/entry/test_compression/compressed_data'].compression == 'lzf'
+    assert test_nxs['/entry/test_compression/not_to_compress'].compression is None
+
+    restore_xarray_file_from_tmp(tmp_path)
+
+
+def test_append(tmp_path):
+    """A test for appending entries to an existing file with the convert CLI."""
+    dirpath = os.path.join(os.path.dirname(__file__),
+                           "../../data/tools/dataconverter/readers/example")
+    output = os.path.join(tmp_path, "test_output.h5")
+
+    move_xarray_file_to_tmp(tmp_path)
+
+    runner = CliRunner()
+    for entry_name in ("first", "second"):
+        result = runner.invoke(dataconverter.convert_cli, [
+            "--input-file", os.path.join(dirpath, "testdata.json"),
+            "--reader", "example",
+            "--nxdl", "NXtest",
+            "--output", output,
+            "--append",
+            "--entry-name", entry_name
+        ])
+        assert result.exit_code == 0
+    result = runner.invoke(dataconverter.convert_cli, [
+        "--input-file", os.path.join(dirpath, "testdata.json"),
+        "--reader", "example",
+        "--nxdl", "NXtest",
+        "--output", output,
+        "--append"
+    ])
+    assert result.exit_code == 0
+
+    with h5py.File(output, "r") as test_nxs:
+        assert sorted(test_nxs.keys()) == ["entry", "first", "second"]
+        assert test_nxs.get("/second/test_link/internal_link", getlink=True).path == \
+            "/second/NXODD_name/posint_value"
+
+    restore_xarray_file_from_tmp(tmp_path)
+
+
+@pytest.mark.parametrize("manifest", ["attrs", "sidecar"])
+def test_up_to_date(tmp_path, caplog, manifest):
+    """A test for skipping conversions whose outputs are up to date."""
+    dirpath = os.path.join(os.path.dirname(__file__),
+                           "../../data/tools/dataconverter/readers/example")
+    input_file = os.path.join(tmp_path, "testdata.json")
+    file_util.copy_file(os.path.join(dirpath, "testdata.json"), input_file)
+    output = os.path.join(tmp_path, "test_output.h5")
+
+    move_xarray_file_to_tmp(tmp_path)
+
+    def convert(**kwargs):
+        caplog.clear()
+        dataconverter.convert((input_file,), "example", "NXtest", output, manifest=manifest,
+                              **kwargs)
+        return "The output file is up to date" not in caplog.text
+
+    assert convert()
+    if manifest == "sidecar":
+        assert os.path.exists(f"{output}.manifest.json")
+    else:
+        with h5py.File(output, "r") as test_nxs:
+            assert json.loads(test_nxs.attrs["dataconverter_manifest"])[""]["reader"] == \
+                "example"
+    assert not convert()
+    os.utime(input_file, ns=(0, 0))  # touched, but the content is the same
+    assert not convert()
+    assert convert(fair=False, entry_name="renamed")
+    with open(input_file, "a") as input_json:
+        input_json.write(" ")
+    assert convert(fair=False, entry_name="renamed")
+    assert not convert(fair=False, entry_name="renamed")
+    # appending is another conversion, which finds the entry in the file
+    with pytest.raises(Exception, match="already exist"):
+        convert(append=True, entry_name="renamed")
+
+    restore_xarray_file_from_tmp(tmp_path)
+
+
 def test_mpes_writing(tmp_path):
     """Check if mpes example can be reproduced"""
     # dataconverter
@@ -207,3 +340,44 @@ def test_mpes_writing(tmp_path):
     assert archive.nexus.nx_application_mpes.\
         nx_group_ENTRY[0].nx_group_PROCESS[0].nx_group_energy_calibration.\
         nx_field_calibrated_axis.nx_value[0] + 46.0315977 < 1e-6
+
+
+@pytest.mark.parametrize("workers", [
+    pytest.param(1, id="in-process"),
+    pytest.param(2, id="process-pool"),
+])
+def test_batch_convert(tmp_path, workers):
+    """A test for the batch conversion of the items of a manifest with failing items."""
+    dirpath = os.path.join(os.path.dirname(__file__),
+                           "../../data/tools/dataconverter/readers/example")
+    manifest = os.path.join(tmp_path, "manifest.csv")
+    with open(manifest, "w") as manifest_file:
+        manifest_file.write("input-file,output,nxdl\n")
+        for name in ("first", "second"):
+            manifest_file.write(f"{os.path.join(dirpath, 'testdata.json')},"
+                                f"{os.path.join(tmp_path, name)}.nxs,\n")
+        manifest_file.write(f"missing.json,{os.path.join(tmp_path, 'missing.nxs')},\n")
+        manifest_file.write(f"{os.path.join(dirpath, 'testdata.json')},"
+                            f"{os.path.join(tmp_path, 'unknown.nxs')},NXdoesnotexist\n")
+    assert batch.read_manifest(manifest)[0] == {
+        "input_file": (os.path.join(dirpath, "testdata.json"),),
+        "output": os.path.join(tmp_path, "first.nxs")}
+
+    move_xarray_file_to_tmp(tmp_path)
+
+    report = os.path.join(tmp_path, "report.jsonl")
+    runner = CliRunner()
+    result = runner.invoke(batch.batch_cli, [manifest, "--reader", "example", "--nxdl", "NXtest",
+                                             "--workers", str(workers), "--report", report])
+    assert result.exit_code == 1
+    with open(report, "r") as report_file:
+        results = sorted((json.loads(line) for line in report_file),
+                         key=lambda result: result["index"])
+    assert [result["status"] for result in results] == ["done", "done", "failed", "failed"]
+    assert "FileNotFoundError" in results[3]["error"]
+    assert all(result["seconds"] > 0 for result in results)
+    for name in ("first", "second"):
+        with h5py.File(os.path.join(tmp_path, f"{name}.nxs"), "r") as test_nxs:
+            assert "entry/NXODD_name/float_value" in test_nxs
+
+    restore_xarray_file_from_tmp(tmp_path)
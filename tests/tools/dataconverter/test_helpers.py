@@ -146,6 +146,24 @@ TEMPLATE["optional_parents"].append("/ENTRY[entry]/optional_parent")
         ("The value at /ENTRY[my_entry]/NXODD_name/posint_value "
          "should be a positive int."),
         id="negative-posint"),
+    pytest.param(
+        alter_dict(TEMPLATE, "/ENTRY[my_entry]/NXODD_name/posint_value",
+                   np.array([1, 2, -3], dtype=np.int8)),
+        ("The value at /ENTRY[my_entry]/NXODD_name/posint_value "
+         "should be a positive int."),
+        id="negative-posint-in-array"),
+    pytest.param(
+        alter_dict(TEMPLATE, "/ENTRY[my_entry]/NXODD_name/int_value", np.array([1.5, 2.5])),
+        ("The value at /ENTRY[my_entry]/NXODD_name/in"
+         "t_value should be of Python type: (<class 'int'>, <cla"
+         "ss 'numpy.ndarray'>, <class 'numpy.signedinteger'>),"
+         " as defined in the NXDL as NX_INT."),
+        id="float-array-instead-of-int"),
+    pytest.param(
+        alter_dict(TEMPLATE, "/ENTRY[my_entry]/NXODD_name/float_value",
+                   np.linspace(0, 1, 10 ** 6)),
+        "",
+        id="large-float-array"),
     pytest.param(
         alter_dict(TEMPLATE, "/ENTRY[my_entry]/NXODD_name/char_value", 3),
         ("The value at /ENTRY[my_entry]/NXODD_name/char_value should be of Python type:"
@@ -181,6 +199,12 @@ TEMPLATE["optional_parents"].append("/ENTRY[entry]/optional_parent")
         " ISO8601 formatted str. For example, 2022-01-22T12:14:12.05018Z or 2022-01-22"
         "T12:14:12.05018+00:00.",
         id="UTC-with--00:00"),
+    pytest.param(
+        alter_dict(TEMPLATE,
+                   "/ENTRY[my_entry]/NXODD_name/date_value",
+                   np.array(["2022-01-22T12:14:12.05018Z", "2022-01-22T12:14:13.05018Z"])),
+        "",
+        id="array-of-dates"),
     pytest.param(
         listify_template(TEMPLATE),
         "",
@@ -218,7 +242,9 @@ def test_validate_data_dict(data_dict, error_message, template, nxdl_root, reque
                                     "UTC-with-+00:00",
                                     "UTC-with-Z",
                                     "no-child-provided-optional-parent",
-                                    "int-instead-of-chars"):
+                                    "int-instead-of-chars",
+                                    "large-float-array",
+                                    "array-of-dates"):
         helpers.validate_data_dict(template, data_dict, nxdl_root)
     else:
         with pytest.raises(Exception) as execinfo:
@@ -240,3 +266,37 @@ def test_validate_data_dict(data_dict, error_message, template, nxdl_root, reque
 def test_path_in_data_dict(nxdl_path, expected, template):
     """Unit test for helper function to check if an NXDL path exists in the reader dictionary."""
     assert helpers.path_in_data_dict(nxdl_path, template) == expected
+    assert helpers.path_in_data_dict(nxdl_path, template,
+                                     helpers.index_data_dict(template)) == expected
+
+
+@pytest.mark.parametrize("value,nxdl_type,valid", [
+    pytest.param(np.array([1, 2]), "NX_CHAR", True, id="int-array-for-char"),
+    pytest.param(np.array([0, 1]), "NX_BOOLEAN", True, id="int-array-for-boolean"),
+    pytest.param(np.array([1j]), "NX_FLOAT", True, id="complex-array-for-float"),
+    pytest.param(np.array([1j]), "NX_NUMBER", True, id="complex-array-for-number"),
+    pytest.param(np.array([1.5]), "NX_INT", False, id="float-array-for-int"),
+    pytest.param(np.array([1j]), "NX_POSINT", False, id="complex-array-for-posint"),
+    pytest.param(np.array([True]), "NX_INT", False, id="bool-array-for-int"),
+    pytest.param(np.array(["1"]), "NX_UINT", False, id="str-array-for-uint"),
+    pytest.param(np.array([-1], dtype=np.int8), "NX_UINT", False, id="negative-array-for-uint"),
+    pytest.param(np.array([0.5]), "NX_BOOLEAN", False, id="float-array-for-boolean"),
+    pytest.param(np.array(["true"]), "NX_BOOLEAN", False, id="str-array-for-boolean"),
+    pytest.param(np.array([True]), "NX_FLOAT", False, id="bool-array-for-float"),
+    pytest.param(np.array(["1.5"]), "NX_NUMBER", False, id="str-array-for-number"),
+    pytest.param(np.array([1]), "NX_DATE_TIME", False, id="int-array-for-date"),
+    pytest.param(np.array(["2022-01-22"]), "ISO8601", False, id="array-of-dates-without-time"),
+])
+def test_array_types(value, nxdl_type, valid):
+    """Arrays are accepted as before by their dtype kind, except for the kinds which can't
+    hold the NeXus type, e.g. floats for integers, or invalid values like negative NX_UINTs."""
+    if valid:
+        assert helpers.is_valid_data_field(value, nxdl_type, "/ENTRY/value") is value
+    else:
+        with pytest.raises(Exception):
+            helpers.is_valid_data_field(value, nxdl_type, "/ENTRY/value")
+
+
+def test_int_list_for_char():
+    """Lists of other types than str are converted to str for NX_CHAR"""
+    assert helpers.is_valid_data_field([1, 2], "NX_CHAR", "/ENTRY/value") == "[1, 2]"
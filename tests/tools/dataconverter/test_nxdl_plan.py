@@ -0,0 +1,84 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Test cases for the compiled NXDL plans used by the DataConverter."""
+
+import os
+
+import pytest
+
+from nexusparser.tools.dataconverter import helpers, nxdl_plan
+from nexusparser.tools.dataconverter.writer import Writer
+from .test_helpers import fixture_filled_test_data, fixture_template  # pylint: disable=unused-import
+
+NXTEST_PATH = os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
+
+
+@pytest.fixture(autouse=True)
+def clear_plans():
+    """Compiles the plans again in each test"""
+    nxdl_plan._plans.clear()  # pylint: disable=protected-access
+
+
+def test_plan_template(template, monkeypatch, tmp_path):
+    """The template of a plan is the one generated from the NXDL"""
+    monkeypatch.setenv("NEXUS_PLAN_CACHE_DIR", str(tmp_path))
+    plan = nxdl_plan.get_plan(NXTEST_PATH)
+    plan_template = nxdl_plan.get_template(plan)
+    assert list(plan_template.store.items()) == list(template.store.items())
+    assert plan_template.optional_parents == template.optional_parents
+    info = plan["nodes"]["/ENTRY/NXODD_name/posint_value"]
+    assert info["type"] == "NX_POSINT"
+    assert info["required"] == "<<REQUIRED>>"
+    assert plan["nodes"]["/ENTRY/NXODD_name/type"]["enums"] is not None
+
+
+def test_plan_cache(monkeypatch, tmp_path):
+    """Plans are cached on disk and loaded again by their definition hash"""
+    monkeypatch.setenv("NEXUS_PLAN_CACHE_DIR", str(tmp_path))
+    definition_hash = nxdl_plan.get_definition_hash(NXTEST_PATH)
+    plan = nxdl_plan.get_plan(NXTEST_PATH)
+    assert os.path.exists(os.path.join(tmp_path, f"{definition_hash}.json"))
+    assert nxdl_plan.load_plan(definition_hash) == {key: value for key, value in plan.items()
+                                                    if key != "nxdl_path"}
+
+
+def test_validate_with_plan(filled_test_data, monkeypatch, tmp_path):
+    """Data is validated with the nodes of the plan"""
+    monkeypatch.setenv("NEXUS_PLAN_CACHE_DIR", str(tmp_path))
+    plan = nxdl_plan.get_plan(NXTEST_PATH)
+    nxdl_root = helpers.ET.parse(NXTEST_PATH).getroot()
+    assert helpers.validate_data_dict(nxdl_plan.get_template(plan), filled_test_data,
+                                      nxdl_root, plan)
+
+
+def test_warm_plan_without_nxdl(filled_test_data, monkeypatch, tmp_path):
+    """With a warm plan, data is validated and written without parsing the NXDL"""
+    monkeypatch.setenv("NEXUS_PLAN_CACHE_DIR", str(tmp_path))
+    plan = nxdl_plan.get_plan(NXTEST_PATH)
+    helpers.validate_data_dict(nxdl_plan.get_template(plan), filled_test_data, None, plan)
+    nxdl_plan.save_plan(plan)
+    nxdl_plan._plans.clear()  # pylint: disable=protected-access
+    helpers._nxdl_roots.clear()  # pylint: disable=protected-access
+
+    def fail_parse(source):
+        raise AssertionError(f"{source} was parsed")
+
+    monkeypatch.setattr(helpers.ET, "parse", fail_parse)
+    plan = nxdl_plan.get_plan(NXTEST_PATH)
+    assert helpers.validate_data_dict(nxdl_plan.get_template(plan), filled_test_data, None, plan)
+    Writer(filled_test_data, NXTEST_PATH, os.path.join(tmp_path, "test.nxs"), plan=plan).write()
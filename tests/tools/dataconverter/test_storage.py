@@ -0,0 +1,188 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Test cases for the storage policies of the DataConverter"""
+
+import mmap
+import os
+import xml.etree.ElementTree as ET
+
+import h5py
+import numpy as np
+import pytest
+
+from nexusparser.tools.dataconverter import helpers, storage
+from nexusparser.tools.dataconverter.lazy import LazyValue, is_memory_mapped, iter_slabs
+from nexusparser.tools.dataconverter.writer import Writer
+from .test_helpers import fixture_filled_test_data, fixture_template  # pylint: disable=unused-import
+
+
+@pytest.mark.parametrize("shape,itemsize,frame_axis,expected", [
+    pytest.param((1000, 256, 256), 4, 0, (4, 256, 256), id="frames"),
+    pytest.param((10, 1024, 1024), 4, 0, (1, 512, 512), id="large-frames"),
+    pytest.param((256, 256, 1000), 4, -1, (256, 256, 4), id="last-axis"),
+    pytest.param((10 ** 7,), 8, 0, (2 ** 17,), id="one-dimensional"),
+    pytest.param((3, 4), 8, 0, (3, 4), id="small"),
+    pytest.param((1024, 1024), 8, None, (256, 512), id="no-frame-axis"),
+])
+def test_get_chunk_shape(shape, itemsize, frame_axis, expected):
+    """Chunks are made of whole frames of about the chunk size"""
+    assert storage.get_chunk_shape(shape, itemsize, frame_axis) == expected
+
+
+def test_dataset_options():
+    """The first matching rule applies, large arrays are chunked without one"""
+    policy = storage.StoragePolicy([
+        {"path": "/ENTRY/DATA/*", "reader": "mpes", "compression": "lzf", "shuffle": True},
+        {"path": "/ENTRY/DATA/*", "min_size": 1000, "compression": "gzip",
+         "compression_opts": 1, "fletcher32": True, "chunks": [10, 10]},
+        {"path": "/ENTRY/DATA/*", "chunks": False, "fillvalue": -1},
+    ], reader="example")
+    large = np.zeros((100, 100))
+    assert policy.get_dataset_options("/ENTRY/DATA/data", large) == {
+        "compression": "gzip", "compression_opts": 1, "fletcher32": True, "chunks": (10, 10)}
+    assert policy.get_dataset_options("/ENTRY/DATA/data", np.zeros(3)) == {"fillvalue": -1}
+    assert policy.get_dataset_options("/ENTRY/other", np.zeros(3)) == {}
+    assert policy.get_dataset_options("/ENTRY/other", np.zeros(3), compress=True) == {
+        "compression": "gzip", "compression_opts": 4, "shuffle": True, "chunks": (3,)}
+    assert policy.get_dataset_options("/ENTRY/other", "no array", compress=True) == {}
+    assert "chunks" in policy.get_dataset_options("/ENTRY/other",
+                                                  np.zeros(storage.AUTO_CHUNK_SIZE))
+    with pytest.raises(ValueError):
+        storage.StoragePolicy([{"compresion": "gzip"}])
+    with pytest.raises(ValueError):
+        storage.StoragePolicy([{"chunks": [10, 0]}])
+    with pytest.raises(ValueError):
+        storage.StoragePolicy([{"chunks": "large"}])
+    with pytest.raises(ValueError):  # chunks of another rank than the array
+        policy.get_dataset_options("/ENTRY/DATA/data", np.zeros((10, 10, 10)))
+
+
+def test_write_with_policy(filled_test_data, tmp_path):
+    """The Writer stores datasets as the policy chooses"""
+    filled_test_data["/ENTRY[my_entry]/NXODD_name/float_value"] = np.linspace(0, 1, 1000)
+    policy_file = os.path.join(tmp_path, "policy.yaml")
+    with open(policy_file, "w") as policy:
+        policy.write("storage:\n"
+                     "  - path: /ENTRY/NXODD_name/float_value\n"
+                     "    compression: lzf\n"
+                     "    shuffle: true\n")
+    Writer(filled_test_data, os.path.join("tests", "data", "tools", "dataconverter",
+                                          "NXtest.nxdl.xml"),
+           os.path.join(tmp_path, "test.nxs"), storage.load_storage_policy(policy_file)).write()
+    with h5py.File(os.path.join(tmp_path, "test.nxs"), "r") as test_nxs:
+        dataset = test_nxs["/my_entry/NXODD_name/float_value"]
+        assert dataset.compression == "lzf"
+        assert dataset.shuffle
+        assert dataset[999] == 1
+        assert test_nxs["/my_entry/NXODD_name/posint_value"].chunks is None
+
+
+@pytest.mark.parametrize("shuffle,fillvalue", [
+    pytest.param(True, None, id="shuffle"),
+    pytest.param(False, -1.0, id="fillvalue"),
+])
+def test_write_chunks_in_parallel(shuffle, fillvalue, tmp_path):
+    """Chunks compressed in threads are read back by HDF5 like chunks it compressed itself"""
+    value = np.random.default_rng(0).random((37, 300, 301)) // 0.01
+    options = {"compression": "gzip", "compression_opts": 4, "shuffle": shuffle,
+               "chunks": (4, 128, 128)}
+    if fillvalue is not None:
+        options["fillvalue"] = fillvalue
+    with h5py.File(os.path.join(tmp_path, "test.h5"), "w") as h5_file:
+        storage.write_chunks_in_parallel(h5_file, "parallel", value, options, 4)
+        h5_file.create_dataset("serial", data=value, **options)
+    with h5py.File(os.path.join(tmp_path, "test.h5"), "r") as h5_file:
+        parallel = h5_file["parallel"]
+        assert parallel.compression == "gzip"
+        assert parallel.shuffle == shuffle
+        np.testing.assert_array_equal(parallel[()], value)
+        assert parallel.id.read_direct_chunk((36, 256, 256)) == \
+            h5_file["serial"].id.read_direct_chunk((36, 256, 256))
+
+
+@pytest.mark.parametrize("length", [
+    pytest.param(1000, id="known-length"),
+    pytest.param(None, id="unknown-length"),
+])
+def test_write_lazy_value(length, tmp_path):
+    """Lazy values are written slab by slab through a bounded buffer"""
+    def slabs():
+        for start in range(0, 1000, 30):
+            yield np.arange(start, min(start + 30, 1000), dtype=np.int32)[:, None] * [1, -1]
+
+    value = LazyValue((length, 2), np.int32, slabs)
+    with h5py.File(os.path.join(tmp_path, "test.h5"), "w") as h5_file:
+        dataset = storage.write_lazy_value(h5_file, "lazy", value, {}, buffer_size=800)
+        assert dataset.shape == (1000, 2)
+        assert dataset.dtype == np.int32
+        np.testing.assert_array_equal(dataset[:, 0], np.arange(1000))
+        np.testing.assert_array_equal(dataset[:, 1], -np.arange(1000))
+        with pytest.raises(ValueError):
+            storage.write_lazy_value(h5_file, "short", LazyValue((2000, 2), np.int32, slabs),
+                                     {})
+
+
+def test_write_lazy_template_value(filled_test_data, tmp_path):
+    """Readers can put lazy values into the template, which are validated and written"""
+    filled_test_data["/ENTRY[my_entry]/NXODD_name/float_value"] = LazyValue(
+        (None, 4, 4), np.float32, (np.ones((frames, 4, 4)) for frames in (3, 5, 1)))
+    helpers.validate_data_dict(filled_test_data, filled_test_data, ET.parse(
+        os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")).getroot())
+    Writer(filled_test_data, os.path.join("tests", "data", "tools", "dataconverter",
+                                          "NXtest.nxdl.xml"),
+           os.path.join(tmp_path, "test.nxs")).write()
+    with h5py.File(os.path.join(tmp_path, "test.nxs"), "r") as test_nxs:
+        assert test_nxs["/my_entry/NXODD_name/float_value"].shape == (9, 4, 4)
+        assert test_nxs["/my_entry/NXODD_name/float_value"].attrs["units"] == "nm"
+
+
+def test_write_memory_mapped(filled_test_data, tmp_path, monkeypatch):
+    """Memory-mapped arrays and buffers are validated and written in slabs, without copies"""
+    slab_writes = []
+    write_lazy_value = storage.write_lazy_value
+
+    def write_in_slabs(grp, name, *args):
+        slab_writes.append(name)
+        return write_lazy_value(grp, name, *args)
+
+    monkeypatch.setattr(storage, "write_lazy_value", write_in_slabs)
+    raw_file_name = os.path.join(tmp_path, "raw.bin")
+    np.arange(3000, dtype=np.float32).tofile(raw_file_name)
+    events = np.memmap(raw_file_name, dtype=np.float32, mode="r", shape=(1000, 3))
+    with open(raw_file_name, "rb") as raw_file:
+        raw = mmap.mmap(raw_file.fileno(), 0, access=mmap.ACCESS_READ)
+    assert is_memory_mapped(events[10:, 1])
+    assert is_memory_mapped(np.frombuffer(raw, dtype=np.float32))
+    assert is_memory_mapped(memoryview(raw))
+    assert not is_memory_mapped(np.array(events))
+    assert [len(slab) for slab in iter_slabs(events, 5000)] == [416, 416, 168]
+
+    filled_test_data["/ENTRY[my_entry]/NXODD_name/float_value"] = events
+    filled_test_data["/ENTRY[my_entry]/optional_parent/required_child"] = memoryview(
+        np.frombuffer(raw, dtype=np.int32))
+    nxdl_path = os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
+    helpers.validate_data_dict(filled_test_data, filled_test_data,
+                               ET.parse(nxdl_path).getroot())
+    Writer(filled_test_data, nxdl_path, os.path.join(tmp_path, "test.nxs"),
+           storage.StoragePolicy(buffer_size=5000)).write()
+    with h5py.File(os.path.join(tmp_path, "test.nxs"), "r") as test_nxs:
+        np.testing.assert_array_equal(test_nxs["/my_entry/NXODD_name/float_value"][()],
+                                      np.arange(3000, dtype=np.float32).reshape(1000, 3))
+        np.testing.assert_array_equal(test_nxs["/my_entry/optional_parent/required_child"][()],
+                                      np.arange(3000, dtype=np.float32).view(np.int32))
+    assert slab_writes == ["float_value", "required_child"]
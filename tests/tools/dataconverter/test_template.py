@@ -17,6 +17,9 @@
 #
 """Test cases for template class for the DataConverter"""
 
+import math
+
+from nexusparser.tools.dataconverter.template import CopyOnWriteStore, Template
 from .test_helpers import fixture_template  # pylint: disable=unused-import
 
 
@@ -31,3 +34,81 @@ def test_add_entry(template):
     template.add_entry("test_entry")
     assert "/ENTRY[entry]/program_name" in template.keys()
     assert "/ENTRY[test_entry]/program_name" in template.keys()
+
+
+def test_optionality_views(template):
+    """Unit test for the live optionality views and key membership of the template."""
+    keys = template.keys()
+    assert "/ENTRY[entry]/program_name" in template
+    assert "/ENTRY[entry]/new_path" not in keys
+    template["/ENTRY[entry]/new_path"] = 1
+    assert "/ENTRY[entry]/new_path" in keys
+    assert "/ENTRY[entry]/new_path" in template["undocumented"]
+    assert template["undocumented"]["/ENTRY[entry]/new_path"] == 1
+
+    template["required"]["/ENTRY[entry]/new_path"] = 2
+    assert "/ENTRY[entry]/new_path" not in template.undocumented
+    assert template["/ENTRY[entry]/new_path"] == 2
+    assert len(template) == len(template.optional) + len(template.recommended) + \
+        len(template.required) + len(template.undocumented)
+
+    del template["required"]["/ENTRY[entry]/new_path"]
+    assert "/ENTRY[entry]/new_path" not in template
+
+
+def test_clone_copy_on_write(template):
+    """Unit test for cloning the template and changing only the clone afterwards."""
+    clone = Template(template)
+    assert clone.keys() == template.keys()
+    clone["/ENTRY[entry]/program_name"] = "Cloned program"
+    clone["/ENTRY[entry]/new_path"] = 1
+    del clone["/ENTRY[entry]/definition"]
+    assert template["/ENTRY[entry]/program_name"] is None
+    assert "/ENTRY[entry]/new_path" not in template
+    assert "/ENTRY[entry]/definition" in template
+    assert "/ENTRY[entry]/definition" not in clone
+    assert len(clone) == len(template)
+
+    template["/ENTRY[entry]/program_name"] = "Original program"
+    assert Template(clone)["/ENTRY[entry]/program_name"] == "Cloned program"
+    assert Template(template)["/ENTRY[entry]/program_name"] == "Original program"
+
+
+def test_items_sorted(template):
+    """Unit test for the items of a template, which are sorted by path as before the store"""
+    template["/ENTRY[entry]/b_added"] = 1
+    template["/ENTRY[entry]/a_added"] = 2
+    paths = [path for path, _ in template.items()]
+    assert paths == sorted(template.keys())
+    assert dict(template.items())["/ENTRY[entry]/a_added"] == 2
+
+
+def test_clone_layers():
+    """Unit test for cloning a store repeatedly, sharing its frozen layers, which are merged
+    so that there are only logarithmically many of them."""
+    store = CopyOnWriteStore({"a": 1, "b": 2})
+    clones = []
+    for index in range(1000):
+        store[f"key_{index}"] = index
+        del store["a" if index == 0 else f"key_{index - 1}"]
+        clones.append(store.clone())
+        assert clones[-1].layers is store.layers
+        assert len(store.layers) <= math.log2(index + 2) + 1
+    assert dict(store) == {"b": 2, "key_999": 999}
+    assert len(store) == 2
+    assert dict(clones[0]) == {"b": 2, "key_0": 0}
+    assert len(clones[0]) == 2
+    assert dict(clones[500]) == {"b": 2, "key_500": 500}
+
+
+def test_rename_entry_links(template):
+    """Internal links into the renamed entry follow it, other paths are kept"""
+    template["/@default"] = "entry"
+    template["/ENTRY[entry]/program_name"] = {"link": "/entry/NXODD_name/float_value"}
+    template["/ENTRY[entry]/NXODD_name/float_value"] = {"link": "/other/float_value"}
+    template.rename_entry("entry", "newentry")
+    assert template["/ENTRY[newentry]/program_name"] == {
+        "link": "/newentry/NXODD_name/float_value"}
+    assert template["/ENTRY[newentry]/NXODD_name/float_value"] == {
+        "link": "/other/float_value"}
+    assert template["/@default"] == "entry"
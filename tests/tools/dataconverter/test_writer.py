@@ -21,8 +21,10 @@ import os
 
 import pytest
 import h5py
+import numpy as np
 
-from nexusparser.tools.dataconverter.writer import Writer
+from nexusparser.tools.dataconverter.template import Template
+from nexusparser.tools.dataconverter.writer import SourceFiles, Writer, handle_dicts_entries
 from .test_helpers import fixture_filled_test_data, fixture_template  # pylint: disable=unused-import
 
 
@@ -63,3 +65,127 @@ given in the template dictionary."""
     print(type(writer))
     test_nxs = h5py.File(writer.output_path, "r")
     assert isinstance(test_nxs["/my_entry/links/ext_link"], h5py.Dataset)
+
+
+def test_group_tree(writer):
+    """Test for the groups the Writer creates, each once and parents first."""
+    groups = writer.get_group_tree()
+    assert groups["/my_entry/optional_parent"][0] == "/ENTRY[my_entry]/optional_parent"
+    assert groups["/my_entry/does/not"][0] is None
+    assert "/my_entry/NXODD_name/int_value" not in groups
+    writer.write()
+    test_nxs = h5py.File(writer.output_path, "r")
+    assert test_nxs["/my_entry/optional_parent"].attrs["NX_class"] == "NXdata"
+
+
+def test_nxdl_groups(writer):
+    """Test for the cache of the NXDL attributes of the groups the Writer creates."""
+    writer.write()
+    attrs, attr_names = writer.nxdl_groups["/ENTRY/optional_parent"]
+    assert attrs["type"] == "NXdata"
+    assert "name" not in attrs
+    assert attr_names == []
+
+
+def test_index_data(writer):
+    """Test for the index of units and attributes by the path they belong to."""
+    fields, units, attributes = writer.index_data()
+    assert ("/ENTRY[my_entry]/program_name", "program_name", "Testing program") in fields
+    assert units["/ENTRY[my_entry]/NXODD_name/int_value"] == "eV"
+    assert attributes["/ENTRY[my_entry]/definition"] == [("/ENTRY[my_entry]/definition/@version",
+                                                          "version", "2.4.6")]
+
+
+def test_source_files(tmp_path):
+    """Test for the pool of source files, which opens each file once and closes it."""
+    source_path = os.path.join(tmp_path, "source.h5")
+    with h5py.File(source_path, "w") as source:
+        source["data"] = np.zeros((4, 3), dtype=np.float32)
+        source["other"] = np.zeros(5, dtype=np.int16)
+    with SourceFiles() as sources:
+        assert sources.get_dataset_info(source_path, "data") == ((4, 3), np.float32)
+        assert sources.get_shape(os.path.join(tmp_path, ".", "source.h5"), "other") == (5,)
+        assert len(sources.files) == 1
+        source = sources.get_file(source_path)
+    assert not source
+
+
+def test_virtual_dataset_dtypes(tmp_path):
+    """Test for virtual datasets, which take their dtype and shape from their sources."""
+    source_path = os.path.join(tmp_path, "source.h5")
+    with h5py.File(source_path, "w") as source:
+        source["float"] = np.arange(20, dtype=np.float32).reshape(10, 2)
+        source["int"] = np.arange(6, dtype=np.int16).reshape(3, 2)
+        source["text"] = np.array([b"a", b"b"])
+    with h5py.File(os.path.join(tmp_path, "test.h5"), "w") as test_h5:
+        sliced = handle_dicts_entries({"link": f"{source_path}:/float",
+                                       "shape": np.index_exp[1:8:3, :]},
+                                      test_h5, "sliced", test_h5.filename)
+        assert sliced.dtype == np.float32
+        assert sliced.shape == (3, 2)
+        assert sliced[2, 1] == 15
+        concatenated = handle_dicts_entries({"link": [f"{source_path}:/float",
+                                                      f"{source_path}:/int"]},
+                                            test_h5, "concatenated", test_h5.filename)
+        assert concatenated.dtype == np.float32
+        assert concatenated.shape == (13, 2)
+        assert concatenated[12, 1] == 5
+        with pytest.raises(ValueError):
+            handle_dicts_entries({"link": [f"{source_path}:/float", f"{source_path}:/text"]},
+                                 test_h5, "rejected", test_h5.filename)
+
+
+def test_append(filled_test_data, tmp_path):
+    """New entries are appended to an existing file, which keeps its entries and attributes"""
+    nxdl_path = os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
+    output_path = os.path.join(tmp_path, "test.nxs")
+    filled_test_data["/@default"] = "my_entry"
+    Writer(filled_test_data, nxdl_path, output_path).write()
+
+    filled_test_data.rename_entry("my_entry", "second_entry")
+    filled_test_data["/@default"] = "second_entry"
+    filled_test_data["/ENTRY[second_entry]/NXODD_name/int_value"] = 3
+    Writer(filled_test_data, nxdl_path, output_path, append=True).write()
+    with h5py.File(output_path, "r") as test_nxs:
+        assert sorted(test_nxs.keys()) == ["my_entry", "second_entry"]
+        assert test_nxs["/my_entry/NXODD_name/int_value"][()] == 2
+        assert test_nxs["/second_entry/NXODD_name/int_value"][()] == 3
+        assert test_nxs["/second_entry/NXODD_name"].attrs["NX_class"] == "NXdata"
+        assert test_nxs.attrs["default"] == "my_entry"
+
+    # appending an existing entry fails and leaves the file as it is
+    filled_test_data["/ENTRY[third_entry]/NXODD_name/int_value"] = 4
+    with pytest.raises(Exception, match="already exist"):
+        Writer(filled_test_data, nxdl_path, output_path, append=True).write()
+    with h5py.File(output_path, "r") as test_nxs:
+        assert sorted(test_nxs.keys()) == ["my_entry", "second_entry"]
+
+    # the groups of a failed append are removed again
+    filled_test_data.rename_entry("second_entry", "fourth_entry")
+    filled_test_data["/ENTRY[fourth_entry]/NXODD_name/broken"] = {"unknown": 1}
+    with pytest.raises(Exception, match="broken"):
+        Writer(filled_test_data, nxdl_path, output_path, append=True).write()
+    with h5py.File(output_path, "r") as test_nxs:
+        assert sorted(test_nxs.keys()) == ["my_entry", "second_entry"]
+
+
+def test_external_link_attributes(tmp_path, caplog):
+    """External link targets are opened read-only: their units and attributes are skipped"""
+    source_path = os.path.join(tmp_path, "source.h5")
+    with h5py.File(source_path, "w") as source:
+        source["data"] = np.arange(3)
+    data = Template()
+    data["/ENTRY[my_entry]/links/ext_link"] = {"link": f"{source_path}:/data"}
+    data["/ENTRY[my_entry]/links/ext_link/@units"] = "eV"
+    data["/ENTRY[my_entry]/links/ext_link/@long_name"] = "counts"
+    nxdl_path = os.path.join("tests", "data", "tools", "dataconverter", "NXtest.nxdl.xml")
+    output_path = os.path.join(tmp_path, "test.nxs")
+
+    # the source is open for reading, so it couldn't be opened for writing as well
+    with h5py.File(source_path, "r") as source, caplog.at_level("WARNING"):
+        Writer(data, nxdl_path, output_path).write()
+        assert not source["data"].attrs.keys()
+    assert "The units of /ENTRY[my_entry]/links/ext_link are not written" in caplog.text
+    assert "The attribute /ENTRY[my_entry]/links/ext_link/@long_name is not" in caplog.text
+    with h5py.File(output_path, "r") as test_nxs:
+        assert test_nxs["/my_entry/links/ext_link"][2] == 2
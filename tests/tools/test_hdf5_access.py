@@ -0,0 +1,59 @@
+#
+# Copyright The NOMAD Authors.
+#
+# This file is part of NOMAD. See https://nomad-lab.eu for further info.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+"""Test cases for the shared HDF5 access properties."""
+
+import os
+
+import numpy as np
+import pytest
+
+from nexusparser.tools import hdf5_access
+
+
+@pytest.fixture(autouse=True)
+def reset_access_config():
+    """Unsets the properties set from Python after each test"""
+    yield
+    hdf5_access.set_access_config(**{name: None for name in hdf5_access.ACCESS_PROPERTIES})
+
+
+def test_access_config(monkeypatch):
+    """Properties come from the environment, properties set from Python take precedence"""
+    monkeypatch.setenv('NEXUS_HDF5_RDCC_NBYTES', '4194304')
+    monkeypatch.setenv('NEXUS_HDF5_RDCC_W0', '0.5')
+    monkeypatch.setenv('NEXUS_HDF5_LIBVER', 'v110,latest')
+    assert hdf5_access.get_access_config() == {'rdcc_nbytes': 4194304, 'rdcc_w0': 0.5,
+                                               'libver': ('v110', 'latest')}
+    hdf5_access.set_access_config(rdcc_nbytes=2 ** 23, driver='core')
+    assert hdf5_access.get_access_config()['rdcc_nbytes'] == 2 ** 23
+    assert hdf5_access.get_access_config()['driver'] == 'core'
+    with pytest.raises(ValueError):
+        hdf5_access.set_access_config(chunk_cache=1)
+
+
+def test_open_file(tmp_path):
+    """Files are written and read with the configured properties"""
+    hdf5_access.set_access_config(rdcc_nbytes=2 ** 24, rdcc_nslots=10007,
+                                  page_buf_size=2 ** 20)
+    file_name = os.path.join(tmp_path, 'paged.h5')
+    with hdf5_access.open_file(file_name, 'w') as h5_file:
+        h5_file['data'] = np.arange(10)
+    with hdf5_access.open_file(file_name) as h5_file:
+        assert h5_file.id.get_access_plist().get_cache()[1:3] == (10007, 2 ** 24)
+        assert h5_file['data'][3] == 3
+    assert hdf5_access.get_file_access_plist().get_cache()[1:3] == (10007, 2 ** 24)